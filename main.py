@@ -1,5 +1,6 @@
 import os
 import base64
+import contextlib
 import streamlit as st
 import pandas as pd
 from dotenv import load_dotenv
@@ -7,14 +8,13 @@ from dotenv import load_dotenv
 # Cargar variables de entorno al inicio
 load_dotenv(os.path.join("config", ".env"))
 
-# Importación de módulos propios
+# Importación de módulos propios. Solo los de la primera pintada: los de análisis
+# (ee, rasterio, geopandas, GBIF) y reportes (matplotlib, contextily, docx) se
+# importan cuando corre su etapa. Ver src/startup_benchmark.py.
 from src.polygons.polygon_module import show_polygon_section
-from src.analysis.extract_raster import extract_forest_info
-from src.analysis.extract_vector import extract_vector_info
-from src.analysis.biodiversity import fetch_biodiversity_data
-from src.analysis.satellite_fetch import analyze_biomass_agbd, analyze_canopy_height
-from src.reports.generate_reports import generate_docx_report
 from src.chatbot.main_chatbot import show_chatbot_interface
+from src.analysis import notify
+from src.analysis.diagnostic import new_context
 
 # ===================== CONFIGURACIÓN DE PÁGINA =====================
 st.set_page_config(
@@ -26,18 +26,22 @@ st.set_page_config(
 
 # ===================== GESTIÓN DE ESTADO =====================
 if 'analysis_context' not in st.session_state:
-    st.session_state['analysis_context'] = {
-        'geometry': None,        
-        'raster_data': None,     
-        'vector_data': {}, 
-        'location_info': {},
-        'biodiversity_data': None, # Datos GBIF
-        'satellite_data': {},      # Datos GEE (Biomasa/Altura)
-        'processed': False       
-    }
+    st.session_state['analysis_context'] = new_context()
+
+# Avisos de los módulos de análisis (notify) pintados con Streamlit
+notify.set_handler(lambda level, message: {'error': st.error, 'warning': st.warning}.get(level, st.info)(message))
 
 if 'polygon' in st.session_state:
-    st.session_state['analysis_context']['geometry'] = st.session_state['polygon']
+    if st.session_state['analysis_context']['geometry'] is not st.session_state['polygon']:
+        # Polígono ya analizado (en esta u otra sesión): se restaura sin repetir consultas
+        from src.analysis.context_store import load_context
+        try:
+            restaurado = load_context(st.session_state['polygon'])
+        except Exception as e:
+            restaurado = None
+            print(f"⚠️ Contextos guardados no disponibles: {e}")
+        # Sin diagnóstico guardado se empieza de cero: nada del polígono anterior queda a la vista
+        st.session_state['analysis_context'] = restaurado or new_context(st.session_state['polygon'])
 
 # ===================== ESTILOS =====================
 def load_css(file_path="static/css/style.css"):
@@ -114,54 +118,54 @@ with tab2:
     if geo:
         if st.button("🚀 Ejecutar Diagnóstico Completo", type="primary", use_container_width=True):
             with st.status("Procesando territorio...", expanded=True) as status:
-                
-                # 1. RASTER (IDEAM)
-                st.write("🌲 Consultando Bosques (IDEAM)...")
-                try:
-                    st.session_state['analysis_context']['raster_data'] = extract_forest_info(geo)
-                except Exception as e: st.error(f"Error Raster: {e}")
-
-                # 2. VECTORES (SIPRA)
-                st.write("🚜 Cruzando Capas Legales (SIPRA)...")
-                capas = [('frontera_agricola_jun2025', 'Frontera Agrícola'),
-                         ('runap__registro_unico_nacional_ap', 'Áreas Protegidas'),
-                         ('consejos_comunitarios', 'Consejos Comunitarios'),
-                         ('ley_70_1993', 'Ley 70'),
-                         ('zonas_de_reserva_campesina', 'Reservas Campesinas'),
-                         ('centro_poblado', 'Centros Poblados')]
-                res_vect, loc_info = {}, {}
-                for lid, tit in capas:
-                    try:
-                        df, meta = extract_vector_info(geo, layer_name=lid)
-                        if not df.empty: res_vect[tit] = df
-                        if meta: loc_info.update(meta)
-                    except: pass
-                st.session_state['analysis_context']['vector_data'] = res_vect
-                st.session_state['analysis_context']['location_info'] = loc_info
-
-                # 3. BIODIVERSIDAD (GBIF)
-                st.write("🐸 Consultando Biodiversidad (GBIF)...")
-                try:
-                    st.session_state['analysis_context']['biodiversity_data'] = fetch_biodiversity_data(geo)
-                except Exception as e: st.error(f"Error GBIF: {e}")
+                from src.analysis.pipeline import run_pipeline, DONE
+                from src.analysis.diagnostic import diagnostic_stages, reset_stage_outputs, STAGE_LABELS
+                from src.analysis.tracing import start_trace
+                from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-                # 4. SATELITES (GEE)
-                st.write("🛰️ Analizando Imágenes Satelitales (GEE)...")
-                try:
-                    tile_bio, stat_bio, _ = analyze_biomass_agbd(geo)
-                    tile_can, stat_can, _ = analyze_canopy_height(geo)
-                    st.session_state['analysis_context']['satellite_data'] = {
-                        'biomass': {'tile': tile_bio, 'stats': stat_bio},
-                        'canopy': {'tile': tile_can, 'stats': stat_can}
-                    }
-                except Exception as e: st.error(f"Error Satélite: {e}")
+                # Las cuatro etapas corren en paralelo; cada resultado entra al contexto al terminar
+                script_ctx = get_script_run_ctx()
+                st.write("⏳ Consultando IDEAM, SIPRA, GBIF y GEE en paralelo...")
+                fallidas = 0
+                etapas = diagnostic_stages()
+                reset_stage_outputs(st.session_state['analysis_context'], etapas)
+                # closing: si Streamlit corta la ejecución (rerun), el pipeline se cierra
+                # y abandona sus etapas de inmediato, sin esperar al recolector de basura
+                with start_trace("diagnostico") as traza, contextlib.closing(run_pipeline(
+                    etapas, st.session_state['analysis_context'],
+                    thread_initializer=lambda: add_script_run_ctx(ctx=script_ctx)
+                )) as eventos:
+                    for ev in eventos:
+                        etiqueta = STAGE_LABELS.get(ev['stage'], ev['stage'])
+                        if ev['status'] != DONE:
+                            fallidas += 1
+                            st.error(f"{etiqueta}: {ev['status']} ({ev['error']})")
+                            continue
+                        st.write(f"✅ {etiqueta} ({ev['elapsed_s']:.1f} s)")
+                        for aviso in ev['outputs'].get('avisos', []):
+                            st.warning(f"⚠️ {aviso}")
+                        for nota in ev['outputs'].get('notas', []):
+                            st.caption(nota)
+                st.session_state['ultima_traza'] = {
+                    'dict': traza.to_dict(), 'json': traza.to_json(), 'chrome': traza.to_chrome_trace()
+                }
 
                 st.session_state['analysis_context']['processed'] = True
+                st.session_state['analysis_context'].pop('restored_from', None)
+                # Solo diagnósticos completos se guardan para otras sesiones
+                if not fallidas:
+                    from src.analysis.context_store import save_context
+                    try:
+                        save_context(st.session_state['analysis_context'])
+                    except Exception as e:
+                        st.caption(f"⚠️ No se guardó el diagnóstico: {e}")
                 status.update(label="¡Diagnóstico Finalizado!", state="complete", expanded=False)
 
         # --- RESULTADOS ---
         if st.session_state['analysis_context']['processed']:
             st.divider()
+            if st.session_state['analysis_context'].get('restored_from'):
+                st.info("💾 Resultados restaurados de un diagnóstico anterior de este polígono.")
             
             # HEADER UBICACIÓN
             loc = st.session_state['analysis_context']['location_info']
@@ -233,6 +237,7 @@ with tab2:
             
             with col_d2:
                 try:
+                    from src.reports.generate_reports import generate_docx_report
                     docx_file = generate_docx_report(st.session_state['analysis_context'])
                     st.download_button(
                         label="📄 Descargar Bitácora (.docx)",
@@ -266,5 +271,22 @@ with tab4:
         with c:
             st.markdown(f"""<div class="card"><h1>{em}</h1><h3>{nom}</h3><p>{rol}</p><small>{mail}</small></div>""", unsafe_allow_html=True)
 
+# ===================== PANEL DE RENDIMIENTO =====================
+with st.sidebar:
+    if 'ultima_traza' in st.session_state and st.toggle("⏱️ Rendimiento del último diagnóstico"):
+        from src.analysis.tracing import summarize
+        traza = st.session_state['ultima_traza']['dict']
+        st.metric("Duración total", f"{traza['duration_s']:.2f} s")
+        if traza['rss_max_mb']:
+            st.caption(f"🧠 Memoria máxima del proceso: {traza['rss_max_mb']:.0f} MB")
+        desglose = pd.DataFrame(summarize(traza))
+        st.dataframe(desglose.round(3), use_container_width=True, hide_index=True)
+        if traza['counters']:
+            st.json(traza['counters'])
+        st.download_button("📥 Traza (JSON)", st.session_state['ultima_traza']['json'],
+                           file_name="traza_diagnostico.json", mime="application/json")
+        st.download_button("📥 Traza (Chrome trace)", st.session_state['ultima_traza']['chrome'],
+                           file_name="traza_diagnostico.trace.json", mime="application/json")
+
 # FOOTER
 st.markdown('<div class="footer"><p>© 2025 Datos al Ecosistema • Sistema para la Comisión Corográfica XXI</p></div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""
+Localizador de municipio/departamento con un índice compacto de límites DANE (MGN).
+
+Antes la ubicación salía como efecto secundario del cruce con la Frontera Agrícola
+(y fallaba donde esa capa no tiene features). Este módulo usa los límites
+municipales del Marco Geoestadístico Nacional, simplificados como cobertura
+(sin huecos ni traslapes entre vecinos), en EQUAL_AREA_CRS y con un STRtree en
+memoria. Sirve para cualquier polígono en Colombia y responde en milisegundos.
+
+Uso (paso offline):
+    python -m src.analysis.admin_locator --source data/raw/MGN/MGN_MPIO_POLITICO.shp
+"""
+import argparse
+import threading
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from src.analysis.extract_vector import PROJECT_ROOT, EQUAL_AREA_CRS
+from src.analysis.tracing import traced
+
+MGN_PATH = PROJECT_ROOT / "data" / "raw" / "MGN" / "MGN_MPIO_POLITICO.shp"
+ADMIN_INDEX_PATH = PROJECT_ROOT / "data" / "processed" / "admin_index.parquet"
+
+# Columnas del MGN (DANE) -> nombres usados en location_info
+MGN_COLUMNS = {
+    'MPIO_CNMBR': 'municipio',
+    'DPTO_CNMBR': 'departamento',
+    'MPIO_CDPMP': 'codigo_dane'
+}
+
+# Tolerancia de simplificación del índice (metros): suficiente para ubicar, no para medir
+INDEX_TOLERANCE_M = 50
+
+_INDEX = {}
+_LOCK = threading.Lock()
+
+# ===================== CONSTRUCCIÓN (OFFLINE) =====================
+def build_admin_index(source=MGN_PATH, output=ADMIN_INDEX_PATH, tolerance=INDEX_TOLERANCE_M):
+    """Genera el índice compacto de municipios a partir del MGN."""
+    gdf = gpd.read_file(source, columns=list(MGN_COLUMNS))
+    gdf = gdf.rename(columns=MGN_COLUMNS).to_crs(EQUAL_AREA_CRS)
+
+    # Simplificación de cobertura: los bordes compartidos se simplifican igual en ambos lados
+    geoms = shapely.coverage_simplify(shapely.make_valid(gdf.geometry.to_numpy()), tolerance)
+    gdf = gdf.set_geometry(shapely.set_precision(geoms, 1.0))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    gdf.to_parquet(output, compression='zstd')
+    print(f"✅ Índice administrativo: {len(gdf)} municipios -> {output}")
+    return output
+
+# ===================== CARGA =====================
+def _load_index():
+    """Carga el índice una vez por proceso. Retorna None si no se ha construido."""
+    with _LOCK:
+        if 'gdf' not in _INDEX:
+            if not ADMIN_INDEX_PATH.exists():
+                return None
+            gdf = gpd.read_parquet(ADMIN_INDEX_PATH)
+            _INDEX['gdf'] = gdf
+            _INDEX['tree'] = shapely.STRtree(gdf.geometry.to_numpy())
+    return _INDEX
+
+# ===================== CONSULTA =====================
+def locate_polygon(polygon):
+    """
+    Municipios que intersectan el polígono con su participación en el área.
+    Returns:
+        pd.DataFrame: municipio, departamento, codigo_dane, area_ha, participacion (%)
+            ordenado por área descendente. Vacío si no hay índice o no intersecta.
+    """
+    index = _load_index()
+    if index is None:
+        print(f"Índice administrativo no encontrado: {ADMIN_INDEX_PATH}")
+        return pd.DataFrame()
+
+    geom = gpd.GeoSeries([polygon], crs="EPSG:4326").to_crs(EQUAL_AREA_CRS).iloc[0]
+    idx = index['tree'].query(geom, predicate='intersects')
+    if len(idx) == 0:
+        return pd.DataFrame()
+
+    areas = shapely.area(shapely.intersection(index['gdf'].geometry.to_numpy()[idx], geom)) / 10000
+    df = pd.DataFrame(index['gdf'].iloc[idx].drop(columns='geometry')).reset_index(drop=True)
+    df['area_ha'] = np.round(areas, 2)
+    df['participacion'] = np.round(areas / (geom.area / 10000) * 100, 2)
+    df = df[df['area_ha'] > 0]
+    return df.sort_values(by='area_ha', ascending=False).reset_index(drop=True)
+
+@traced()
+def locate_admin(polygon):
+    """
+    Ubicación principal del polígono en el formato de `location_info`.
+    Returns:
+        dict: {'municipio', 'departamento', 'codigo_dane', 'participacion'} o {}.
+    """
+    df = locate_polygon(polygon)
+    if df.empty:
+        return {}
+    top = df.iloc[[0]].to_dict('records')[0]
+    return {col: top[col] for col in ['municipio', 'departamento', 'codigo_dane', 'participacion'] if col in top}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye el índice de límites municipales (DANE MGN).")
+    parser.add_argument("--source", default=MGN_PATH, help="Shapefile/GPKG de municipios del MGN")
+    parser.add_argument("--tolerance", type=float, default=INDEX_TOLERANCE_M, help="Tolerancia de simplificación (m)")
+    args = parser.parse_args()
+    build_admin_index(args.source, ADMIN_INDEX_PATH, args.tolerance)
@@ -1,10 +1,11 @@
 import pandas as pd
 import geopandas as gpd
-from shapely.ops import orient
-from shapely.geometry import Polygon, MultiPolygon
-from pygbif import occurrences
-import concurrent.futures
-import streamlit as st
+import shapely
+from shapely.geometry import Polygon, MultiPolygon, box
+from src.apis.gbif_client import fetch_species_by_group
+from src.analysis.gbif_store import has_local_store, store_version, count_species_local
+from src.analysis.result_cache import persistent_cache
+from src.analysis.tracing import traced
 
 # IDs taxonómicos fijos de GBIF para ahorrar tiempo de consulta
 TAXON_GROUPS = {
@@ -16,48 +17,141 @@ TAXON_GROUPS = {
     "Mariposas": 797
 }
 
-def _fetch_group_count(group_name, taxon_key, wkt_geometry):
-    """Consulta un grupo específico en hilo separado."""
-    try:
-        res = occurrences.search(
-            geometry=wkt_geometry,
-            taxonKey=taxon_key,
-            hasCoordinate=True,
-            limit=0,              # Solo metadatos, no descargas
-            facet='speciesKey',   # Contar especies únicas
-            facetLimit=1000
-        )
-        # Extraer conteo de la faceta
-        riqueza = len(res.get('facets', [])[0]['counts']) if res.get('facets') else 0
-        return group_name, riqueza
-    except:
-        return group_name, 0
-
-def fetch_biodiversity_data(polygon):
-    """Orquesta la consulta paralela a GBIF."""
+# Límites por solicitud a GBIF: vértices (largo de la URL) y área en grados² (tiempo de respuesta)
+MAX_TILE_VERTICES = 150
+MAX_TILE_AREA_DEG2 = 4.0
+# Tolerancia de simplificación como fracción del lado mayor del bbox (~10 cm en un
+# predio de 1 km, ~30 m en un departamento); solo si el polígono pasa MAX_TILE_VERTICES
+SIMPLIFY_FRACTION = 1e-4
+# Teselas con un lado menor que esto (grados) ya no se parten
+MIN_TILE_SIDE_DEG = 1e-6
+# Decimales del WKT (~10 cm)
+WKT_PRECISION = 6
+
+def _polygonal(geom):
+    """Solo las partes poligonales (el recorte puede dejar líneas o puntos en el corte)."""
+    parts = []
+    for part in shapely.get_parts(geom):
+        if part.geom_type == 'Polygon' and not part.is_empty:
+            parts.append(part)
+        elif part.geom_type in ('MultiPolygon', 'GeometryCollection'):
+            parts.extend(_polygonal(part).geoms)
+    return MultiPolygon(parts)
+
+def _simplify_for_gbif(geom, max_vertices=MAX_TILE_VERTICES):
+    """
+    Simplifica solo si el polígono pasa de `max_vertices`, con tolerancia proporcional
+    a su tamaño; los predios bajo el límite se consultan tal cual (conteo exacto).
+    """
+    if shapely.get_num_coordinates(geom) <= max_vertices:
+        return geom
+    minx, miny, maxx, maxy = geom.bounds
+    return geom.simplify(SIMPLIFY_FRACTION * max(maxx - minx, maxy - miny), preserve_topology=True)
+
+def _coverage_loss(geom, simple):
+    """Fracción del área que cambia al simplificar (diferencia simétrica / área original)."""
+    if simple is geom or geom.area == 0:
+        return 0.0
+    return float(geom.symmetric_difference(simple).area / geom.area)
+
+def _halve(geom):
+    """Parte el polígono a la mitad del bbox por su lado más largo."""
+    minx, miny, maxx, maxy = geom.bounds
+    if maxx - minx >= maxy - miny:
+        mid = (minx + maxx) / 2
+        halves = [box(minx, miny, mid, maxy), box(mid, miny, maxx, maxy)]
+    else:
+        mid = (miny + maxy) / 2
+        halves = [box(minx, miny, maxx, mid), box(minx, mid, maxx, maxy)]
+    pieces = [_polygonal(geom.intersection(half)) for half in halves]
+    return [piece for piece in pieces if not piece.is_empty]
+
+def _split_for_gbif(geom, max_vertices=MAX_TILE_VERTICES, max_area=MAX_TILE_AREA_DEG2):
+    """
+    Divide el polígono en teselas que respeten los límites de vértices y área,
+    partiendo el bbox a la mitad por su lado más largo hasta que todas quepan.
+    La unión de las teselas es exactamente el polígono recibido; el número de
+    teselas no tiene tope (las consultas las reparte el cliente GBIF con su
+    concurrencia y limitación de tasa).
+    """
+    pending, tiles = [geom], []
+    while pending:
+        tile = pending.pop()
+        minx, miny, maxx, maxy = tile.bounds
+        fits = shapely.get_num_coordinates(tile) <= max_vertices and tile.area <= max_area
+        if fits or max(maxx - minx, maxy - miny) < MIN_TILE_SIDE_DEG:
+            tiles.append(tile)
+            continue
+        halves = _halve(tile)
+        if len(halves) < 2:
+            tiles.append(tile)
+            continue
+        pending.extend(halves)
+    return tiles
+
+def _tile_wkt(tile):
+    """WKT con anillos exteriores antihorarios (obligatorio para GBIF)."""
+    if isinstance(tile, MultiPolygon) and len(tile.geoms) == 1:
+        tile = tile.geoms[0]
+    return shapely.to_wkt(shapely.orient_polygons(tile), rounding_precision=WKT_PRECISION, trim=True)
+
+def _gbif_version(params):
+    """Versión de la fuente efectiva: la descarga local ingresada o la API en línea."""
+    source = params['source']
+    if source == 'auto':
+        source = 'local' if has_local_store() else 'api'
+    return store_version() if source == 'local' else 'api'
+
+@traced()
+@persistent_cache(
+    'gbif', dataset='occurrence/speciesKey', version=_gbif_version,
+    cache_if=lambda df: not df.empty and not df.attrs.get('parciales')
+)
+def fetch_biodiversity_data(polygon, source='auto'):
+    """
+    Orquesta la consulta paralela a GBIF.
+    source: 'api' (consulta en línea), 'local' (almacén de ocurrencias, ver gbif_store.py)
+    o 'auto' (local si ya se ingresó una descarga, si no la API).
+    La fuente usada queda en df.attrs['fuente'] y los grupos con conteo incompleto
+    (error de la API a mitad de la paginación) en df.attrs['parciales'] = {grupo: error}.
+    Con la API, df.attrs['teselas'] es el número de teselas y df.attrs['perdida_simplificacion']
+    la fracción del área alterada al simplificar (0.0 si el polígono no se simplificó).
+    """
     if not isinstance(polygon, (Polygon, MultiPolygon)):
         return pd.DataFrame()
 
-    # 1. Preparar Geometría (WKT + Orientación)
+    if source == 'auto':
+        source = 'local' if has_local_store() else 'api'
+
+    if source == 'local':
+        results = count_species_local(polygon, TAXON_GROUPS)
+        return _to_dataframe(results, 'local')
+
+    # 1. Preparar Geometría (teselas acotadas en vértices y área, WKT antihorario)
     try:
-        geom_simple = polygon.simplify(0.001, preserve_topology=True)
-        geom_oriented = orient(geom_simple, sign=1.0) # Anti-horario obligatorio
-        wkt = geom_oriented.wkt
+        simple = _simplify_for_gbif(polygon)
+        loss = _coverage_loss(polygon, simple)
+        wkts = [_tile_wkt(tile) for tile in _split_for_gbif(simple)]
     except Exception as e:
         print(f"Error geometría GBIF: {e}")
         return pd.DataFrame()
 
-    # 2. Multithreading para velocidad
-    results = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-        future_to_group = {
-            executor.submit(_fetch_group_count, name, key, wkt): name 
-            for name, key in TAXON_GROUPS.items()
-        }
-        for future in concurrent.futures.as_completed(future_to_group):
-            name, count = future.result()
-            results[name] = count
+    # 2. Consultas concurrentes (grupo x tesela) en una sola sesión; las especies se unen por grupo
+    species = fetch_species_by_group(TAXON_GROUPS, wkts)
+    results = {name: len(res['especies']) for name, res in species.items()}
+    parciales = {name: res['error'] for name, res in species.items() if not res['completo']}
+    if parciales:
+        print(f"⚠️ Conteo GBIF parcial en: {', '.join(parciales)}")
 
     # 3. DataFrame Final
+    df = _to_dataframe(results, 'api')
+    df.attrs['parciales'] = parciales
+    df.attrs['teselas'] = len(wkts)
+    df.attrs['perdida_simplificacion'] = loss
+    return df
+
+def _to_dataframe(results, fuente):
     df = pd.DataFrame(list(results.items()), columns=['Grupo', 'Especies (GBIF)'])
-    return df.sort_values(by='Especies (GBIF)', ascending=False).reset_index(drop=True)
\ No newline at end of file
+    df = df.sort_values(by='Especies (GBIF)', ascending=False).reset_index(drop=True)
+    df.attrs['fuente'] = fuente
+    return df
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Conversión de biomasa aérea a carbono y CO2 equivalente.
+
+Compartido por los backends de datos satelitales (Earth Engine y rasters
+locales) para que ambos reporten las mismas cifras con la misma escala,
+percentiles y paletas.
+"""
+
+# Percentiles reportados junto a media y desviación estándar
+STATS_PERCENTILES = [10, 50, 90]
+# Escala de las estadísticas: 100 m para velocidad y para no quedar "Sin datos"
+STATS_SCALE_M = 100
+# Versión del cálculo (bandas + escala); cambiarla invalida los resultados guardados
+SATELLITE_VERSION = 'agbd-height-100m'
+
+BIOMASS_VIS = {
+    'min': 0,
+    'max': 150,
+    'palette': ['ffffe5', 'f7fcb9', 'addd8e', '41ab5d', '238443', '005a32']
+}
+CANOPY_VIS = {
+    'min': 0,
+    'max': 25,
+    'palette': ['f7fcf5', '#caeac3', '#7bc77c', '#2a924a', '#00441b']
+}
+
+# Aprox. 50% de la biomasa seca es carbono
+CARBON_FRACTION = 0.5
+# Factor de conversión C -> CO2e (44/12)
+CO2_PER_CARBON = 3.67
+
+def biomass_stats(mean_agbd, area_ha, std_agbd=None, percentiles=None):
+    """
+    Diccionario de estadísticas de biomasa en el formato de `satellite_data`.
+    Args:
+        mean_agbd (float): Densidad media de biomasa aérea (Mg/ha); None = sin datos.
+        area_ha (float): Área del polígono (ha).
+        std_agbd (float): Desviación estándar de la densidad (Mg/ha), opcional.
+        percentiles (dict): {percentil: valor (Mg/ha)}, opcional.
+    """
+    mean_agbd = mean_agbd or 0
+    total_biomass = mean_agbd * area_ha
+    total_carbon = total_biomass * CARBON_FRACTION
+    total_co2 = total_carbon * CO2_PER_CARBON
+
+    stats = {"Media (Mg/ha)": round(mean_agbd, 2)}
+    if std_agbd is not None:
+        stats["Desv. Estándar (Mg/ha)"] = round(std_agbd, 2)
+    for p, value in (percentiles or {}).items():
+        if value is not None:
+            stats[f"P{p} (Mg/ha)"] = round(value, 2)
+    stats.update({
+        "Biomasa Total (Mg)": round(total_biomass, 2),
+        "Carbono (Mg)": round(total_carbon, 2),
+        "Captura Potencial CO2 (Mg)": round(total_co2, 2)
+    })
+    return stats
+
+def canopy_stats(mean_height, std_height=None, percentiles=None):
+    """Diccionario de estadísticas de altura del dosel en el formato de `satellite_data`."""
+    stats = {"Promedio (m)": round(mean_height or 0, 2)}
+    if std_height is not None:
+        stats["Desv. Estándar (m)"] = round(std_height, 2)
+    for p, value in (percentiles or {}).items():
+        if value is not None:
+            stats[f"P{p} (m)"] = round(value, 2)
+    return stats
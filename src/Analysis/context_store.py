@@ -0,0 +1,163 @@
+"""
+Contextos de análisis completos guardados en disco por geometría y versión de fuentes.
+
+`analysis_context` vive en la memoria de una sesión: recargar la página o abrir
+el mismo predio desde otra sesión repetía todas las consultas externas. Aquí el
+contexto terminado se guarda bajo la huella canónica de la geometría (la misma
+de result_cache) y un hash de las versiones de las fuentes (raster IDEAM, capas
+SIPRA, índice DANE, descarga GBIF, cálculo GEE). Las tablas se guardan en
+Parquet y el resto (ubicación, estadísticas satelitales, attrs) en meta.json:
+
+    data/cache/contextos/<huella[:2]>/<huella>/<hash de versiones>/
+
+Si una fuente cambia, el hash ya no coincide y la entrada se ignora; al guardar
+la nueva se borran las versiones anteriores de esa geometría. Las entradas
+vencen con el TTL de GBIF y las URLs de teselas de GEE con el suyo.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import pandas as pd
+import shapely
+from src.analysis.result_cache import PROJECT_ROOT, CACHE_TTL_S, geometry_fingerprint
+from src.analysis.biomass_co2 import SATELLITE_VERSION
+
+CONTEXT_DIR = PROJECT_ROOT / "data" / "cache" / "contextos"
+
+# Vigencia de un contexto (lo más volátil son los conteos de GBIF en línea)
+CONTEXT_TTL_S = CACHE_TTL_S['gbif']
+# Las URLs de getMapId expiran antes; pasado este tiempo se restauran sin tesela
+TILE_TTL_S = CACHE_TTL_S['gee']
+
+META_NAME = "meta.json"
+
+# ===================== VERSIONES =====================
+def _mtime(path):
+    return path.stat().st_mtime if path.exists() else None
+
+def source_versions():
+    """Versiones de las fuentes del diagnóstico; si alguna cambia, lo guardado deja de valer."""
+    from src.analysis.extract_raster import RASTER_PATH
+    from src.analysis.extract_vector import LEGAL_LAYERS, _layer_version
+    from src.analysis.admin_locator import ADMIN_INDEX_PATH
+    from src.analysis.biodiversity import _gbif_version
+    return {
+        'ideam': _mtime(RASTER_PATH),
+        'sipra': {layer: _layer_version(layer) for layer, _ in LEGAL_LAYERS},
+        'dane': _mtime(ADMIN_INDEX_PATH),
+        'gbif': _gbif_version({'source': 'auto'}),
+        # Mismo valor por defecto que satellite_fetch.SATELLITE_BACKEND (sin importar ee)
+        'gee': {'calculo': SATELLITE_VERSION, 'backend': os.getenv("SATELLITE_BACKEND", "auto")}
+    }
+
+def _versions_hash(versions):
+    return hashlib.sha256(json.dumps(versions, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _entry_dir(geometry, versions, root=None):
+    fingerprint = geometry_fingerprint(geometry)
+    return (root or CONTEXT_DIR) / fingerprint[:2] / fingerprint / _versions_hash(versions)
+
+# ===================== GUARDAR =====================
+def _write_table(entry, name, df):
+    df.to_parquet(entry / f"{name}.parquet", index=False)
+    return {'file': f"{name}.parquet", 'attrs': df.attrs}
+
+def save_context(context, versions=None, root=None):
+    """
+    Guarda un contexto procesado (escritura atómica: directorio temporal + rename).
+    Returns:
+        Path: Directorio de la entrada.
+    """
+    geometry = context['geometry']
+    versions = versions if versions is not None else source_versions()
+    entry = _entry_dir(geometry, versions, root)
+    tmp = entry.with_name(f"{entry.name}.tmp{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    tables = {}
+    for key in ('raster_data', 'biodiversity_data'):
+        df = context.get(key)
+        if isinstance(df, pd.DataFrame):
+            tables[key] = _write_table(tmp, key, df)
+    vector_tables = [
+        {'titulo': titulo, **_write_table(tmp, f"vector_{i:02d}", df)}
+        for i, (titulo, df) in enumerate((context.get('vector_data') or {}).items())
+    ]
+    meta = {
+        'created': time.time(),
+        'versions': versions,
+        'geometry_wkb': shapely.to_wkb(geometry, hex=True),
+        'location_info': context.get('location_info') or {},
+        'satellite_data': context.get('satellite_data') or {},
+        'tables': tables,
+        'vector_tables': vector_tables
+    }
+    (tmp / META_NAME).write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding='utf-8')
+
+    # Reemplaza la entrada y borra versiones anteriores de la misma geometría
+    for old in entry.parent.iterdir():
+        if old != tmp and not old.name.startswith(f"{entry.name}.tmp"):
+            shutil.rmtree(old, ignore_errors=True)
+    os.replace(tmp, entry)
+    return entry
+
+# ===================== RESTAURAR =====================
+def _read_table(entry, info):
+    df = pd.read_parquet(entry / info['file'])
+    df.attrs = info.get('attrs') or {}
+    return df
+
+def load_context(geometry, versions=None, root=None):
+    """
+    Contexto guardado para la geometría con las versiones actuales de las fuentes.
+    Returns:
+        dict | None: Contexto listo para `analysis_context` (processed=True) o None.
+    """
+    versions = versions if versions is not None else source_versions()
+    entry = _entry_dir(geometry, versions, root)
+    meta_path = entry / META_NAME
+    if not meta_path.exists():
+        return None
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        age = time.time() - meta['created']
+        if age > CONTEXT_TTL_S:
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        tables = {key: _read_table(entry, info) for key, info in meta['tables'].items()}
+        satellite = meta['satellite_data']
+        if age > TILE_TTL_S:
+            satellite = {name: {**layer, 'tile': None} for name, layer in satellite.items()}
+        return {
+            'geometry': geometry,
+            'raster_data': tables.get('raster_data'),
+            'vector_data': {t['titulo']: _read_table(entry, t) for t in meta['vector_tables']},
+            'location_info': meta['location_info'],
+            'biodiversity_data': tables.get('biodiversity_data'),
+            'satellite_data': satellite,
+            'processed': True,
+            'restored_from': str(entry)
+        }
+    except Exception as e:
+        print(f"⚠️ No se pudo restaurar el contexto guardado ({entry.name}): {e}")
+        return None
+
+def purge(root=None):
+    """Borra entradas vencidas y directorios temporales huérfanos. Retorna cuántas borró."""
+    root = root or CONTEXT_DIR
+    removed = 0
+    now = time.time()
+    for meta_path in list(root.glob(f"*/*/*/{META_NAME}")):
+        entry = meta_path.parent
+        try:
+            expired = now - json.loads(meta_path.read_text(encoding='utf-8'))['created'] > CONTEXT_TTL_S
+        except Exception:
+            expired = True
+        if expired or ".tmp" in entry.name:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,146 @@
+"""
+Etapas del "Diagnóstico Completo" (IDEAM, SIPRA, GBIF y GEE) para el pipeline.
+
+Las cuatro consultas son independientes: todas leen 'geometry' y escriben su
+propia clave de `analysis_context`, así que corren en paralelo y el diagnóstico
+tarda lo que la más lenta. Cada función retorna sus salidas más 'avisos' y
+'notas' (mensajes para la interfaz, no se guardan en el contexto); los avisos
+incluyen lo que el módulo emitió con notify. Los módulos de análisis se importan
+dentro de cada etapa para no cargarlos en el arranque.
+
+`run_diagnostic` es la API sin interfaz (CLI, lotes, notebooks):
+    context = run_diagnostic(polygon)
+"""
+import contextlib
+import functools
+import os
+from src.analysis import notify
+from src.analysis.pipeline import Stage, run_pipeline, DONE
+
+# Timeout por etapa (s); configurables por variable de entorno
+STAGE_TIMEOUTS_S = {
+    'raster': float(os.getenv("TIMEOUT_RASTER_S", "120")),
+    'vectores': float(os.getenv("TIMEOUT_VECTORES_S", "180")),
+    'gbif': float(os.getenv("TIMEOUT_GBIF_S", "120")),
+    'satelite': float(os.getenv("TIMEOUT_SATELITE_S", "180"))
+}
+
+STAGE_LABELS = {
+    'raster': "🌲 Bosques (IDEAM)",
+    'vectores': "🚜 Capas Legales (SIPRA)",
+    'gbif': "🐸 Biodiversidad (GBIF)",
+    'satelite': "🛰️ Imágenes Satelitales (GEE)"
+}
+
+# ===================== CONTEXTO =====================
+def new_context(geometry=None):
+    """Contexto de análisis vacío (el `analysis_context` de la app)."""
+    return {
+        'geometry': geometry,
+        'raster_data': None,
+        'vector_data': {},
+        'location_info': {},
+        'biodiversity_data': None, # Datos GBIF
+        'satellite_data': {},      # Datos GEE (Biomasa/Altura)
+        'processed': False
+    }
+
+def reset_stage_outputs(context, stages):
+    """
+    Devuelve las salidas de las etapas a sus valores vacíos antes de correrlas: una
+    etapa que falla o vence no escribe nada, y no debe quedar a la vista el
+    resultado de una corrida anterior (p.ej. de otro polígono).
+    """
+    empty = new_context()
+    for stage in stages:
+        for key in stage.outputs:
+            context[key] = empty.get(key)
+
+# ===================== ETAPAS =====================
+def _with_notices(stage_func):
+    """Agrega a 'avisos' lo que la etapa emitió con notify en su hilo."""
+    @functools.wraps(stage_func)
+    def wrapper(**kwargs):
+        with notify.capture() as mensajes:
+            result = stage_func(**kwargs)
+        result['avisos'] = [message for _, message in mensajes] + result.get('avisos', [])
+        return result
+    return wrapper
+
+@_with_notices
+def _raster_stage(geometry):
+    from src.analysis.extract_raster import extract_forest_info
+    return {'raster_data': extract_forest_info(geometry)}
+
+@_with_notices
+def _vector_stage(geometry):
+    from src.analysis.extract_vector import extract_vector_layers, LEGAL_LAYERS
+    from src.analysis.admin_locator import locate_admin
+
+    res_vect, loc_info, avisos, notas = {}, {}, [], []
+    capas = extract_vector_layers(geometry, LEGAL_LAYERS)
+    for res in capas.values():
+        if res['error']:
+            avisos.append(f"{res['titulo']}: {res['error']}")
+            continue
+        if not res['summary'].empty: res_vect[res['titulo']] = res['summary']
+        if res['metadata']: loc_info.update(res['metadata'])
+    if capas:
+        lenta = max(capas.values(), key=lambda r: r['elapsed_s'])
+        notas.append(f"⏱️ Capa más lenta: {lenta['titulo']} ({lenta['elapsed_s']:.2f} s)")
+    simplificadas = [f"{r['titulo']} ({r['lod_m']} m)" for r in capas.values() if r['lod_m']]
+    if simplificadas:
+        notas.append(f"🗺️ Geometrías simplificadas: {', '.join(simplificadas)}")
+    # Ubicación con el índice DANE (la Frontera Agrícola queda como respaldo)
+    try:
+        loc_info.update(locate_admin(geometry))
+    except Exception as e: avisos.append(f"Ubicación: {e}")
+    return {'vector_data': res_vect, 'location_info': loc_info, 'avisos': avisos, 'notas': notas}
+
+@_with_notices
+def _gbif_stage(geometry):
+    from src.analysis.biodiversity import fetch_biodiversity_data
+    bio_df = fetch_biodiversity_data(geometry)
+    avisos = [f"GBIF {grupo}: conteo parcial ({error})" for grupo, error in bio_df.attrs.get('parciales', {}).items()]
+    return {'biodiversity_data': bio_df, 'avisos': avisos}
+
+@_with_notices
+def _satellite_stage(geometry):
+    from src.analysis.satellite_fetch import analyze_satellite
+    sat_res = analyze_satellite(geometry)
+    tile_bio, stat_bio, _ = sat_res['biomass']
+    tile_can, stat_can, _ = sat_res['canopy']
+    return {'satellite_data': {
+        'biomass': {'tile': tile_bio, 'stats': stat_bio},
+        'canopy': {'tile': tile_can, 'stats': stat_can}
+    }}
+
+def diagnostic_stages(timeouts=None):
+    """Etapas del diagnóstico completo sobre `analysis_context['geometry']`."""
+    timeouts = {**STAGE_TIMEOUTS_S, **(timeouts or {})}
+    return [
+        Stage('raster', _raster_stage, inputs=('geometry',), outputs=('raster_data',), timeout=timeouts['raster']),
+        Stage('vectores', _vector_stage, inputs=('geometry',), outputs=('vector_data', 'location_info'),
+              timeout=timeouts['vectores']),
+        Stage('gbif', _gbif_stage, inputs=('geometry',), outputs=('biodiversity_data',), timeout=timeouts['gbif']),
+        Stage('satelite', _satellite_stage, inputs=('geometry',), outputs=('satellite_data',),
+              timeout=timeouts['satelite'])
+    ]
+
+# ===================== API SIN INTERFAZ =====================
+def run_diagnostic(geometry, timeouts=None, cancel_event=None):
+    """
+    Diagnóstico completo de un polígono sin Streamlit.
+    Returns:
+        dict: Contexto de análisis con, además, 'avisos' (lista de mensajes) y
+            'errores' ({etapa: "estado: error"}) de las etapas que no terminaron.
+    """
+    context = new_context(geometry)
+    avisos, errores = [], {}
+    with contextlib.closing(run_pipeline(diagnostic_stages(timeouts), context, cancel_event=cancel_event)) as events:
+        for event in events:
+            if event['status'] != DONE:
+                errores[event['stage']] = f"{event['status']}: {event['error']}"
+            avisos.extend(event['outputs'].get('avisos', []))
+    context.update({'avisos': avisos, 'errores': errores, 'processed': True})
+    return context
@@ -0,0 +1,198 @@
+"""
+Diagnóstico territorial completo (IDEAM, SIPRA, GBIF, GEE) para miles de polígonos.
+
+Sin Streamlit: cada proceso del pool corre `run_diagnostic` sobre un bloque de
+polígonos (las cuatro etapas en paralelo dentro del proceso). Cada bloque
+terminado se escribe como una parte Parquet en el directorio de salida (con
+escritura atómica). Las partes son el checkpoint: si la corrida se interrumpe,
+al relanzarla se omiten los ids que ya están en alguna parte, así que un corte
+a mitad de escritura nunca deja filas duplicadas.
+
+Uso:
+    python -m src.analysis.diagnostic_batch predios.gpkg --id-col codigo --output data/processed/diagnostico
+    pd.read_parquet("data/processed/diagnostico")   # todas las partes
+"""
+import argparse
+import json
+import math
+import os
+import time
+import concurrent.futures
+import pandas as pd
+import shapely
+from pathlib import Path
+from src.analysis import notify
+from src.apis.gbif_client import set_process_share
+from src.analysis.diagnostic import run_diagnostic
+from src.analysis.forest_batch import read_parcels
+
+PART_PATTERN = "part-*.parquet"
+
+# Columnas de salida (esquema fijo para que todas las partes sean compatibles)
+ROW_COLUMNS = [
+    'id', 'municipio', 'departamento', 'bosque_ha', 'coberturas', 'capas_legales',
+    'especies_total', 'especies', 'biomasa_media_mg_ha', 'biomasa_total_mg', 'carbono_mg',
+    'co2_mg', 'altura_media_m', 'avisos', 'errores', 'segundos'
+]
+
+# ===================== FILAS =====================
+def _records_json(df):
+    return json.dumps(df.to_dict('records') if df is not None and not df.empty else [], ensure_ascii=False, default=str)
+
+def _stat(satellite_data, layer, key):
+    stats = (satellite_data.get(layer) or {}).get('stats') or {}
+    return stats.get(key)
+
+def context_to_row(pid, context, elapsed_s=None):
+    """Fila plana del contexto de un polígono; las tablas quedan como JSON."""
+    raster = context.get('raster_data')
+    bio = context.get('biodiversity_data')
+    sat = context.get('satellite_data') or {}
+    loc = context.get('location_info') or {}
+    bosque = None
+    if raster is not None and not raster.empty:
+        bosque = float(raster[raster['Leyenda'].str.contains("Bosque", case=False)]['Área (ha)'].sum())
+    return {
+        'id': str(pid),
+        'municipio': loc.get('municipio'),
+        'departamento': loc.get('departamento'),
+        'bosque_ha': bosque,
+        'coberturas': _records_json(raster),
+        'capas_legales': json.dumps(
+            {titulo: df.to_dict('records') for titulo, df in (context.get('vector_data') or {}).items()},
+            ensure_ascii=False, default=str
+        ),
+        'especies_total': int(bio['Especies (GBIF)'].sum()) if bio is not None and not bio.empty else None,
+        'especies': _records_json(bio),
+        'biomasa_media_mg_ha': _stat(sat, 'biomass', "Media (Mg/ha)"),
+        'biomasa_total_mg': _stat(sat, 'biomass', "Biomasa Total (Mg)"),
+        'carbono_mg': _stat(sat, 'biomass', "Carbono (Mg)"),
+        'co2_mg': _stat(sat, 'biomass', "Captura Potencial CO2 (Mg)"),
+        'altura_media_m': _stat(sat, 'canopy', "Promedio (m)"),
+        'avisos': "\n".join(context.get('avisos', [])),
+        'errores': json.dumps(context.get('errores', {}), ensure_ascii=False),
+        'segundos': elapsed_s
+    }
+
+def _rows_frame(rows):
+    df = pd.DataFrame(rows, columns=ROW_COLUMNS)
+    for col in ('bosque_ha', 'biomasa_media_mg_ha', 'biomasa_total_mg', 'carbono_mg', 'co2_mg',
+                'altura_media_m', 'segundos'):
+        df[col] = df[col].astype('float64')
+    df['especies_total'] = df['especies_total'].astype('Int64')
+    return df
+
+# ===================== WORKERS =====================
+def _init_worker(n_processes):
+    """
+    Silencia la consola (los avisos de cada etapa ya quedan en la columna 'avisos')
+    y reparte la cuota de GBIF entre los `n_processes` procesos del pool.
+    """
+    notify.set_handler(lambda level, message: None)
+    set_process_share(n_processes)
+
+def _process_chunk(items):
+    """Diagnóstico de un bloque de polígonos: lista de filas (una fila de error si algo falla)."""
+    rows = []
+    for pid, wkb in items:
+        start = time.perf_counter()
+        context = None
+        try:
+            context = run_diagnostic(shapely.from_wkb(wkb))
+            row = context_to_row(pid, context, time.perf_counter() - start)
+        except Exception as e:
+            # Un contexto inesperado no debe abortar la corrida: el error queda en la fila
+            step = 'diagnostico' if context is None else 'fila'
+            row = context_to_row(pid, {'errores': {step: str(e)}}, time.perf_counter() - start)
+        rows.append(row)
+    return rows
+
+# ===================== SALIDA Y CHECKPOINT =====================
+def read_checkpoint(output_dir):
+    """Ids ya escritos en corridas anteriores (columna 'id' de las partes)."""
+    done = set()
+    for path in Path(output_dir).glob(PART_PATTERN):
+        done.update(pd.read_parquet(path, columns=['id'])['id'])
+    return done
+
+def _write_part(output_dir, rows):
+    """Escribe una parte nueva (tmp + rename): la parte aparece completa o no aparece."""
+    output_dir = Path(output_dir)
+    indices = [int(p.stem.split('-')[1]) for p in output_dir.glob(PART_PATTERN)]
+    path = output_dir / f"part-{max(indices, default=-1) + 1:05d}.parquet"
+    tmp = path.with_suffix(".parquet.tmp")
+    _rows_frame(rows).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+# ===================== API =====================
+def run_diagnostic_batch(parcels, output_dir, id_col=None, max_workers=None, chunk_size=None, resume=True):
+    """
+    Diagnóstico completo para muchos polígonos con escritura incremental.
+    Args:
+        parcels (gpd.GeoDataFrame): Polígonos (Polygon/MultiPolygon).
+        output_dir (Path): Directorio de salida (partes Parquet).
+        id_col (str): Columna identificadora; si es None se usa el índice.
+        max_workers (int): Procesos del pool (por defecto, núcleos disponibles).
+        chunk_size (int): Polígonos por parte; por defecto ~4 tareas por worker (máx. 50).
+        resume (bool): Omite los ids ya escritos en las partes; False reinicia la salida.
+    Returns:
+        dict: {'procesados', 'omitidos', 'con_errores', 'partes'}
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Partes a medio escribir de una corrida interrumpida
+    for tmp in output_dir.glob("part-*.parquet.tmp"):
+        tmp.unlink()
+    if not resume:
+        for old in output_dir.glob(PART_PATTERN):
+            old.unlink()
+    done = read_checkpoint(output_dir)
+
+    gdf = parcels if parcels.crs is not None else parcels.set_crs("EPSG:4326")
+    gdf = gdf[gdf.geometry.notna() & gdf.geom_type.isin(['Polygon', 'MultiPolygon'])]
+    ids = (gdf[id_col] if id_col else gdf.index.to_series()).astype(str)
+    geoms = gdf.geometry.to_crs("EPSG:4326")
+    todo = ~ids.isin(done).to_numpy()
+    items = list(zip(ids.to_numpy()[todo], shapely.to_wkb(geoms.to_numpy()[todo])))
+    summary = {'procesados': 0, 'omitidos': len(ids) - len(items), 'con_errores': 0, 'partes': 0}
+    if not items:
+        print(f"✅ Nada pendiente ({summary['omitidos']} ya terminados).")
+        return summary
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(50, math.ceil(len(items) / (max_workers * 4))))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    print(f"🚀 {len(items)} polígonos en {len(chunks)} bloques ({summary['omitidos']} ya terminados)...")
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(max_workers,)
+    ) as executor:
+        futures = [executor.submit(_process_chunk, chunk) for chunk in chunks]
+        for future in concurrent.futures.as_completed(futures):
+            rows = future.result()
+            _write_part(output_dir, rows)
+            summary['procesados'] += len(rows)
+            summary['con_errores'] += sum(row['errores'] != '{}' for row in rows)
+            summary['partes'] += 1
+            print(f"💾 {summary['procesados']}/{len(items)} polígonos")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Diagnóstico territorial completo para un archivo de polígonos.")
+    parser.add_argument("input", type=Path, help="GeoPackage/Shapefile/Parquet de polígonos")
+    parser.add_argument("--layer", default=None, help="Capa dentro del GeoPackage")
+    parser.add_argument("--id-col", default=None, help="Columna identificadora del polígono")
+    parser.add_argument("--workers", type=int, default=None, help="Número de procesos")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Polígonos por parte Parquet")
+    parser.add_argument("--restart", action="store_true", help="Ignora las partes existentes y reescribe la salida")
+    parser.add_argument("--output", type=Path, default=Path("data/processed/diagnostico"))
+    args = parser.parse_args()
+
+    summary = run_diagnostic_batch(
+        read_parcels(args.input, args.layer), args.output, id_col=args.id_col,
+        max_workers=args.workers, chunk_size=args.chunk_size, resume=not args.restart
+    )
+    print(f"✅ {summary['procesados']} procesados, {summary['omitidos']} omitidos, "
+          f"{summary['con_errores']} con errores -> {args.output}")
@@ -1,11 +1,15 @@
+import math
 import numpy as np
 import rasterio
+from rasterio import features, windows
 from rasterio.mask import mask
+import shapely
 import shapely.geometry
 import geopandas as gpd
 import pandas as pd
-import streamlit as st
 from pathlib import Path
+from src.analysis import notify
+from src.analysis.tracing import traced, count
 
 # Diccionario de leyendas del archivo contenido_cambio.txt
 LEYENDAS = {
@@ -19,82 +23,201 @@ LEYENDAS = {
 # Usar Pathlib hace que las rutas sean compatibles entre Windows/Mac/Linux
 RASTER_PATH = Path("data/raw/bosques_IDEAM/superficie_bosques.img")
 
-def extract_forest_info(polygon):
+# Lado mínimo (en píxeles) de cada ventana de lectura en modo streaming.
+# Las ventanas se alinean a los bloques internos del raster, así que la memoria
+# por iteración queda acotada sin importar el tamaño del polígono.
+STREAM_WINDOW_SIZE = 1024
+
+# ===================== UTILIDADES DE LECTURA =====================
+def _polygon_to_raster_crs(polygon, src):
+    """Reproyecta un polígono WGS84 al CRS del raster y retorna la geometría shapely."""
+    polygon_gdf = gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
+    if polygon_gdf.crs != src.crs:
+        polygon_gdf = polygon_gdf.to_crs(src.crs)
+    return polygon_gdf.geometry.iloc[0]
+
+def _window_step(block, min_size):
+    """Múltiplo del bloque interno más cercano a `min_size` (bloques en franja se recortan)."""
+    if block > min_size:
+        return min_size
+    return block * math.ceil(min_size / block)
+
+def _iter_polygon_windows(src, geom, min_size=STREAM_WINDOW_SIZE):
+    """
+    Genera las ventanas del raster, alineadas a sus bloques internos, que
+    intersectan el polígono (ya en el CRS del raster).
+    """
+    win = windows.from_bounds(*geom.bounds, transform=src.transform)
+    row_start = max(int(math.floor(win.row_off)), 0)
+    col_start = max(int(math.floor(win.col_off)), 0)
+    row_stop = min(int(math.ceil(win.row_off + win.height)), src.height)
+    col_stop = min(int(math.ceil(win.col_off + win.width)), src.width)
+    if row_start >= row_stop or col_start >= col_stop:
+        return
+
+    block_h, block_w = src.block_shapes[0]
+    step_h = _window_step(block_h, min_size)
+    step_w = _window_step(block_w, min_size)
+
+    shapely.prepare(geom)
+    for row in range((row_start // step_h) * step_h, row_stop, step_h):
+        r0, r1 = max(row, row_start), min(row + step_h, row_stop)
+        for col in range((col_start // step_w) * step_w, col_stop, step_w):
+            c0, c1 = max(col, col_start), min(col + step_w, col_stop)
+            window = windows.Window(c0, r0, c1 - c0, r1 - r0)
+            # Saltamos ventanas del bbox que no tocan el polígono (p.ej. en polígonos en "L")
+            if not geom.intersects(shapely.box(*windows.bounds(window, src.transform))):
+                continue
+            yield window
+
+def _read_window_values(src, geom, window, nodata):
+    """Lee una ventana y retorna los valores válidos cuyo centro de píxel cae en el polígono."""
+    data = src.read(1, window=window, masked=True)
+    count('pixeles_leidos', data.size)
+    count('bytes_leidos', data.data.nbytes)
+    inside = features.geometry_mask(
+        [geom], out_shape=data.shape, transform=src.window_transform(window), invert=True
+    )
+    values = data.data[inside & ~np.ma.getmaskarray(data)]
+    return values[values != nodata]
+
+def _accumulate_counts(counts, values):
+    """Suma el histograma de `values` (enteros sin signo) al acumulado `counts`."""
+    if values.size == 0:
+        return counts
+    binc = np.bincount(values.ravel())
+    if binc.size > counts.size:
+        counts = np.pad(counts, (0, binc.size - counts.size))
+    counts[:binc.size] += binc
+    return counts
+
+def _counts_to_arrays(counts, dtype):
+    """Convierte el histograma acumulado en el par (códigos, conteos) que da np.unique."""
+    unique = np.flatnonzero(counts)
+    return unique.astype(dtype), counts[unique]
+
+@traced()
+def _zonal_counts(src, geom, windows_iter=None):
+    """
+    Histograma de clases dentro del polígono recorriendo el raster por ventanas.
+    Equivale a `mask(..., crop=True)` + `np.unique`, pero sin materializar el bbox completo.
+    Returns:
+        tuple: (códigos, conteos) ordenados por código.
+    """
+    nodata = src.nodata if src.nodata is not None else 0
+    dtype = np.dtype(src.dtypes[0])
+    windows_iter = windows_iter if windows_iter is not None else _iter_polygon_windows(src, geom)
+
+    # bincount solo aplica a enteros sin signo pequeños (caso de rasters categóricos)
+    if dtype.kind == 'u' and dtype.itemsize <= 2:
+        counts = np.zeros(0, dtype=np.int64)
+        for window in windows_iter:
+            counts = _accumulate_counts(counts, _read_window_values(src, geom, window, nodata))
+        return _counts_to_arrays(counts, dtype)
+
+    totals = {}
+    for window in windows_iter:
+        unique, counts = np.unique(_read_window_values(src, geom, window, nodata), return_counts=True)
+        for val, cnt in zip(unique, counts):
+            totals[val] = totals.get(val, 0) + cnt
+    unique = np.array(sorted(totals), dtype=dtype)
+    return unique, np.array([totals[v] for v in unique], dtype=np.int64)
+
+@traced()
+def _masked_counts(src, geom):
+    """Ruta clásica: recorta el bbox completo en memoria (útil para comparar resultados)."""
+    out_image, _ = mask(src, [geom], crop=True, nodata=src.nodata)
+    count('pixeles_leidos', out_image.size)
+    count('bytes_leidos', out_image.nbytes)
+    out_image = out_image[0] # Banda 1
+    nodata = src.nodata if src.nodata is not None else 0
+    values = out_image[out_image != nodata]
+    return np.unique(values, return_counts=True)
+
+def _counts_to_table(unique, counts, src):
+    """Arma la tabla Código/Leyenda/Conteo/Área/Porcentaje a partir del histograma."""
+    res_x, res_y = src.res
+    pixel_area_m2 = abs(res_x * res_y)
+    areas_m2 = counts * pixel_area_m2
+    areas_ha = areas_m2 / 10000
+
+    total_pixels = counts.sum()
+    percentages = (counts / total_pixels) * 100
+
+    df = pd.DataFrame({
+        'Código': unique,
+        'Leyenda': [LEYENDAS.get(val, f"Clase {val}") for val in unique],
+        'Conteo Píxeles': counts,
+        'Área (ha)': np.round(areas_ha, 2),
+        'Porcentaje (%)': np.round(percentages, 2)
+    })
+
+    # Ordenar por área descendente para mejor visualización
+    return df.sort_values(by='Área (ha)', ascending=False).reset_index(drop=True)
+
+@traced()
+def _polygon_counts(src, geom, mode='auto'):
+    """Elige la estrategia de conteo según `mode` (ver extract_forest_info)."""
+    if mode in ('auto', 'pyramid'):
+        from src.analysis.forest_pyramid import load_forest_pyramid, query_forest_pyramid
+        pyramid = load_forest_pyramid(RASTER_PATH)
+        if pyramid is not None:
+            return query_forest_pyramid(pyramid, src, geom)
+        if mode == 'pyramid':
+            raise FileNotFoundError("No hay pirámide de conteos vigente. Ejecuta `python -m src.analysis.forest_pyramid`.")
+
+    if mode == 'mask':
+        return _masked_counts(src, geom)
+    return _zonal_counts(src, geom)
+
+# ===================== EXTRACCIÓN =====================
+@traced()
+def extract_forest_info(polygon, mode='auto'):
     """
     Extrae información de coberturas boscosas del raster IDEAM dentro del polígono.
     Args:
         polygon (shapely.Geometry): Polygon o MultiPolygon.
+        mode (str): 'auto' usa la pirámide precalculada si existe y está al día,
+            si no recorre por bloques; 'pyramid' exige la pirámide; 'stream'
+            recorre el raster por bloques con memoria acotada; 'mask' recorta el
+            bbox completo en memoria (comportamiento original).
     Returns:
         pd.DataFrame: Tabla con estadísticas.
     """
     # 1. VALIDACIÓN ROBUSTA: Aceptamos Polygon y MultiPolygon
     if not isinstance(polygon, (shapely.geometry.Polygon, shapely.geometry.MultiPolygon)):
-        st.error(f"Geometría no soportada: {type(polygon)}")
+        notify.error(f"Geometría no soportada: {type(polygon)}")
         return pd.DataFrame()
-    
+
     # Verificar si el archivo existe antes de intentar abrirlo
     if not RASTER_PATH.exists():
-        st.error(f"No se encontró el archivo raster en: {RASTER_PATH}")
+        notify.error(f"No se encontró el archivo raster en: {RASTER_PATH}")
         return pd.DataFrame()
 
     try:
         with rasterio.open(RASTER_PATH) as src:
-            # 2. GESTIÓN DE CRS: GeoDataFrame maneja la reproyección automáticamente
-            polygon_gdf = gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
-            
-            # Reproyectamos al CRS del raster (seguramente Magna-Sirgas)
-            if polygon_gdf.crs != src.crs:
-                polygon_gdf = polygon_gdf.to_crs(src.crs)
-            
-            # 3. EXTRACCIÓN (MASKING)
-            # mask espera un iterable de geometrías JSON-like
-            out_image, _ = mask(src, polygon_gdf.geometry, crop=True, nodata=src.nodata)
-            out_image = out_image[0] # Banda 1
-            
-            # Definir NoData
-            nodata = src.nodata if src.nodata is not None else 0
-            
-            # Filtrar datos válidos
-            valid_mask = out_image != nodata
-            values = out_image[valid_mask]
-            
-            if len(values) == 0:
-                st.warning("El polígono está fuera de la cobertura del raster o en zona 'NoData'.")
+            # 2. GESTIÓN DE CRS: reproyectamos al CRS del raster (seguramente Magna-Sirgas)
+            geom = _polygon_to_raster_crs(polygon, src)
+
+            # 3. EXTRACCIÓN (pirámide, streaming por bloques o masking clásico)
+            unique, counts = _polygon_counts(src, geom, mode)
+
+            if counts.sum() == 0:
+                notify.warning("El polígono está fuera de la cobertura del raster o en zona 'NoData'.")
                 return pd.DataFrame()
-            
+
             # 4. ESTADÍSTICAS
-            unique, counts = np.unique(values, return_counts=True)
-            
-            # Cálculo de Área
-            res_x, res_y = src.res
             if src.crs.is_geographic:
-                 st.warning("⚠️ El raster está en grados geográficos. El cálculo de hectáreas será impreciso.")
-            
-            pixel_area_m2 = abs(res_x * res_y)
-            areas_m2 = counts * pixel_area_m2
-            areas_ha = areas_m2 / 10000 
-            
-            total_pixels = len(values)
-            percentages = (counts / total_pixels) * 100
-            
-            # DataFrame Final
-            df = pd.DataFrame({
-                'Código': unique,
-                'Leyenda': [LEYENDAS.get(val, f"Clase {val}") for val in unique],
-                'Conteo Píxeles': counts,
-                'Área (ha)': np.round(areas_ha, 2),
-                'Porcentaje (%)': np.round(percentages, 2)
-            })
-            
-            # Ordenar por área descendente para mejor visualización
-            return df.sort_values(by='Área (ha)', ascending=False).reset_index(drop=True)
-    
+                 notify.warning("El raster está en grados geográficos. El cálculo de hectáreas será impreciso.")
+
+            return _counts_to_table(unique, counts, src)
+
     except Exception as e:
-        st.error(f"Error procesando raster: {str(e)}")
+        notify.error(f"Error procesando raster: {str(e)}")
         return pd.DataFrame()
 
 if __name__ == "__main__":
     # Test simple
     puntos = [(-75.7, 4.8), (-75.6, 4.8), (-75.6, 4.9), (-75.7, 4.9)]
     poly = shapely.geometry.Polygon(puntos)
-    print(extract_forest_info(poly))
\ No newline at end of file
+    print(extract_forest_info(poly))
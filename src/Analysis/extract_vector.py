@@ -1,14 +1,25 @@
+import collections
+import copy
+import json
+import time
+import threading
+import concurrent.futures
 import geopandas as gpd
 import pandas as pd
-import streamlit as st
+import pyarrow.parquet as pq
+import pyogrio
+from pyproj import CRS
 import shapely
 from shapely.geometry import Polygon, MultiPolygon
 from pathlib import Path
+from src.analysis.result_cache import persistent_cache
+from src.analysis.tracing import traced, span, count, copy_context_call
 
 # ===================== GESTIÓN DE RUTAS =====================
 current_file_path = Path(__file__).resolve()
 PROJECT_ROOT = current_file_path.parent.parent.parent
 GPKG_PATH = PROJECT_ROOT / "data" / "raw" / "datos.gpkg"
+PARQUET_DIR = PROJECT_ROOT / "data" / "processed" / "geoparquet"
 
 # ===================== CONFIGURACIÓN DE CAPAS =====================
 LAYER_CONFIG = {
@@ -20,52 +31,291 @@ LAYER_CONFIG = {
     'ley_70_1993': 'DESCRIPCIO'                    
 }
 
+# Capas del cruce legal del diagnóstico: (id de capa, título)
+LEGAL_LAYERS = [
+    ('frontera_agricola_jun2025', 'Frontera Agrícola'),
+    ('runap__registro_unico_nacional_ap', 'Áreas Protegidas'),
+    ('consejos_comunitarios', 'Consejos Comunitarios'),
+    ('ley_70_1993', 'Ley 70'),
+    ('zonas_de_reserva_campesina', 'Reservas Campesinas'),
+    ('centro_poblado', 'Centros Poblados')
+]
+
 GENERIC_COLS = ['categoria', 'clase', 'nombre', 'name', 'tipo', 'objectid', 'elemento']
 
-def _load_vector_data(polygon, layer_name, format_type):
+# Columnas de contexto administrativo (Frontera Agrícola)
+CONTEXT_COLS = ['municipio', 'departamen']
+
+# Área por feature precalculada en la capa (si existe se usa para features no recortados)
+AREA_COL = 'area_ha'
+
+# CRS de áreas iguales (Albers cónica ajustada a Colombia) para geometrías preparadas
+# y áreas en hectáreas consistentes entre capas
+EQUAL_AREA_CRS = "+proj=aea +lat_0=4 +lon_0=-73.5 +lat_1=-2 +lat_2=10 +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs"
+
+# Columnas de bbox por feature escritas en el GeoParquet (ver prepare_vectors.py)
+BBOX_COLS = ['minx', 'miny', 'maxx', 'maxy']
+
+# Niveles de detalle (LOD): tolerancias de simplificación en metros (ver prepare_vectors.py).
+# La capa base guarda por feature el área de la diferencia simétrica con cada versión
+# simplificada en 'lod_err_<tol>' (ha).
+LOD_TOLERANCES_M = (10, 50, 250)
+LOD_ERROR_PREFIX = 'lod_err_'
+# Error máximo admitido al usar un LOD, como fracción del área del polígono consultado
+LOD_MAX_ERROR_FRACTION = 0.001
+
+# ===================== LECTURA =====================
+def _required_columns(available, layer_name):
+    """Columnas de atributos que el resumen necesita (insensible a mayúsculas)."""
+    lower = {c.lower(): c for c in available}
+    target_col = LAYER_CONFIG.get(layer_name)
+
+    if target_col and target_col.lower() in lower:
+        cols = [lower[target_col.lower()]]
+    else:
+        cols = [c for c in available if c.lower() in GENERIC_COLS]
+
+    cols += [lower[c] for c in CONTEXT_COLS if c in lower]
+    cols += [c for c in available if c.startswith(LOD_ERROR_PREFIX)]
+    return cols + ([AREA_COL] if AREA_COL in available else [])
+
+def _lod_path(layer_name, tolerance):
+    """GeoParquet de la versión simplificada de una capa."""
+    return PARQUET_DIR / f"{layer_name}__lod{tolerance}.parquet"
+
+def _parquet_geo_metadata(path):
+    """Esquema, columna de geometría y CRS de un GeoParquet (solo lee el footer)."""
+    schema = pq.read_schema(path)
+    geo = json.loads(schema.metadata[b'geo'])
+    geom_col = geo['primary_column']
+    # Sin clave 'crs' el estándar GeoParquet asume OGC:CRS84
+    layer_crs = geo['columns'][geom_col].get('crs', "OGC:CRS84") or "EPSG:4326"
+    return schema, geom_col, CRS.from_user_input(layer_crs)
+
+def _layer_crs(layer_name, format_type):
+    """CRS de la capa sin leer sus features (None si la fuente no lo declara)."""
+    if format_type in ('store', 'cube'):
+        from src.analysis.layer_store import get_layer
+        return get_layer(layer_name).crs
+
+    parquet_path = PARQUET_DIR / f"{layer_name}.parquet"
+    if format_type == 'parquet' and parquet_path.exists():
+        return _parquet_geo_metadata(parquet_path)[2]
+
+    if not GPKG_PATH.exists():
+        raise FileNotFoundError(f"GPKG no encontrado: {GPKG_PATH}")
+    crs = pyogrio.read_info(GPKG_PATH, layer=layer_name)['crs']
+    return CRS.from_user_input(crs) if crs else None
+
+def _project_polygon(polygon, crs):
+    """Reproyecta el polígono WGS84 al CRS de la capa."""
+    if crs is None:
+        return polygon
+    return gpd.GeoSeries([polygon], crs="EPSG:4326").to_crs(crs).iloc[0]
+
+def _read_parquet_layer(path, layer_name, layer_polygon):
+    """
+    Lee un GeoParquet podando row groups con las estadísticas de las columnas
+    minx/miny/maxx/maxy y cargando solo las columnas necesarias.
+    """
+    schema, geom_col, _ = _parquet_geo_metadata(path)
+    minx, miny, maxx, maxy = layer_polygon.bounds
+
+    columns = _required_columns(schema.names, layer_name) + [geom_col]
+    filters = None
+    if all(c in schema.names for c in BBOX_COLS):
+        filters = [('minx', '<=', maxx), ('maxx', '>=', minx), ('miny', '<=', maxy), ('maxy', '>=', miny)]
+
+    gdf = gpd.read_parquet(path, columns=columns, filters=filters)
+    if filters is None:
+        gdf = gdf.cx[minx:maxx, miny:maxy]
+    return gdf
+
+@traced()
+def _read_layer(layer_polygon, layer_name, format_type, lod=0):
+    """
+    Lee los features candidatos de la capa. `layer_polygon` ya está en el CRS
+    de la capa. Retorna None si no hay fuente disponible.
+    """
+    if format_type in ('store', 'cube'):
+        from src.analysis.layer_store import get_layer
+        return get_layer(layer_name, lod).query(layer_polygon)
+
+    if format_type == 'parquet':
+        parquet_path = PARQUET_DIR / f"{layer_name}.parquet"
+        if parquet_path.exists():
+            return _read_parquet_layer(parquet_path, layer_name, layer_polygon)
+        print(f"GeoParquet no encontrado para {layer_name}, usando GPKG")
+
+    if not GPKG_PATH.exists():
+        print("GPKG no encontrado")
+        return None
+    return gpd.read_file(GPKG_PATH, layer=layer_name, bbox=layer_polygon.bounds)
+
+def _select_lod(layer_polygon, layer_name, max_error_fraction=LOD_MAX_ERROR_FRACTION):
+    """
+    Tolerancia (m) del LOD más grueso cuya cota de error cabe en `max_error_fraction`
+    del área del polígono; 0 = resolución completa.
+    La simplificación desplaza cada borde como mucho `tol`, así que solo los features
+    a menos de `tol` del borde del polígono pueden cambiar su área recortada, y a lo
+    sumo en su diferencia simétrica con la versión simplificada. Los demás quedan
+    del mismo lado y usan el área original guardada.
+    """
+    from src.analysis.layer_store import get_layer
+    layer = get_layer(layer_name)
+    budget = max_error_fraction * layer_polygon.area / 10000
+    boundary = layer_polygon.boundary
+
+    for tolerance in sorted(LOD_TOLERANCES_M, reverse=True):
+        err_col = f"{LOD_ERROR_PREFIX}{tolerance}"
+        if err_col not in layer.attributes.columns or not _lod_path(layer_name, tolerance).exists():
+            continue
+        idx = layer.tree.query(boundary, predicate='dwithin', distance=tolerance)
+        if layer.attributes[err_col].to_numpy()[idx].sum() <= budget:
+            return tolerance
+    return 0
+
+def _layer_version(layer_name):
+    """Fecha de modificación de las fuentes de la capa (invalida la caché al regenerarlas)."""
+    paths = [GPKG_PATH, PARQUET_DIR / f"{layer_name}.parquet"]
+    paths += [_lod_path(layer_name, tolerance) for tolerance in LOD_TOLERANCES_M]
+    return {p.name: p.stat().st_mtime for p in paths if p.exists()}
+
+# ===================== PROCESAMIENTO =====================
+def _category_column(columns, layer_name):
+    """Columna de categoría de la capa: la configurada o, si no existe, una genérica."""
+    target_col = LAYER_CONFIG.get(layer_name)
+    if target_col and target_col in columns:
+        return target_col
+
+    # Intenta buscar insensible a mayúsculas
+    if target_col:
+        for col in columns:
+            if col.lower() == target_col.lower():
+                return col
+
+    return next((c for c in columns if c.lower() in GENERIC_COLS), None)
+
+@traced()
+def _clip_to_polygon(gdf, polygon):
+    """
+    Intersecta los features con el polígono (ya en el CRS de la capa) clasificándolos
+    con el polígono preparado:
+      - completamente dentro: se conservan tal cual, sin recortar;
+      - disjuntos: se descartan;
+      - cruzando el borde: únicos que se recortan, con `shapely.intersection` vectorizado.
+    Agrega la columna booleana '_recortado'.
+    """
+    geoms = gdf.geometry.to_numpy()
+    shapely.prepare(polygon)
+    inside = shapely.contains(polygon, geoms)
+    crossing = shapely.intersects(polygon, geoms) & ~inside
+
+    clipped_geoms = geoms[crossing]
+    try:
+        clipped = shapely.intersection(clipped_geoms, polygon)
+    except shapely.errors.GEOSException:
+        # Geometrías inválidas en la fuente: se reparan solo las que cruzan el borde
+        clipped = shapely.intersection(shapely.make_valid(clipped_geoms), polygon)
+
+    # Contactos de solo borde (líneas/puntos) no aportan área, igual que en gpd.overlay
+    keep = shapely.area(clipped) > 0
+
+    result = pd.concat([gdf[inside], gdf[crossing][keep]], ignore_index=True)
+    result = gpd.GeoDataFrame(
+        result.drop(columns=gdf.geometry.name),
+        geometry=list(geoms[inside]) + list(clipped[keep]),
+        crs=gdf.crs
+    )
+    result['_recortado'] = [False] * int(inside.sum()) + [True] * int(keep.sum())
+    count('features_cruzados', len(result))
+    count('features_recortados', int(keep.sum()))
+    return result
+
+@traced()
+@persistent_cache(
+    'sipra', dataset=lambda params: params['layer_name'], version=lambda params: _layer_version(params['layer_name']),
+    ignore=('layer_polygon', 'raise_errors'), cache_if=lambda result: 'error' not in result[1]
+)
+def _load_vector_data(polygon, layer_name, format_type, layer_polygon=None, raise_errors=False,
+                      lod_fraction=LOD_MAX_ERROR_FRACTION):
     """
     Retorna una tupla: (DataFrame_Resumen, Diccionario_Metadata)
+    format_type: 'gpkg' (GeoPackage), 'parquet' (GeoParquet con poda por bbox;
+    si el archivo no existe se usa el GPKG), 'store' (capa residente en memoria
+    con STRtree, ver layer_store.py) o 'cube' (sumas precalculadas por celda de
+    vector_cube.py; sin cubo vigente se usa 'store'. No extrae metadata de contexto).
+    layer_polygon: polígono ya reproyectado al CRS de la capa (evita reproyectar).
+    raise_errors: propaga los errores de lectura en vez de retornar vacío (con metadata['error']).
+    lod_fraction: error admitido (fracción del área del polígono) para usar una versión
+    simplificada de la capa con format_type='store'; None = siempre resolución completa.
+    La tolerancia usada queda en metadata['lod_m'].
+    Los resultados quedan en la caché persistente (result_cache.py), invalidada al
+    regenerar las fuentes de la capa.
     """
     metadata = {} 
     
     if not isinstance(polygon, (Polygon, MultiPolygon)):
         return pd.DataFrame(), metadata
 
-    bounds = polygon.bounds
-    gdf = gpd.GeoDataFrame()
-    
-    # 1. LECTURA (GPKG)
+    # 1. LECTURA (GeoParquet, GPKG o capa en memoria)
     try:
-        if GPKG_PATH.exists():
-            gdf = gpd.read_file(GPKG_PATH, layer=layer_name, bbox=bounds)
-        else:
-            print("GPKG no encontrado")
+        # Si los datos vienen en otro CRS (ej. Magna Sirgas), reproyectamos el polígono
+        if layer_polygon is None:
+            layer_polygon = _project_polygon(polygon, _layer_crs(layer_name, format_type))
+
+        if format_type == 'cube':
+            from src.analysis.vector_cube import query_vector_cube
+            summary = query_vector_cube(layer_polygon, layer_name)
+            if summary is not None:
+                return summary, metadata
+
+        lod = 0
+        if format_type in ('store', 'cube') and lod_fraction:
+            lod = _select_lod(layer_polygon, layer_name, lod_fraction)
+        metadata['lod_m'] = lod
+
+        gdf = _read_layer(layer_polygon, layer_name, format_type, lod)
+        if gdf is not None:
+            count('features_leidos', len(gdf))
+        if gdf is None:
+            if raise_errors:
+                raise FileNotFoundError(f"Sin fuente de datos para {layer_name}")
             return pd.DataFrame(), metadata
     except Exception as e:
-        print(f"Error lectura GPKG {layer_name}: {e}")
+        if raise_errors:
+            raise
+        print(f"Error lectura {format_type} {layer_name}: {e}")
+        metadata['error'] = str(e)
         return pd.DataFrame(), metadata
 
     if gdf.empty:
         return pd.DataFrame(), metadata
 
     # 2. PROCESAMIENTO ESPACIAL
-    # Aseguramos CRS WGS84 para el polígono
-    polygon_gdf = gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
-    
-    # Si los datos vienen en otro CRS (ej. Magna Sirgas), reproyectamos el polígono
-    if gdf.crs and polygon_gdf.crs != gdf.crs:
-        polygon_gdf = polygon_gdf.to_crs(gdf.crs)
-
-    # Intersección
-    try:
-        intersected = gpd.overlay(gdf, polygon_gdf, how='intersection')
-    except:
-        intersected = gpd.sjoin(gdf, polygon_gdf, predicate='intersects')
+    # Intersección (solo se recortan los features que cruzan el borde)
+    intersected = _clip_to_polygon(gdf, layer_polygon)
 
     if intersected.empty:
         return pd.DataFrame(), metadata
 
-    # 3. EXTRACCIÓN DE CONTEXTO (Específico para Frontera Agrícola)
+    # 3. CÁLCULO DE ÁREA (Hectáreas)
+    # Las capas preparadas (prepare_vectors.py) ya vienen en EQUAL_AREA_CRS con 'area_ha'
+    # por feature: solo se miden los features recortados, sin reproyectar nada.
+    try:
+        if AREA_COL in intersected.columns:
+            to_measure = intersected['_recortado']
+        else:
+            to_measure = pd.Series(True, index=intersected.index)
+        measured = intersected[to_measure]
+        if measured.crs is not None and measured.crs.is_geographic:
+            measured = measured.to_crs(EQUAL_AREA_CRS)
+        intersected.loc[to_measure, AREA_COL] = measured.area / 10000
+    except Exception as e:
+        print(f"No se pudo calcular el área de {layer_name}: {e}")
+        intersected[AREA_COL] = 0
+
+    # 4. EXTRACCIÓN DE CONTEXTO (Específico para Frontera Agrícola)
     cols_lower = {c.lower(): c for c in intersected.columns}
     
     if 'municipio' in cols_lower and 'departamen' in cols_lower:
@@ -74,8 +324,7 @@ def _load_vector_data(polygon, layer_name, format_type):
             col_depto = cols_lower['departamen']
             
             # Calculamos cuál es el municipio con mayor área intersectada
-            intersected['tmp_area_calc'] = intersected.geometry.area
-            top_muni = intersected.groupby(col_muni)['tmp_area_calc'].sum().idxmax()
+            top_muni = intersected.groupby(col_muni)[AREA_COL].sum().idxmax()
             
             # Obtenemos el departamento asociado a ese municipio
             subset = intersected[intersected[col_muni] == top_muni]
@@ -86,30 +335,8 @@ def _load_vector_data(polygon, layer_name, format_type):
         except Exception as e:
             print(f"No se pudo extraer contexto: {e}")
 
-    # 4. CÁLCULO DE ÁREA (Hectáreas)
-    try:
-        if intersected.crs.is_geographic:
-            intersected['area_ha'] = intersected.to_crs(epsg=3116).area / 10000
-        else:
-            intersected['area_ha'] = intersected.area / 10000
-    except:
-        intersected['area_ha'] = 0
-
     # 5. AGRUPACIÓN
-    target_col = LAYER_CONFIG.get(layer_name)
-    
-    # Si no encuentra la columna configurada, busca en las genéricas
-    if not target_col or target_col not in intersected.columns:
-        # Intenta buscar insensible a mayúsculas
-        found = False
-        for col in intersected.columns:
-            if col.lower() == target_col.lower():
-                target_col = col
-                found = True
-                break
-        
-        if not found:
-             target_col = next((c for c in intersected.columns if c.lower() in GENERIC_COLS), None)
+    target_col = _category_column(intersected.columns, layer_name)
 
     if target_col and target_col in intersected.columns:
         summary = intersected.groupby(target_col, as_index=False).agg(
@@ -128,7 +355,96 @@ def _load_vector_data(polygon, layer_name, format_type):
     return summary.sort_values(by='area_total_ha', ascending=False).reset_index(drop=True), metadata
 
 
-# ===================== WRAPPER STREAMLIT =====================
-@st.cache_data(show_spinner=False, hash_funcs={Polygon: lambda x: x.wkt, MultiPolygon: lambda x: x.wkt})
+# ===================== CRUCE MULTICAPA =====================
+def _load_vector_layers(polygon, layers=LEGAL_LAYERS, format_type='store', max_workers=None,
+                        lod_fraction=LOD_MAX_ERROR_FRACTION):
+    """
+    Cruza el polígono con varias capas en una sola pasada.
+    El polígono se reproyecta una vez por cada CRS distinto y las capas se leen e
+    intersectan en hilos (GDAL/pyogrio y GEOS liberan el GIL).
+    Args:
+        layers (list): Pares (id de capa, título).
+    Returns:
+        dict: {id_capa: {'titulo', 'summary', 'metadata', 'lod_m', 'elapsed_s', 'error'}}
+            en el orden de `layers`. 'lod_m' es la tolerancia del LOD usado (0 = completo).
+    """
+    projected, lock = {}, threading.Lock()
+
+    def project(crs):
+        key = crs.to_wkt() if crs is not None else None
+        with lock:
+            if key not in projected:
+                projected[key] = _project_polygon(polygon, crs)
+        return projected[key]
+
+    def run(layer_name):
+        start = time.perf_counter()
+        try:
+            with span(f"capa.{layer_name}"):
+                layer_polygon = project(_layer_crs(layer_name, format_type))
+                summary, metadata = _load_vector_data(
+                    polygon, layer_name, format_type, layer_polygon=layer_polygon, raise_errors=True,
+                    lod_fraction=lod_fraction
+                )
+            error = None
+        except Exception as e:
+            summary, metadata, error = pd.DataFrame(), {}, f"{type(e).__name__}: {e}"
+        lod = metadata.pop('lod_m', 0)
+        return summary, metadata, lod, round(time.perf_counter() - start, 3), error
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(layers) or 1) as executor:
+        futures = {layer_name: executor.submit(copy_context_call(run), layer_name) for layer_name, _ in layers}
+
+    results = {}
+    for layer_name, title in layers:
+        summary, metadata, lod, elapsed, error = futures[layer_name].result()
+        results[layer_name] = {
+            'titulo': title,
+            'summary': summary,
+            'metadata': metadata,
+            'lod_m': lod,
+            'elapsed_s': elapsed,
+            'error': error
+        }
+    return results
+
+# ===================== CACHÉ EN MEMORIA =====================
+# Resultados recientes por proceso (acotado: en un lote cada polígono es nuevo).
+# Lo demás lo cubre la caché persistente de _load_vector_data por capa.
+MEMORY_CACHE_ENTRIES = 64
+
+_MEMORY_CACHE = collections.OrderedDict()
+_MEMORY_CACHE_LOCK = threading.Lock()
+
+def _memory_cached(key, compute, cache_if=lambda result: True):
+    """LRU acotado a MEMORY_CACHE_ENTRIES; retorna copias para que nadie modifique lo guardado."""
+    with _MEMORY_CACHE_LOCK:
+        if key in _MEMORY_CACHE:
+            _MEMORY_CACHE.move_to_end(key)
+            return copy.deepcopy(_MEMORY_CACHE[key])
+    result = compute()
+    if cache_if(result):
+        with _MEMORY_CACHE_LOCK:
+            _MEMORY_CACHE[key] = copy.deepcopy(result)
+            while len(_MEMORY_CACHE) > MEMORY_CACHE_ENTRIES:
+                _MEMORY_CACHE.popitem(last=False)
+    return result
+
 def extract_vector_info(polygon, layer_name='frontera_agricola_jun2025', format_type='gpkg'):
-    return _load_vector_data(polygon, layer_name, format_type)
\ No newline at end of file
+    if not isinstance(polygon, (Polygon, MultiPolygon)):
+        return _load_vector_data(polygon, layer_name, format_type)
+    return _memory_cached(
+        ('info', polygon.wkb, layer_name, format_type),
+        lambda: _load_vector_data(polygon, layer_name, format_type),
+        cache_if=lambda result: 'error' not in result[1]
+    )
+
+@traced()
+def extract_vector_layers(polygon, layers=LEGAL_LAYERS, format_type='store'):
+    if not isinstance(polygon, (Polygon, MultiPolygon)):
+        return _load_vector_layers(polygon, layers, format_type)
+    return _memory_cached(
+        ('layers', polygon.wkb, tuple(layers), format_type),
+        lambda: _load_vector_layers(polygon, layers, format_type),
+        cache_if=lambda results: not any(res['error'] for res in results.values())
+    )
@@ -0,0 +1,148 @@
+"""
+Estadísticas de coberturas IDEAM para miles de predios en paralelo.
+
+Los predios se ordenan por su distancia de Hilbert (localidad espacial) y se
+reparten en bloques contiguos entre procesos. Cada proceso abre el raster una
+sola vez, así que predios vecinos reutilizan la caché de bloques de GDAL.
+
+Uso:
+    python -m src.analysis.forest_batch predios.gpkg --id-col codigo --output coberturas.parquet
+"""
+import argparse
+import math
+import os
+import concurrent.futures
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import shapely
+from pathlib import Path
+from src.analysis.extract_raster import RASTER_PATH, _polygon_counts, _counts_to_table
+
+# Dataset abierto por cada proceso del pool (uno por worker)
+_WORKER = {}
+
+# Motivo registrado para predios sin píxeles válidos (no es un fallo del cálculo)
+NO_PIXELS = "sin píxeles (fuera del raster o NoData)"
+# Motivo para filas sin geometría o que no son Polygon/MultiPolygon
+INVALID_GEOMETRY = "geometría vacía o no poligonal"
+
+# ===================== LECTURA DE PREDIOS =====================
+def read_parcels(path, layer=None):
+    """Lee predios desde GeoPackage/Shapefile o (Geo)Parquet y los deja en WGS84."""
+    path = Path(path)
+    if path.suffix.lower() == '.parquet':
+        gdf = gpd.read_parquet(path)
+    else:
+        gdf = gpd.read_file(path, layer=layer)
+    if gdf.crs is None:
+        gdf = gdf.set_crs("EPSG:4326")
+    return gdf.to_crs("EPSG:4326")
+
+def _valid_parcels(parcels, id_col=None):
+    """
+    Separa los predios procesables de los que no tienen geometría poligonal.
+    Returns:
+        tuple: (gdf válido, ids del gdf válido, {id: INVALID_GEOMETRY} de los descartados).
+            Las claves de errores son str para que `attrs` se pueda guardar en Parquet.
+    """
+    gdf = parcels if parcels.crs is not None else parcels.set_crs("EPSG:4326")
+    ids = gdf[id_col] if id_col else gdf.index.to_series()
+    valid = (gdf.geometry.notna() & gdf.geom_type.isin(['Polygon', 'MultiPolygon'])).to_numpy()
+    errors = {str(pid): INVALID_GEOMETRY for pid in ids[~valid]}
+    return gdf[valid], ids[valid], errors
+
+# ===================== WORKERS =====================
+def _init_worker(raster_path, mode):
+    """Abre el raster una vez por proceso."""
+    _WORKER['src'] = rasterio.open(raster_path)
+    _WORKER['mode'] = mode
+
+def _process_chunk(items):
+    """Calcula la tabla de coberturas para un bloque de predios (ya en el CRS del raster)."""
+    src, mode = _WORKER['src'], _WORKER['mode']
+    frames, errors = [], {}
+    for pid, wkb in items:
+        try:
+            unique, counts = _polygon_counts(src, shapely.from_wkb(wkb), mode)
+            if counts.sum() == 0:
+                errors[str(pid)] = NO_PIXELS
+                continue
+            df = _counts_to_table(unique, counts, src)
+            df.insert(0, 'id', pid)
+            frames.append(df)
+        except Exception as e:
+            errors[str(pid)] = str(e)
+    return frames, errors
+
+# ===================== API =====================
+def extract_forest_info_batch(parcels, id_col=None, max_workers=None, chunk_size=None, mode='auto', raster_path=None):
+    """
+    Estadísticas de coberturas para muchos polígonos.
+    Args:
+        parcels (gpd.GeoDataFrame): Predios (Polygon/MultiPolygon).
+        id_col (str): Columna identificadora; si es None se usa el índice.
+        max_workers (int): Procesos del pool (por defecto, núcleos disponibles).
+        chunk_size (int): Predios por tarea; por defecto ~4 tareas por worker.
+        mode (str): Estrategia de conteo, igual que en extract_forest_info.
+        raster_path (Path): Raster a consultar (por defecto RASTER_PATH).
+    Returns:
+        pd.DataFrame: Tabla larga con 'id' + las columnas de extract_forest_info.
+            Los predios sin fila quedan en `df.attrs['errores']` ({str(id): motivo}):
+            por error, sin píxeles válidos (NO_PIXELS) o sin geometría (INVALID_GEOMETRY).
+    """
+    raster_path = Path(raster_path or RASTER_PATH)
+    if not raster_path.exists():
+        raise FileNotFoundError(f"No se encontró el archivo raster en: {raster_path}")
+    if mode == 'auto' and raster_path.resolve() != RASTER_PATH.resolve():
+        # La pirámide corresponde a RASTER_PATH; otro raster se recorre por bloques
+        mode = 'stream'
+
+    gdf, ids, errors = _valid_parcels(parcels, id_col)
+
+    frames = []
+    if len(gdf):
+        # Reproyección vectorizada una sola vez y orden espacial (curva de Hilbert)
+        with rasterio.open(raster_path) as src:
+            geoms = gdf.geometry.to_crs(src.crs)
+        order = geoms.hilbert_distance().argsort().to_numpy()
+        items = list(zip(ids.to_numpy()[order], shapely.to_wkb(geoms.to_numpy()[order])))
+        max_workers = max_workers or os.cpu_count() or 1
+        chunk_size = chunk_size or max(1, math.ceil(len(items) / (max_workers * 4)))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(str(raster_path), mode)
+        ) as executor:
+            for chunk_frames, chunk_errors in executor.map(_process_chunk, chunks):
+                frames.extend(chunk_frames)
+                errors.update(chunk_errors)
+
+    empty = sum(reason == NO_PIXELS for reason in errors.values())
+    invalid = sum(reason == INVALID_GEOMETRY for reason in errors.values())
+    if invalid:
+        print(f"⚠️ {invalid} predios sin geometría poligonal.")
+    if empty:
+        print(f"⚠️ {empty} predios sin píxeles válidos (fuera del raster o NoData).")
+    if len(errors) > empty + invalid:
+        print(f"⚠️ {len(errors) - empty - invalid} predios con error en el cruce con IDEAM.")
+
+    result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if id_col and not result.empty:
+        result = result.rename(columns={'id': id_col})
+    result.attrs['errores'] = errors
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coberturas IDEAM para un archivo de predios.")
+    parser.add_argument("input", type=Path, help="GeoPackage/Shapefile/Parquet de predios")
+    parser.add_argument("--layer", default=None, help="Capa dentro del GeoPackage")
+    parser.add_argument("--id-col", default=None, help="Columna identificadora del predio")
+    parser.add_argument("--workers", type=int, default=None, help="Número de procesos")
+    parser.add_argument("--output", type=Path, default=Path("data/processed/coberturas_predios.parquet"))
+    args = parser.parse_args()
+
+    result = extract_forest_info_batch(read_parcels(args.input, args.layer), id_col=args.id_col, max_workers=args.workers)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    result.to_parquet(args.output, index=False)
+    print(f"✅ {result.iloc[:, 0].nunique() if not result.empty else 0} predios procesados -> {args.output}")
@@ -0,0 +1,203 @@
+"""
+Pirámide precalculada de conteos de clases del raster IDEAM.
+
+El raster de coberturas boscosas es estático: sus clases (LEYENDAS 1-5) no cambian
+entre ejecuciones. Este módulo recorre el raster una sola vez y guarda, para cada
+tile de `tile_size` x `tile_size` píxeles, cuántos píxeles hay de cada clase. Los
+niveles superiores suman bloques de 2x2 tiles del nivel anterior.
+
+En consulta se desciende desde el nivel más grueso: los tiles completamente dentro
+del polígono aportan sus conteos precalculados y solo los tiles del borde del
+nivel 0 se leen píxel a píxel.
+
+Uso (paso offline):
+    python -m src.analysis.forest_pyramid --tile-size 256
+"""
+import argparse
+import math
+import numpy as np
+import rasterio
+from rasterio import windows
+import shapely
+from pathlib import Path
+from src.analysis import notify
+from src.analysis.extract_raster import RASTER_PATH, _zonal_counts
+from src.analysis.tracing import traced
+
+PYRAMID_PATH = Path("data/processed/bosques_IDEAM/piramide_conteos.npz")
+PYRAMID_TILE_SIZE = 256
+
+# Pirámides ya cargadas en el proceso: {ruta: (mtime, pirámide)}
+_LOADED = {}
+# Versiones (pirámide, raster) ya avisadas como desactualizadas: un aviso por versión
+_WARNED_STALE = set()
+
+# ===================== CONSTRUCCIÓN (OFFLINE) =====================
+def _downsample_level(level):
+    """Suma bloques de 2x2 tiles para obtener el nivel siguiente."""
+    n_rows, n_cols, n_codes = level.shape
+    padded = np.zeros((n_rows + n_rows % 2, n_cols + n_cols % 2, n_codes), dtype=level.dtype)
+    padded[:n_rows, :n_cols] = level
+    return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2, n_codes).sum(axis=(1, 3))
+
+def build_forest_pyramid(raster_path=None, output_path=PYRAMID_PATH, tile_size=PYRAMID_TILE_SIZE):
+    """
+    Recorre el raster por franjas de `tile_size` filas y guarda la pirámide de conteos.
+    Args:
+        raster_path (Path): Raster categórico (por defecto RASTER_PATH de extract_raster).
+        output_path (Path): Archivo .npz de salida.
+        tile_size (int): Lado del tile del nivel 0 en píxeles.
+    Returns:
+        Path: Ruta del archivo generado.
+    """
+    raster_path = Path(raster_path or RASTER_PATH)
+    output_path = Path(output_path)
+
+    with rasterio.open(raster_path) as src:
+        dtype = np.dtype(src.dtypes[0])
+        if dtype.kind != 'u' or dtype.itemsize > 2:
+            raise ValueError(f"La pirámide requiere un raster categórico entero sin signo (dtype={dtype})")
+
+        nodata = src.nodata if src.nodata is not None else 0
+        n_rows = math.ceil(src.height / tile_size)
+        n_cols = math.ceil(src.width / tile_size)
+        n_codes = 1
+        level0 = np.zeros((n_rows, n_cols, n_codes), dtype=np.int64)
+        tile_col = np.arange(src.width) // tile_size
+
+        for r in range(n_rows):
+            window = windows.Window(0, r * tile_size, src.width, min(tile_size, src.height - r * tile_size))
+            data = src.read(1, window=window, masked=True)
+            valid = ~np.ma.getmaskarray(data) & (data.data != nodata)
+            values = data.data[valid].astype(np.int64)
+            if values.size == 0:
+                continue
+
+            # Crecemos el eje de clases si aparece un código mayor
+            if values.max() + 1 > n_codes:
+                grow = int(values.max()) + 1 - n_codes
+                level0 = np.pad(level0, ((0, 0), (0, 0), (0, grow)))
+                n_codes += grow
+
+            # Un solo bincount por franja: índice combinado (tile, código)
+            cols = np.broadcast_to(tile_col, data.shape)[valid]
+            level0[r] = np.bincount(cols * n_codes + values, minlength=n_cols * n_codes).reshape(n_cols, n_codes)
+
+            if r % 50 == 0:
+                print(f"🧱 Pirámide: franja {r + 1}/{n_rows}")
+
+        levels = [level0]
+        while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+            levels.append(_downsample_level(levels[-1]))
+
+        stat = raster_path.stat()
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            output_path,
+            tile_size=tile_size,
+            n_levels=len(levels),
+            width=src.width,
+            height=src.height,
+            transform=np.array(src.transform[:6]),
+            source_mtime=stat.st_mtime,
+            source_size=stat.st_size,
+            **{f"level_{i}": lvl for i, lvl in enumerate(levels)}
+        )
+
+    print(f"✅ Pirámide guardada en {output_path} ({len(levels)} niveles, {n_codes} códigos)")
+    return output_path
+
+# ===================== CARGA =====================
+def load_forest_pyramid(raster_path=RASTER_PATH, path=PYRAMID_PATH):
+    """
+    Carga la pirámide (una vez por proceso) si existe y corresponde al raster actual.
+    Returns:
+        dict | None: None si no existe o quedó desactualizada frente al raster.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    mtime = path.stat().st_mtime
+    cached = _LOADED.get(path)
+    if cached is None or cached[0] != mtime:
+        with np.load(path) as data:
+            pyramid = {
+                'tile_size': int(data['tile_size']),
+                'width': int(data['width']),
+                'height': int(data['height']),
+                'transform': tuple(data['transform']),
+                'source_mtime': float(data['source_mtime']),
+                'source_size': int(data['source_size']),
+                'levels': [data[f"level_{i}"] for i in range(int(data['n_levels']))]
+            }
+        _LOADED[path] = (mtime, pyramid)
+    pyramid = _LOADED[path][1]
+
+    stat = Path(raster_path).stat()
+    if stat.st_size != pyramid['source_size'] or stat.st_mtime != pyramid['source_mtime']:
+        version = (path, mtime, stat.st_size, stat.st_mtime)
+        if version not in _WARNED_STALE:
+            _WARNED_STALE.add(version)
+            notify.warning("Pirámide desactualizada frente al raster; se usará la lectura por bloques.")
+        return None
+    return pyramid
+
+# ===================== CONSULTA =====================
+@traced()
+def query_forest_pyramid(pyramid, src, geom):
+    """
+    Histograma de clases dentro del polígono usando la pirámide.
+    Args:
+        pyramid (dict): Resultado de load_forest_pyramid.
+        src (DatasetReader): Raster abierto (para leer tiles de borde).
+        geom (shapely.Geometry): Polígono en el CRS del raster.
+    Returns:
+        tuple: (códigos, conteos) ordenados por código, igual que np.unique.
+    """
+    if tuple(src.transform[:6]) != pyramid['transform'] or (src.width, src.height) != (pyramid['width'], pyramid['height']):
+        raise ValueError("La pirámide no corresponde a la grilla del raster abierto.")
+
+    tile = pyramid['tile_size']
+    levels = pyramid['levels']
+    counts = np.zeros(levels[0].shape[2], dtype=np.int64)
+    boundary = []
+
+    shapely.prepare(geom)
+    stack = [(len(levels) - 1, 0, 0)]
+    while stack:
+        level, r, c = stack.pop()
+        size = tile * 2 ** level
+        row0, col0 = r * size, c * size
+        if row0 >= src.height or col0 >= src.width:
+            continue
+
+        window = windows.Window(col0, row0, min(size, src.width - col0), min(size, src.height - row0))
+        box = shapely.box(*windows.bounds(window, src.transform))
+        if not geom.intersects(box):
+            continue
+        if geom.contains(box):
+            # Todos los centros de píxel del tile caen dentro del polígono
+            counts += levels[level][r, c]
+        elif level == 0:
+            boundary.append(window)
+        else:
+            stack.extend((level - 1, 2 * r + dr, 2 * c + dc) for dr in (0, 1) for dc in (0, 1))
+
+    # Solo los tiles del borde se leen píxel a píxel
+    edge_codes, edge_counts = _zonal_counts(src, geom, windows_iter=boundary)
+    if edge_codes.size and edge_codes.max() + 1 > counts.size:
+        counts = np.pad(counts, (0, int(edge_codes.max()) + 1 - counts.size))
+    np.add.at(counts, edge_codes.astype(np.int64), edge_counts)
+
+    unique = np.flatnonzero(counts)
+    return unique.astype(src.dtypes[0]), counts[unique]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye la pirámide de conteos del raster IDEAM.")
+    parser.add_argument("--raster", type=Path, default=None, help="Raster categórico de entrada")
+    parser.add_argument("--output", type=Path, default=PYRAMID_PATH, help="Archivo .npz de salida")
+    parser.add_argument("--tile-size", type=int, default=PYRAMID_TILE_SIZE, help="Lado del tile en píxeles")
+    args = parser.parse_args()
+    build_forest_pyramid(args.raster, args.output, args.tile_size)
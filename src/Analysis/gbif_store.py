@@ -0,0 +1,393 @@
+"""
+Almacén local de ocurrencias GBIF para responder `fetch_biodiversity_data` sin API.
+
+Convierte una descarga de GBIF para Colombia (Darwin Core Archive o "simple CSV",
+ambos separados por tabulador) en archivos Parquet particionados por celdas de
+1° x 1° y ordenados por coordenadas. Solo se guardan taxonKey, speciesKey, las
+coordenadas y la clave del grupo de TAXON_GROUPS al que pertenece el registro
+(las ocurrencias fuera de esos grupos se descartan).
+
+En consulta se leen solo las celdas que toca el polígono, se podan row groups
+por lon/lat y se cuentan los speciesKey distintos por grupo con un
+point-in-polygon vectorizado (shapely.intersects_xy).
+
+La riqueza no es aditiva entre áreas, así que además se construye un índice de
+conjuntos por celda (INDEX_CELL_DEG): para cada celda con datos, el conjunto
+ordenado de claves (grupoKey << 32 | speciesKey). La riqueza de un polígono es el
+tamaño de la unión de los conjuntos de las celdas completamente dentro, más las
+especies de los puntos que caen dentro en las celdas de borde (también indexados
+por celda). Los arreglos se abren con mmap, así que miles de predios se
+resuelven sin volver a leer el almacén. El índice se reconstruye en un
+directorio temporal y se intercambia con os.replace: los procesos que lo tienen
+abierto siguen leyendo los archivos anteriores y recargan al cambiar el manifiesto.
+
+Uso (paso offline):
+    python -m src.analysis.gbif_store data/raw/gbif/0001234-250101000000000.zip
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import threading
+import zipfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+from pathlib import Path
+from src.analysis.extract_vector import PROJECT_ROOT
+from src.analysis.tracing import traced, count
+
+GBIF_STORE_DIR = PROJECT_ROOT / "data" / "processed" / "gbif"
+MANIFEST_NAME = "manifest.json"
+
+# Rango y nombre de cada grupo (clave de TAXON_GROUPS) en la clasificación de GBIF.
+# Los DwC-A traen claves por rango (classKey, ...); el simple CSV solo los nombres.
+TAXON_GROUP_RANKS = {
+    212: ('class', 'Aves'),
+    359: ('class', 'Mammalia'),
+    358: ('class', 'Reptilia'),
+    131: ('class', 'Amphibia'),
+    7707728: ('phylum', 'Tracheophyta'),
+    797: ('order', 'Lepidoptera')
+}
+
+LON_COL, LAT_COL = 'decimalLongitude', 'decimalLatitude'
+STORE_COLUMNS = ['taxonKey', 'speciesKey', LON_COL, LAT_COL, 'grupoKey']
+
+# Tamaño de celda de partición (grados) y de row group
+CELL_DEG = 1
+ROW_GROUP_SIZE = 50_000
+CHUNK_SIZE = 1_000_000
+
+# Índice de conjuntos de especies: celdas de 1/128° (~870 m, potencia de 2 para que
+# los bordes de celda sean exactos en punto flotante)
+SPECIES_INDEX_DIR = GBIF_STORE_DIR / "indice"
+INDEX_CELL_DEG = 1 / 128
+_CELL_OFFSET = 2 ** 20
+_INDEX_ARRAYS = ['celdas', 'conjuntos_offsets', 'conjuntos', 'puntos_offsets', 'puntos_lon', 'puntos_lat', 'puntos_clave']
+_INDEX = {}   # {directorio: {'version', 'arrays'}}
+_LOCK = threading.Lock()
+
+# ===================== INGESTA (OFFLINE) =====================
+def _open_occurrences(source):
+    """Abre el archivo de ocurrencias: occurrence.txt dentro de un DwC-A o el CSV directo."""
+    source = Path(source)
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        names = archive.namelist()
+        name = 'occurrence.txt' if 'occurrence.txt' in names else next(n for n in names if n.endswith(('.csv', '.txt')))
+        return archive.open(name)
+    return open(source, 'rb')
+
+def _wanted_column(col):
+    ranks = {rank for rank, _ in TAXON_GROUP_RANKS.values()}
+    return col in ('taxonKey', 'speciesKey', LON_COL, LAT_COL) or col in ranks or col in {f"{r}Key" for r in ranks}
+
+def _assign_groups(chunk):
+    """Clave del grupo de cada registro (0 si no pertenece a ninguno)."""
+    group = np.zeros(len(chunk), dtype=np.int64)
+    for key, (rank, name) in TAXON_GROUP_RANKS.items():
+        if f"{rank}Key" in chunk.columns:
+            member = pd.to_numeric(chunk[f"{rank}Key"], errors='coerce').to_numpy() == key
+        elif rank in chunk.columns:
+            member = (chunk[rank] == name).to_numpy()
+        else:
+            continue
+        group[member & (group == 0)] = key
+    return group
+
+def _prepare_chunk(chunk):
+    """Filtra un bloque del archivo de GBIF y lo deja con STORE_COLUMNS + celda."""
+    df = pd.DataFrame({
+        'taxonKey': pd.to_numeric(chunk['taxonKey'], errors='coerce'),
+        'speciesKey': pd.to_numeric(chunk['speciesKey'], errors='coerce'),
+        LON_COL: pd.to_numeric(chunk[LON_COL], errors='coerce'),
+        LAT_COL: pd.to_numeric(chunk[LAT_COL], errors='coerce'),
+        'grupoKey': _assign_groups(chunk)
+    })
+    df = df.dropna()
+    df = df[df['grupoKey'] > 0].astype({'taxonKey': 'int64', 'speciesKey': 'int64', 'grupoKey': 'int32'})
+    df['celda'] = _cell_names(df[LON_COL].to_numpy(), df[LAT_COL].to_numpy())
+    return df
+
+def _cell_names(lon, lat):
+    ix = np.floor(lon / CELL_DEG).astype(int)
+    iy = np.floor(lat / CELL_DEG).astype(int)
+    return pd.Series(ix).astype(str).str.cat(pd.Series(iy).astype(str), sep='_').to_numpy()
+
+def _cell_path(store_dir, ix, iy):
+    return store_dir / f"celda_{ix}_{iy}.parquet"
+
+def ingest_gbif_download(source, output_dir=GBIF_STORE_DIR, chunk_size=CHUNK_SIZE):
+    """
+    Ingresa una descarga de GBIF al almacén local (reemplaza el contenido anterior).
+    Primero reparte los bloques por celda en un directorio temporal y luego
+    ordena cada celda por coordenadas en un único Parquet.
+    """
+    output_dir = Path(output_dir)
+    staging = output_dir / "_staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    total = kept = 0
+    with _open_occurrences(source) as handle:
+        reader = pd.read_csv(
+            handle, sep='\t', usecols=_wanted_column, dtype=str, quoting=3,
+            chunksize=chunk_size, on_bad_lines='skip'
+        )
+        for i, chunk in enumerate(reader):
+            total += len(chunk)
+            df = _prepare_chunk(chunk)
+            kept += len(df)
+            for cell, part in df.groupby('celda'):
+                cell_dir = staging / cell
+                cell_dir.mkdir(exist_ok=True)
+                part[STORE_COLUMNS].to_parquet(cell_dir / f"part-{i:05d}.parquet", index=False)
+            print(f"🐸 {total} registros leídos, {kept} en grupos de interés")
+
+    for old in output_dir.glob("celda_*.parquet"):
+        old.unlink()
+    for cell_dir in staging.iterdir():
+        df = pd.read_parquet(cell_dir).sort_values([LAT_COL, LON_COL])
+        ix, iy = cell_dir.name.split('_')
+        pq.write_table(
+            pa.Table.from_pandas(df, preserve_index=False), _cell_path(output_dir, ix, iy),
+            row_group_size=ROW_GROUP_SIZE, compression='zstd'
+        )
+    shutil.rmtree(staging)
+
+    manifest = {'source': Path(source).name, 'records': kept, 'mtime': Path(source).stat().st_mtime}
+    (output_dir / MANIFEST_NAME).write_text(json.dumps(manifest))
+    print(f"✅ Almacén GBIF: {kept} ocurrencias -> {output_dir}")
+
+    build_species_index(output_dir, output_dir / SPECIES_INDEX_DIR.name)
+    return output_dir
+
+# ===================== ÍNDICE DE CONJUNTOS POR CELDA =====================
+def _index_cell_keys(lon, lat):
+    """Clave entera de la celda del índice (orden: columna y luego fila)."""
+    ix = np.floor(np.asarray(lon) / INDEX_CELL_DEG).astype(np.int64) + _CELL_OFFSET
+    iy = np.floor(np.asarray(lat) / INDEX_CELL_DEG).astype(np.int64) + _CELL_OFFSET
+    return (ix << 21) | iy
+
+def _pair_keys(groups, species):
+    """Clave (grupoKey, speciesKey) en un entero: grupo en los 32 bits altos."""
+    return (np.asarray(groups, dtype=np.uint64) << np.uint64(32)) | np.asarray(species, dtype=np.uint64)
+
+def _csr(keys):
+    """Celdas únicas y offsets de sus elementos (keys ya ordenadas por celda)."""
+    cells, starts = np.unique(keys, return_index=True)
+    return cells, np.append(starts, len(keys)).astype(np.int64)
+
+def build_species_index(store_dir=GBIF_STORE_DIR, index_dir=SPECIES_INDEX_DIR):
+    """Construye el índice de conjuntos de especies por celda a partir del almacén."""
+    store_dir, index_dir = Path(store_dir), Path(index_dir)
+    files = sorted(store_dir.glob("celda_*.parquet"))
+    if not files:
+        raise FileNotFoundError(f"Almacén GBIF vacío: {store_dir}")
+
+    table = pq.read_table(files[0]) if len(files) == 1 else ds.dataset([str(f) for f in files]).to_table()
+    lon = table[LON_COL].to_numpy()
+    lat = table[LAT_COL].to_numpy()
+    cells = _index_cell_keys(lon, lat)
+    pairs = _pair_keys(table['grupoKey'].to_numpy(), table['speciesKey'].to_numpy())
+    del table
+
+    # Puntos ordenados por celda (para el cálculo exacto en celdas de borde)
+    order = np.lexsort((pairs, cells))
+    cells, pairs, lon, lat = cells[order], pairs[order], lon[order], lat[order]
+    index_cells, point_offsets = _csr(cells)
+
+    # Conjuntos: pares (celda, clave) únicos; quedan ordenados por celda y clave
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = (cells[1:] != cells[:-1]) | (pairs[1:] != pairs[:-1])
+    _, set_offsets = _csr(cells[first])
+
+    # Se escribe aparte y se intercambia: nunca se sobrescribe un .npy abierto con mmap
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    old_dir = index_dir.with_name(index_dir.name + ".old")
+    for leftover in (tmp_dir, old_dir):
+        shutil.rmtree(leftover, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    arrays = {
+        'celdas': index_cells, 'conjuntos_offsets': set_offsets, 'conjuntos': pairs[first],
+        'puntos_offsets': point_offsets, 'puntos_lon': lon, 'puntos_lat': lat, 'puntos_clave': pairs
+    }
+    for name, values in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", values)
+    manifest = json.loads((store_dir / MANIFEST_NAME).read_text()) if (store_dir / MANIFEST_NAME).exists() else {}
+    (tmp_dir / MANIFEST_NAME).write_text(json.dumps({**manifest, 'cell_deg': INDEX_CELL_DEG}))
+
+    # os.replace no reemplaza un directorio con contenido: el anterior se aparta primero
+    if index_dir.exists():
+        os.replace(index_dir, old_dir)
+    os.replace(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"✅ Índice de especies: {len(index_cells)} celdas, {first.sum()} pares celda-especie -> {index_dir}")
+    return index_dir
+
+def _index_version(index_dir):
+    """Versión del índice: inodo y fecha de su manifiesto (cambian al reconstruirlo). None si no existe."""
+    try:
+        stat = (Path(index_dir) / MANIFEST_NAME).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def _load_species_index(index_dir=SPECIES_INDEX_DIR):
+    """Arreglos del índice en mmap (se recargan si el índice se reconstruyó). None si no existe."""
+    index_dir = Path(index_dir)
+    version = _index_version(index_dir)
+    with _LOCK:
+        cached = _INDEX.get(str(index_dir))
+        if cached is not None and cached['version'] == version:
+            return cached['arrays']
+        _INDEX.pop(str(index_dir), None)
+        if version is None:
+            return None
+        try:
+            if json.loads((index_dir / MANIFEST_NAME).read_text()).get('cell_deg') != INDEX_CELL_DEG:
+                return None
+            arrays = {name: np.load(index_dir / f"{name}.npy", mmap_mode='r') for name in _INDEX_ARRAYS}
+        except FileNotFoundError:
+            # Intercambio en curso: esta consulta usa el almacén y la siguiente recarga
+            return None
+        _INDEX[str(index_dir)] = {'version': version, 'arrays': arrays}
+        return arrays
+
+def _gather(offsets, positions):
+    """Índices de los elementos de las celdas `positions` en un arreglo CSR."""
+    starts, ends = offsets[positions], offsets[positions + 1]
+    lengths = ends - starts
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    shift = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return np.arange(lengths.sum()) + shift
+
+def _index_cells_in_bbox(cells, minx, miny, maxx, maxy):
+    """Posiciones en el índice de las celdas con datos dentro del bbox."""
+    ix0, iy0 = (math.floor(v / INDEX_CELL_DEG) + _CELL_OFFSET for v in (minx, miny))
+    ix1, iy1 = (math.floor(v / INDEX_CELL_DEG) + _CELL_OFFSET for v in (maxx, maxy))
+    columns = np.arange(ix0, ix1 + 1, dtype=np.int64) << 21
+    lo = np.searchsorted(cells, columns | iy0)
+    hi = np.searchsorted(cells, columns | iy1, side='right')
+    lengths = hi - lo
+    return np.repeat(lo - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+
+def _species_pairs_indexed(polygon, index):
+    """Claves (grupo, especie) distintas presentes en el polígono según el índice."""
+    cells = index['celdas']
+    positions = _index_cells_in_bbox(cells, *polygon.bounds)
+    if len(positions) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    keys = cells[positions]
+    x0 = ((keys >> 21) - _CELL_OFFSET) * INDEX_CELL_DEG
+    y0 = ((keys & (2 ** 21 - 1)) - _CELL_OFFSET) * INDEX_CELL_DEG
+    boxes = shapely.box(x0, y0, x0 + INDEX_CELL_DEG, y0 + INDEX_CELL_DEG)
+    shapely.prepare(polygon)
+    inner = shapely.contains(polygon, boxes)
+    border = ~inner & shapely.intersects(polygon, boxes)
+
+    # Celdas completamente dentro: unión de los conjuntos precalculados
+    found = [index['conjuntos'][_gather(index['conjuntos_offsets'], positions[inner])]]
+
+    # Celdas de borde: punto en polígono exacto solo sobre sus puntos
+    idx = _gather(index['puntos_offsets'], positions[border])
+    if len(idx):
+        inside = shapely.intersects_xy(polygon, index['puntos_lon'][idx], index['puntos_lat'][idx])
+        found.append(index['puntos_clave'][idx[inside]])
+    return np.unique(np.concatenate(found))
+
+def _counts_from_pairs(pairs, taxon_groups):
+    groups = pairs >> np.uint64(32)
+    return {name: int(np.count_nonzero(groups == key)) for name, key in taxon_groups.items()}
+
+# ===================== CONSULTA =====================
+def has_local_store(store_dir=GBIF_STORE_DIR):
+    """True si ya se ingresó una descarga de GBIF."""
+    return (Path(store_dir) / MANIFEST_NAME).exists()
+
+def store_version(store_dir=GBIF_STORE_DIR):
+    """Manifiesto de la descarga ingresada (identifica su versión) o None."""
+    manifest = Path(store_dir) / MANIFEST_NAME
+    return json.loads(manifest.read_text()) if manifest.exists() else None
+
+def _read_points(polygon, store_dir):
+    """Ocurrencias del bbox del polígono (celdas y row groups podados)."""
+    minx, miny, maxx, maxy = polygon.bounds
+    files = [
+        str(path)
+        for ix in range(math.floor(minx / CELL_DEG), math.floor(maxx / CELL_DEG) + 1)
+        for iy in range(math.floor(miny / CELL_DEG), math.floor(maxy / CELL_DEG) + 1)
+        if (path := _cell_path(store_dir, ix, iy)).exists()
+    ]
+    if not files:
+        return None
+
+    lon, lat = ds.field(LON_COL), ds.field(LAT_COL)
+    table = ds.dataset(files, format='parquet').to_table(
+        columns=['speciesKey', 'grupoKey', LON_COL, LAT_COL],
+        filter=(lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy)
+    )
+    count('bytes_leidos', table.nbytes)
+    count('puntos_leidos', table.num_rows)
+    return table
+
+@traced()
+def count_species_local(polygon, taxon_groups, store_dir=GBIF_STORE_DIR):
+    """
+    Especies distintas (speciesKey) por grupo dentro del polígono (WGS84).
+    Args:
+        taxon_groups (dict): {nombre del grupo: taxonKey}, como TAXON_GROUPS.
+    Returns:
+        dict: {nombre del grupo: riqueza}
+    """
+    index = _load_species_index(Path(store_dir) / SPECIES_INDEX_DIR.name)
+    if index is not None:
+        return _counts_from_pairs(_species_pairs_indexed(polygon, index), taxon_groups)
+
+    counts = dict.fromkeys(taxon_groups, 0)
+    table = _read_points(polygon, Path(store_dir))
+    if table is None or table.num_rows == 0:
+        return counts
+
+    shapely.prepare(polygon)
+    inside = shapely.intersects_xy(polygon, table[LON_COL].to_numpy(), table[LAT_COL].to_numpy())
+    species = table['speciesKey'].to_numpy()[inside]
+    groups = table['grupoKey'].to_numpy()[inside]
+
+    for name, key in taxon_groups.items():
+        counts[name] = len(np.unique(species[groups == key]))
+    return counts
+
+def count_species_batch(polygons, taxon_groups, store_dir=GBIF_STORE_DIR):
+    """
+    Riqueza por grupo para muchos polígonos (WGS84) con el índice por celda.
+    Returns:
+        pd.DataFrame: Una fila por polígono (mismo orden) y una columna por grupo.
+    """
+    index = _load_species_index(Path(store_dir) / SPECIES_INDEX_DIR.name)
+    if index is None:
+        rows = [count_species_local(p, taxon_groups, store_dir) for p in polygons]
+    else:
+        rows = [_counts_from_pairs(_species_pairs_indexed(p, index), taxon_groups) for p in polygons]
+    return pd.DataFrame(rows, columns=list(taxon_groups))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingresa una descarga de GBIF (DwC-A o simple CSV) al almacén local.")
+    parser.add_argument("source", type=Path, nargs='?', help="Archivo .zip (DwC-A) o .csv/.txt de ocurrencias")
+    parser.add_argument("--output", type=Path, default=GBIF_STORE_DIR)
+    parser.add_argument("--solo-indice", action="store_true", help="Solo reconstruye el índice de especies por celda")
+    args = parser.parse_args()
+    if args.source is None and not args.solo_indice:
+        parser.error("falta `source` (la descarga a ingresar), salvo con --solo-indice")
+    if args.solo_indice:
+        build_species_index(args.output, args.output / SPECIES_INDEX_DIR.name)
+    else:
+        ingest_gbif_download(args.source, args.output)
@@ -0,0 +1,106 @@
+"""
+Almacén de capas vectoriales residente en el proceso.
+
+Cada capa de LAYER_CONFIG se lee una sola vez por proceso (GeoParquet si existe,
+si no el GPKG) y queda en memoria como un arreglo de geometrías shapely 2 más su
+STRtree. Como vive a nivel de módulo, lo comparten todas las sesiones de
+Streamlit del mismo servidor. Las consultas usan `STRtree.query(predicate='intersects')`,
+que prepara el polígono y evalúa el predicado de forma vectorizada.
+"""
+import threading
+import geopandas as gpd
+import pandas as pd
+import shapely
+from src.analysis.extract_vector import GPKG_PATH, PARQUET_DIR, LAYER_CONFIG, _required_columns, _lod_path
+from src.analysis.tracing import traced
+
+# Capas cargadas: {(nombre, lod): VectorLayer}
+_LAYERS = {}
+# Un lock por capa para que la carga de capas distintas ocurra en paralelo
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+class VectorLayer:
+    """Geometrías, atributos e índice espacial de una capa."""
+
+    def __init__(self, name, gdf, source=None):
+        self.name = name
+        self.source = source
+        self.crs = gdf.crs
+        self.geometries = gdf.geometry.to_numpy()
+        self.attributes = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).reset_index(drop=True)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self):
+        return len(self.geometries)
+
+    def query_index(self, geometry):
+        """Posiciones (ordenadas) de los features que intersectan `geometry`."""
+        idx = self.tree.query(geometry, predicate='intersects')
+        idx.sort()
+        return idx
+
+    def query(self, geometry):
+        """
+        Features que intersectan `geometry` (en el CRS de la capa).
+        Returns:
+            gpd.GeoDataFrame: Features candidatos en el orden original de la capa.
+        """
+        idx = self.query_index(geometry)
+        return gpd.GeoDataFrame(
+            self.attributes.iloc[idx].reset_index(drop=True),
+            geometry=self.geometries[idx],
+            crs=self.crs
+        )
+
+@traced()
+def _read_full_layer(layer_name, lod=0):
+    """
+    Lee la capa completa con solo las columnas que usa el resumen. Retorna (gdf, ruta).
+    Con `lod` > 0 lee la versión simplificada con esa tolerancia (solo GeoParquet).
+    """
+    source = _lod_path(layer_name, lod) if lod else PARQUET_DIR / f"{layer_name}.parquet"
+    if lod and not source.exists():
+        raise FileNotFoundError(f"No existe el LOD {lod} m de {layer_name}: ejecuta prepare_vectors")
+    if source.exists():
+        gdf = gpd.read_parquet(source)
+    elif GPKG_PATH.exists():
+        source = GPKG_PATH
+        gdf = gpd.read_file(GPKG_PATH, layer=layer_name)
+    else:
+        raise FileNotFoundError(f"No hay fuente para la capa {layer_name} (GPKG/GeoParquet)")
+
+    columns = _required_columns([c for c in gdf.columns if c != gdf.geometry.name], layer_name)
+    gdf = gdf[columns + [gdf.geometry.name]]
+    return gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty], source
+
+def get_layer(layer_name, lod=0):
+    """
+    Retorna la capa indexada, cargándola la primera vez que se pide en el proceso.
+    `lod` es la tolerancia de simplificación (m) de la versión a usar; 0 = original.
+    """
+    key = (layer_name, lod)
+    layer = _LAYERS.get(key)
+    if layer is not None:
+        return layer
+
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _LAYERS:
+            print(f"📦 Cargando capa {layer_name}{f' (LOD {lod} m)' if lod else ''} en memoria...")
+            gdf, source = _read_full_layer(layer_name, lod)
+            _LAYERS[key] = VectorLayer(layer_name, gdf, source)
+    return _LAYERS[key]
+
+def warm_up(layer_names=None):
+    """Precarga capas (por defecto, todas las de LAYER_CONFIG) para que la primera consulta sea rápida."""
+    for layer_name in layer_names or LAYER_CONFIG:
+        try:
+            get_layer(layer_name)
+        except Exception as e:
+            print(f"❌ Error cargando {layer_name}: {e}")
+
+def clear():
+    """Libera las capas cargadas (p.ej. tras regenerar los datos)."""
+    _LAYERS.clear()
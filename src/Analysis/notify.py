@@ -0,0 +1,56 @@
+"""
+Avisos de los módulos de análisis sin depender de la interfaz.
+
+Los módulos llaman notify.error / notify.warning en lugar de st.error /
+st.warning; quién los muestra lo decide quien ejecuta. Por defecto se imprimen
+en consola (CLI, lotes); main.py instala un manejador que los pinta con
+Streamlit, y `capture()` los junta en una lista del hilo actual (p.ej. para
+guardarlos con el resultado de cada etapa o polígono).
+"""
+import contextlib
+import threading
+
+ICONS = {'info': "ℹ️", 'warning': "⚠️", 'error': "❌"}
+
+_CAPTURE = threading.local()
+
+def _print_handler(level, message):
+    print(f"{ICONS.get(level, '')} {message}")
+
+_HANDLER = {'func': _print_handler}
+
+def set_handler(handler):
+    """Instala el manejador `handler(level, message)`; None vuelve a imprimir en consola."""
+    _HANDLER['func'] = handler or _print_handler
+
+def notify(level, message):
+    """Entrega el aviso a la captura activa del hilo o, si no hay, al manejador."""
+    captured = getattr(_CAPTURE, 'messages', None)
+    if captured is not None:
+        captured.append((level, message))
+        return
+    _HANDLER['func'](level, message)
+
+def info(message):
+    notify('info', message)
+
+def warning(message):
+    notify('warning', message)
+
+def error(message):
+    notify('error', message)
+
+@contextlib.contextmanager
+def capture():
+    """
+    Junta los avisos emitidos en este hilo dentro del bloque.
+        with notify.capture() as mensajes:
+            extract_forest_info(poly)
+        # mensajes == [('warning', '...'), ...]
+    """
+    previous = getattr(_CAPTURE, 'messages', None)
+    _CAPTURE.messages = []
+    try:
+        yield _CAPTURE.messages
+    finally:
+        _CAPTURE.messages = previous
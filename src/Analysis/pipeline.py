@@ -0,0 +1,201 @@
+"""
+Motor mínimo de etapas (DAG) para el diagnóstico.
+
+Cada etapa declara las claves del contexto que consume (`inputs`) y las que
+produce (`outputs`). Una etapa arranca apenas sus entradas están disponibles,
+en un pool de hilos (I/O, GEOS, rasterio) o en su propio proceso, con su propio
+timeout. `run_pipeline` es un generador: a medida que cada etapa termina escribe
+sus salidas en el contexto y emite un evento, así la interfaz puede mostrar
+resultados parciales y el tiempo total se acerca al de la etapa más lenta.
+
+Cancelación: con `cancel_event` o cerrando el generador (p.ej. cuando Streamlit
+interrumpe el script por una nueva interacción). Las etapas pendientes no
+arrancan y las que corren se abandonan; las de proceso se terminan.
+
+Uso:
+    stages = [Stage('raster', fn, inputs=('geometry',), outputs=('raster_data',), timeout=120)]
+    for event in run_pipeline(stages, context):
+        print(event['stage'], event['status'])
+"""
+import concurrent.futures
+import time
+from src.analysis.tracing import span, copy_context_call
+
+# Estados finales de una etapa
+DONE = 'ok'
+FAILED = 'error'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelada'
+SKIPPED = 'omitida'
+
+# Intervalo máximo entre revisiones de timeouts y cancelación (s)
+POLL_S = 0.1
+
+class Stage:
+    """
+    Etapa del pipeline.
+    Args:
+        name (str): Nombre único.
+        func (callable): Recibe las entradas como argumentos con nombre y retorna un
+            dict con (al menos) sus salidas; otras claves viajan solo en el evento.
+        inputs (tuple): Claves del contexto que consume.
+        outputs (tuple): Claves del contexto que produce.
+        timeout (float): Segundos máximos desde que arranca (None = sin límite).
+        pool (str): 'thread' o 'process' (func y entradas deben ser serializables;
+            los spans de tracing no cruzan al proceso).
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), timeout=None, pool='thread'):
+        if pool not in ('thread', 'process'):
+            raise ValueError(f"Pool no soportado: {pool}")
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.timeout = timeout
+        self.pool = pool
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+def _producers(stages, context):
+    """{salida: etapa} validando nombres y que cada entrada tenga origen."""
+    names, producers = set(), {}
+    for stage in stages:
+        if stage.name in names:
+            raise ValueError(f"Etapa duplicada: {stage.name}")
+        names.add(stage.name)
+        for key in stage.outputs:
+            if key in producers:
+                raise ValueError(f"'{key}' lo producen {producers[key]} y {stage.name}")
+            producers[key] = stage.name
+    for stage in stages:
+        for key in stage.inputs:
+            if key not in producers and key not in context:
+                raise ValueError(f"{stage.name}: la entrada '{key}' no está en el contexto ni la produce otra etapa")
+    return producers
+
+def _event(stage, status, started=None, outputs=None, error=None):
+    return {
+        'stage': stage.name,
+        'status': status,
+        'outputs': outputs or {},
+        'error': error,
+        'elapsed_s': time.perf_counter() - started if started else 0.0
+    }
+
+def _run_stage(stage, kwargs):
+    """Etapa en un hilo del pool, como span hijo de la traza de quien corre el pipeline."""
+    with span(f"etapa.{stage.name}"):
+        return stage.func(**kwargs)
+
+def _kill_process_pool(pool):
+    """Termina los procesos del pool (concurrent.futures no cancela tareas en curso)."""
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def run_pipeline(stages, context, max_workers=None, cancel_event=None, thread_initializer=None):
+    """
+    Ejecuta las etapas en paralelo respetando sus dependencias.
+    Args:
+        stages (list[Stage]): Etapas (el orden solo desempata el arranque).
+        context (dict): Contexto compartido; recibe las salidas de cada etapa.
+        max_workers (int): Hilos del pool (por defecto, uno por etapa).
+        cancel_event (threading.Event): Si se activa, se cancela lo pendiente.
+        thread_initializer (callable): Se ejecuta al iniciar cada hilo del pool
+            (p.ej. para adjuntar el contexto de ejecución de Streamlit).
+    Yields:
+        dict: {'stage', 'status', 'outputs', 'error', 'elapsed_s'} por cada etapa.
+    """
+    producers = _producers(stages, context)
+    finished = {}                      # etapa -> estado final
+    pending = list(stages)
+    running = {}                       # future -> (etapa, inicio, pool de proceso)
+    threads = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or len(stages) or 1, initializer=thread_initializer
+    )
+
+    def blocked(stage):
+        """True si alguna entrada viene de una etapa que no terminó bien."""
+        return any(finished.get(producers.get(key), DONE) != DONE for key in stage.inputs if key in producers)
+
+    def ready(stage):
+        return all(finished.get(producers[key]) == DONE if key in producers else True for key in stage.inputs)
+
+    def abandon(future, process_pool):
+        future.cancel()
+        if process_pool is not None:
+            _kill_process_pool(process_pool)
+
+    try:
+        while pending or running:
+            if cancel_event is not None and cancel_event.is_set():
+                for future, (stage, started, process_pool) in list(running.items()):
+                    abandon(future, process_pool)
+                    yield _event(stage, CANCELLED, started)
+                for stage in pending:
+                    yield _event(stage, CANCELLED)
+                return
+
+            # 1. Arrancar lo que ya tiene sus entradas (u omitir si alguna falló)
+            waiting = len(pending)
+            for stage in list(pending):
+                if blocked(stage):
+                    pending.remove(stage)
+                    finished[stage.name] = SKIPPED
+                    yield _event(stage, SKIPPED, error="dependencia sin resultado")
+                elif ready(stage):
+                    pending.remove(stage)
+                    kwargs = {key: context[key] for key in stage.inputs}
+                    process_pool = None
+                    if stage.pool == 'process':
+                        process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+                        future = process_pool.submit(stage.func, **kwargs)
+                    else:
+                        future = threads.submit(copy_context_call(_run_stage), stage, kwargs)
+                    running[future] = (stage, time.perf_counter(), process_pool)
+
+            if not running:
+                if len(pending) == waiting:
+                    raise ValueError(f"Dependencias circulares entre {[stage.name for stage in pending]}")
+                continue
+
+            # 2. Esperar la primera que termine (o el próximo timeout)
+            now = time.perf_counter()
+            deadlines = [started + stage.timeout - now for stage, started, _ in running.values() if stage.timeout]
+            wait_s = max(0, min([POLL_S] + deadlines))
+            done, _ = concurrent.futures.wait(running, timeout=wait_s, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                stage, started, process_pool = running.pop(future)
+                if process_pool is not None:
+                    process_pool.shutdown(wait=False)
+                try:
+                    result = future.result()
+                    if not isinstance(result, dict):
+                        raise TypeError(f"{stage.name} debe retornar un dict, no {type(result).__name__}")
+                    missing = [key for key in stage.outputs if key not in result]
+                    if missing:
+                        raise KeyError(f"{stage.name} no produjo {missing}")
+                except Exception as e:
+                    finished[stage.name] = FAILED
+                    yield _event(stage, FAILED, started, error=str(e) or type(e).__name__)
+                    continue
+                context.update({key: result[key] for key in stage.outputs})
+                finished[stage.name] = DONE
+                yield _event(stage, DONE, started, outputs=result)
+
+            # 3. Vencidas: se abandonan y sus dependientes se omiten
+            now = time.perf_counter()
+            for future, (stage, started, process_pool) in list(running.items()):
+                if stage.timeout and now - started >= stage.timeout:
+                    running.pop(future)
+                    abandon(future, process_pool)
+                    finished[stage.name] = TIMEOUT
+                    yield _event(stage, TIMEOUT, started, error=f"superó {stage.timeout} s")
+    finally:
+        # Cierre sin esperar: un hilo vencido sigue hasta terminar, pero su resultado se descarta
+        for future, (_, _, process_pool) in running.items():
+            abandon(future, process_pool)
+        threads.shutdown(wait=False, cancel_futures=True)
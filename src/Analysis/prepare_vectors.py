@@ -0,0 +1,89 @@
+"""
+Preparación offline de las capas vectoriales (SIPRA/RUNAP) para consulta rápida.
+
+Exporta cada capa del GeoPackage a GeoParquet ordenado espacialmente (curva de
+Hilbert) con columnas minx/miny/maxx/maxy y row groups pequeños. Así las
+estadísticas min/max de cada row group quedan compactas y `extract_vector_info`
+(format_type='parquet') puede descartar row groups completos sin leerlos.
+
+Las geometrías se guardan ya proyectadas a EQUAL_AREA_CRS junto con su área por
+feature ('area_ha'), de modo que en consulta solo se reproyecta el polígono del
+usuario y los features completamente dentro no se vuelven a medir.
+
+Además se escribe una versión simplificada por cada tolerancia de LOD_TOLERANCES_M
+(`<capa>__lod<tol>.parquet`, simplificación que preserva la topología) y la capa base
+guarda por feature el área de la diferencia simétrica con cada una ('lod_err_<tol>'),
+que es la cota de error con la que la consulta elige el nivel de detalle.
+
+Uso:
+    python -m src.analysis.prepare_vectors                 # todas las capas de LAYER_CONFIG
+    python -m src.analysis.prepare_vectors runap__registro_unico_nacional_ap
+"""
+import argparse
+import geopandas as gpd
+import shapely
+from src.analysis.extract_vector import (
+    GPKG_PATH, PARQUET_DIR, LAYER_CONFIG, AREA_COL, EQUAL_AREA_CRS, LOD_TOLERANCES_M, LOD_ERROR_PREFIX, _lod_path
+)
+
+# Features por row group: más pequeño = poda más fina, más metadatos
+ROW_GROUP_SIZE = 2000
+
+def _write_geoparquet(gdf, output_path, row_group_size):
+    """Escribe el GeoParquet con las columnas de bbox por feature."""
+    bounds = gdf.bounds
+    for col in ['minx', 'miny', 'maxx', 'maxy']:
+        gdf[col] = bounds[col]
+    gdf.to_parquet(output_path, compression='snappy', schema_version="1.0.0", row_group_size=row_group_size)
+
+def export_layer_geoparquet(layer_name, output_dir=PARQUET_DIR, row_group_size=ROW_GROUP_SIZE,
+                            lod_tolerances=LOD_TOLERANCES_M):
+    """
+    Exporta una capa del GPKG a GeoParquet de áreas iguales, ordenado y con columnas de
+    bbox, más sus versiones simplificadas (LOD).
+    """
+    gdf = gpd.read_file(GPKG_PATH, layer=layer_name)
+    gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+    if gdf.crs is None:
+        gdf = gdf.set_crs("EPSG:4326")
+
+    # Geometrías en áreas iguales y área por feature precalculada
+    gdf = gdf.to_crs(EQUAL_AREA_CRS)
+    gdf[AREA_COL] = gdf.area / 10000
+
+    # Orden espacial para que cada row group cubra una zona compacta
+    gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort()].reset_index(drop=True)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    geoms = gdf.geometry.to_numpy()
+    for tolerance in lod_tolerances:
+        # Las versiones simplificadas conservan 'area_ha' original para los features no recortados
+        simplified = shapely.simplify(geoms, tolerance, preserve_topology=True)
+        gdf[f"{LOD_ERROR_PREFIX}{tolerance}"] = shapely.area(shapely.symmetric_difference(geoms, simplified)) / 10000
+
+        lod_gdf = gdf.drop(columns=[c for c in gdf.columns if c.startswith(LOD_ERROR_PREFIX)])
+        lod_gdf = lod_gdf.set_geometry(gpd.GeoSeries(simplified, index=gdf.index, crs=gdf.crs))
+        lod_path = output_dir / _lod_path(layer_name, tolerance).name
+        _write_geoparquet(lod_gdf, lod_path, row_group_size)
+        reduction = shapely.get_num_coordinates(simplified).sum() / max(shapely.get_num_coordinates(geoms).sum(), 1)
+        print(f"   LOD {tolerance} m: {reduction:.0%} de los vértices -> {lod_path}")
+
+    output_path = output_dir / f"{layer_name}.parquet"
+    _write_geoparquet(gdf, output_path, row_group_size)
+    print(f"✅ {layer_name}: {len(gdf)} features -> {output_path}")
+    return output_path
+
+def prepare_layers(layer_names=None):
+    """Exporta las capas indicadas (por defecto, todas las de LAYER_CONFIG)."""
+    for layer_name in layer_names or LAYER_CONFIG:
+        try:
+            export_layer_geoparquet(layer_name)
+        except Exception as e:
+            print(f"❌ Error preparando {layer_name}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepara las capas vectoriales para consulta rápida.")
+    parser.add_argument("layers", nargs="*", help="Capas a exportar (por defecto, todas)")
+    args = parser.parse_args()
+    prepare_layers(args.layers)
@@ -0,0 +1,196 @@
+"""
+Caché persistente de resultados por geometría (GBIF, GEE, SIPRA).
+
+Un único archivo SQLite (modo WAL) en disco, compartido entre procesos y que
+sobrevive a reinicios. La clave combina la huella canónica de la geometría
+(normalizada, redondeada a ~1 cm, anillos exteriores antihorarios y WKB
+hasheado con SHA-256) con la fuente, el dataset, su versión y los parámetros de
+la llamada. Cada fuente tiene su propio TTL y el archivo completo un límite de
+tamaño: al superarlo se eliminan las entradas usadas hace más tiempo (LRU).
+
+Uso:
+    @persistent_cache('gbif', dataset='occurrence', version=lambda params: ...)
+    def fetch_biodiversity_data(polygon, source='auto'): ...
+"""
+import contextlib
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import sqlite3
+import time
+import shapely
+from pathlib import Path
+from shapely.geometry.base import BaseGeometry
+from src.analysis.tracing import count
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+CACHE_PATH = PROJECT_ROOT / "data" / "cache" / "resultados.sqlite"
+
+# Vigencia por fuente (segundos). Las URLs de teselas de GEE (getMapId) expiran en
+# pocas horas, por eso sus resultados viven menos que los de GBIF o SIPRA.
+CACHE_TTL_S = {
+    'gbif': 7 * 24 * 3600,
+    'gee': 6 * 3600,
+    'sipra': 90 * 24 * 3600
+}
+DEFAULT_TTL_S = 24 * 3600
+
+# Tamaño máximo de los valores guardados (bytes)
+CACHE_MAX_BYTES = 512 * 1024 ** 2
+
+# Rejilla de redondeo de la huella (grados): ~1 cm
+FINGERPRINT_GRID = 1e-7
+
+_MISSING = object()
+
+# ===================== CLAVES =====================
+def geometry_fingerprint(geometry):
+    """
+    Huella canónica de una geometría: el mismo polígono dibujado desde otro vértice,
+    en otro sentido o con ruido por debajo de FINGERPRINT_GRID produce la misma huella.
+    """
+    geom = shapely.set_precision(geometry, FINGERPRINT_GRID)
+    geom = shapely.orient_polygons(shapely.normalize(geom))
+    return hashlib.sha256(shapely.to_wkb(geom, hex=False, output_dimension=2)).hexdigest()
+
+def cache_key(geometry, source, dataset, version, params):
+    """Clave de la entrada: huella + fuente + dataset + versión + parámetros."""
+    payload = json.dumps(
+        {'geom': geometry_fingerprint(geometry), 'source': source, 'dataset': dataset,
+         'version': version, 'params': params},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# ===================== ALMACENAMIENTO =====================
+def _connect(path=None):
+    """Conexión nueva por operación (sqlite3 no comparte conexiones entre hilos)."""
+    path = path or CACHE_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires REAL NOT NULL,
+            accessed REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON entries (accessed)")
+    return conn
+
+@contextlib.contextmanager
+def _session(path=None):
+    """Transacción sobre una conexión que se cierra al terminar."""
+    conn = _connect(path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def get(key, path=None):
+    """Valor guardado o _MISSING si no existe o expiró."""
+    now = time.time()
+    with _session(path) as conn:
+        row = conn.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        if row[1] < now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return _MISSING
+        conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+    return pickle.loads(row[0])
+
+def put(key, source, value, ttl=None, path=None, max_bytes=CACHE_MAX_BYTES):
+    """Guarda un valor y aplica el límite de tamaño (LRU)."""
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    now = time.time()
+    ttl = ttl if ttl is not None else CACHE_TTL_S.get(source, DEFAULT_TTL_S)
+    with _session(path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (key, source, blob, len(blob), now + ttl, now)
+        )
+        _evict(conn, max_bytes, now)
+
+def _evict(conn, max_bytes, now):
+    """Borra lo expirado y, si aún sobra, las entradas menos usadas recientemente."""
+    conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= max_bytes:
+        return
+    excess = total - max_bytes
+    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        excess -= size
+        if excess <= 0:
+            break
+
+def clear(source=None, path=None):
+    """Vacía la caché completa o solo una fuente."""
+    with _session(path) as conn:
+        if source:
+            conn.execute("DELETE FROM entries WHERE source = ?", (source,))
+        else:
+            conn.execute("DELETE FROM entries")
+
+# ===================== DECORADOR =====================
+def persistent_cache(source, dataset=None, version=None, ignore=(), cache_if=None):
+    """
+    Cachea en disco una función cuyo primer argumento es la geometría.
+    Args:
+        source (str): Fuente ('gbif', 'gee', 'sipra'); define el TTL.
+        dataset (str | callable): Dataset consultado, o función de los parámetros.
+        version (str | callable): Versión del dataset, o función de los parámetros
+            (p.ej. la fecha de modificación del archivo fuente).
+        ignore (tuple): Parámetros que no forman parte de la clave.
+        cache_if (callable): Solo se guarda el resultado si retorna True
+            (p.ej. para no cachear errores o resultados parciales).
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        geom_param = next(iter(signature.parameters))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+            geometry = params.pop(geom_param)
+            if not isinstance(geometry, BaseGeometry) or geometry.is_empty:
+                return func(*args, **kwargs)
+            for name in ignore:
+                params.pop(name, None)
+
+            try:
+                key = cache_key(
+                    geometry, source,
+                    dataset(params) if callable(dataset) else dataset or func.__qualname__,
+                    version(params) if callable(version) else version,
+                    params
+                )
+                value = get(key)
+                if value is not _MISSING:
+                    count('cache_aciertos')
+                    return value
+                count('cache_fallos')
+            except Exception as e:
+                print(f"⚠️ Caché no disponible ({source}): {e}")
+                return func(*args, **kwargs)
+
+            result = func(*args, **kwargs)
+            if cache_if is None or cache_if(result):
+                try:
+                    put(key, source, result)
+                except Exception as e:
+                    print(f"⚠️ No se pudo guardar en caché ({source}): {e}")
+            return result
+        return wrapper
+    return decorator
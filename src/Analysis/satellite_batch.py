@@ -0,0 +1,161 @@
+"""
+Biomasa/CO2 (GEDI) y altura del dosel (Meta) para carteras de predios en GEE.
+
+En vez de una consulta por predio, los predios se envían como FeatureCollection
+y se reducen todos juntos con `reduceRegions` (mismo reductor, bandas y escala
+que analyze_satellite). La cartera se parte en bloques que respetan los límites
+de carga de GEE (tamaño del GeoJSON enviado y número de features por respuesta)
+y los bloques se envían en paralelo. Si un bloque falla por memoria, tiempo o
+tamaño, se parte en dos y se reintenta.
+
+Uso:
+    python -m src.analysis.satellite_batch predios.gpkg --id-col codigo --output biomasa.parquet
+"""
+import argparse
+import concurrent.futures
+import json
+import ee
+import pandas as pd
+import shapely
+from pathlib import Path
+from src.analysis.forest_batch import read_parcels, _valid_parcels
+from src.analysis.satellite_fetch import (
+    _agbd_image, _canopy_image, _stats_reducer, _band_stats, ensure_gee
+)
+from src.analysis.biomass_co2 import biomass_stats, canopy_stats, STATS_SCALE_M
+
+# Límites por bloque: la solicitud a GEE admite ~10 MB y getInfo hasta 5000
+# elementos; se deja margen para la expresión del cálculo y los resultados.
+MAX_CHUNK_BYTES = 4 * 1024 ** 2
+MAX_CHUNK_FEATURES = 500
+# Consultas simultáneas (GEE limita las solicitudes concurrentes por proyecto)
+MAX_CONCURRENT_CHUNKS = 6
+
+# Errores de GEE que se resuelven con bloques más pequeños
+SPLIT_ERRORS = ('memory', 'timed out', 'too large', 'payload', 'too many')
+
+# ===================== BLOQUES =====================
+def _chunk_items(items, max_bytes=MAX_CHUNK_BYTES, max_features=MAX_CHUNK_FEATURES):
+    """Agrupa (id, geojson) en bloques contiguos bajo los límites de tamaño y cantidad."""
+    chunks, current, size = [], [], 0
+    for item in items:
+        item_size = len(item[1])
+        if current and (size + item_size > max_bytes or len(current) >= max_features):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(item)
+        size += item_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _feature_collection(chunk):
+    """FeatureCollection del bloque; cada feature lleva su posición ('pid') y su área."""
+    features = [ee.Feature(ee.Geometry(json.loads(geojson)), {'pid': pid}) for pid, geojson in chunk]
+    return ee.FeatureCollection(features).map(lambda f: f.set('area_m2', f.geometry().area(1)))
+
+def _reduce_chunk(chunk):
+    """Estadísticas de un bloque en una sola ida y vuelta: {pid: propiedades}."""
+    fc = _feature_collection(chunk)
+    image = _agbd_image(fc.geometry()).addBands(_canopy_image())
+    reduced = image.reduceRegions(
+        collection=fc,
+        reducer=_stats_reducer(),
+        scale=STATS_SCALE_M,
+        tileScale=4
+    )
+    info = reduced.getInfo()
+    return {f['properties']['pid']: f['properties'] for f in info['features']}
+
+def _reduce_with_split(chunk):
+    """
+    Reduce el bloque; si GEE lo rechaza por tamaño, memoria o tiempo, lo parte en dos.
+    Returns:
+        tuple: ({pid: propiedades}, {pid: error})
+    """
+    try:
+        return _reduce_chunk(chunk), {}
+    except Exception as e:
+        message = str(e)
+        if len(chunk) > 1 and any(s in message.lower() for s in SPLIT_ERRORS):
+            half = len(chunk) // 2
+            left, left_errors = _reduce_with_split(chunk[:half])
+            right, right_errors = _reduce_with_split(chunk[half:])
+            return {**left, **right}, {**left_errors, **right_errors}
+        return {}, {pid: message for pid, _ in chunk}
+
+def _stats_row(props):
+    """Fila con las mismas columnas que las estadísticas de analyze_satellite."""
+    area_ha = (props.get('area_m2') or 0) / 10000
+    mean_agbd, std_agbd, pct_agbd = _band_stats(props, 'agbd')
+    mean_h, std_h, pct_h = _band_stats(props, 'height')
+    return {
+        "Área (ha)": round(area_ha, 2),
+        **biomass_stats(mean_agbd, area_ha, std_agbd, pct_agbd),
+        **canopy_stats(mean_h, std_h, pct_h)
+    }
+
+# ===================== API =====================
+def analyze_satellite_batch(parcels, id_col=None, max_workers=MAX_CONCURRENT_CHUNKS,
+                            max_chunk_bytes=MAX_CHUNK_BYTES, max_chunk_features=MAX_CHUNK_FEATURES):
+    """
+    Biomasa/CO2 y altura del dosel para muchos polígonos con reduceRegions.
+    Args:
+        parcels (gpd.GeoDataFrame): Predios (Polygon/MultiPolygon).
+        id_col (str): Columna identificadora; si es None se usa el índice.
+        max_workers (int): Bloques enviados a GEE en paralelo.
+        max_chunk_bytes (int): Tamaño máximo del GeoJSON de un bloque.
+        max_chunk_features (int): Predios máximos por bloque.
+    Returns:
+        pd.DataFrame: Una fila por predio con 'id' + las columnas de estadísticas de
+            biomasa y de altura del dosel. Los predios sin fila quedan en
+            `df.attrs['errores']` ({str(id): motivo}), como en extract_forest_info_batch.
+    """
+    if not ensure_gee():
+        raise RuntimeError("GEE no está inicializado.")
+
+    gdf, ids, invalid = _valid_parcels(parcels, id_col)
+    ids = ids.to_numpy()
+
+    results, errors = {}, {}
+    if len(gdf):
+        # Orden espacial (Hilbert): bloques compactos filtran menos escenas GEDI
+        geoms = gdf.geometry.to_crs("EPSG:4326")
+        order = geoms.hilbert_distance().argsort().to_numpy()
+        geojson = shapely.to_geojson(geoms.to_numpy()[order])
+        items = list(zip(order.tolist(), geojson.tolist()))
+
+        chunks = _chunk_items(items, max_chunk_bytes, max_chunk_features)
+        print(f"🛰️ GEE: {len(items)} predios en {len(chunks)} bloques de reduceRegions...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_results, chunk_errors in executor.map(_reduce_with_split, chunks):
+                results.update(chunk_results)
+                errors.update(chunk_errors)
+
+    if invalid:
+        print(f"⚠️ {len(invalid)} predios sin geometría poligonal.")
+    if errors:
+        print(f"⚠️ {len(errors)} predios con error en GEE.")
+
+    rows = [{'id': ids[pid], **_stats_row(results[pid])} for pid in sorted(results)]
+    result = pd.DataFrame(rows)
+    if id_col and not result.empty:
+        result = result.rename(columns={'id': id_col})
+    # Claves str: attrs se serializa a JSON al guardar en Parquet
+    result.attrs['errores'] = {**invalid, **{str(ids[pid]): message for pid, message in errors.items()}}
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Biomasa y altura del dosel (GEE) para un archivo de predios.")
+    parser.add_argument("input", type=Path, help="GeoPackage/Shapefile/Parquet de predios")
+    parser.add_argument("--layer", default=None, help="Capa dentro del GeoPackage")
+    parser.add_argument("--id-col", default=None, help="Columna identificadora del predio")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_CHUNKS, help="Bloques en paralelo")
+    parser.add_argument("--output", type=Path, default=Path("data/processed/biomasa_predios.parquet"))
+    args = parser.parse_args()
+
+    result = analyze_satellite_batch(read_parcels(args.input, args.layer), id_col=args.id_col, max_workers=args.workers)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    result.to_parquet(args.output, index=False)
+    print(f"✅ {len(result)} predios procesados -> {args.output}")
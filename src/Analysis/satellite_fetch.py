@@ -1,15 +1,34 @@
 import ee
-import streamlit as st
+import concurrent.futures
+import threading
+import time
 import pandas as pd
 from shapely.geometry import Polygon, MultiPolygon
 import os
 from dotenv import load_dotenv
+from src.analysis.result_cache import persistent_cache
+from src.analysis.tracing import traced, span, count
+from src.analysis.biomass_co2 import (
+    biomass_stats, canopy_stats, STATS_PERCENTILES, STATS_SCALE_M, BIOMASS_VIS, CANOPY_VIS,
+    SATELLITE_VERSION
+)
 
 # Cargar variables de entorno
 load_dotenv(os.path.join("config", ".env"))
 
+# Backend del paso satelital: 'gee' (Earth Engine), 'local' (exportaciones COG, ver
+# satellite_local.py) o 'auto' (GEE si conecta sin pedir credenciales; si no, las
+# exportaciones locales cuando existen)
+SATELLITE_BACKEND = os.getenv("SATELLITE_BACKEND", "auto")
+
 # ===================== INICIALIZACIÓN GEE =====================
 def initialize_gee():
+    """
+    Conecta con las credenciales ya guardadas, sin interacción: `ee.Authenticate()`
+    espera una respuesta del usuario (input o redirección local) y bloquearía la
+    app, los lotes y los equipos sin acceso a internet. Para autenticar una vez en
+    la máquina: `python -m src.analysis.satellite_fetch --autenticar`.
+    """
     try:
         project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
         print(f"🔌 GEE: Conectando con proyecto {project_id}...")
@@ -21,18 +40,58 @@ def initialize_gee():
         print("✅ GEE: Conexión exitosa.")
         return True
     except Exception as e:
-        print(f"⚠️ GEE: Fallo inicialización directa. Intentando autenticación local...")
-        try:
-            ee.Authenticate()
-            ee.Initialize()
-            print("✅ GEE: Conexión exitosa tras autenticación.")
+        print(f"❌ GEE Error (sin credenciales o sin conexión): {e}")
+        return False
+
+def authenticate_gee():
+    """Autenticación interactiva (navegador o código); solo desde una terminal."""
+    ee.Authenticate()
+    return initialize_gee()
+
+# Tras un fallo de conexión no se reintenta antes de este tiempo (s)
+GEE_RETRY_S = float(os.getenv("GEE_RETRY_S", "300"))
+# Espera máxima de otros hilos mientras un intento de conexión está en curso (s)
+GEE_INIT_WAIT_S = float(os.getenv("GEE_INIT_WAIT_S", "30"))
+
+# Estado de la conexión del proceso: 'ok', 'failed_at' y el intento en curso
+_GEE = {'ok': False, 'failed_at': None, 'attempt': None}
+_GEE_LOCK = threading.Lock()
+
+def ensure_gee():
+    """
+    Conecta con GEE la primera vez que se necesita (compartido por todas las
+    sesiones y por los workers de los lotes). No se llama al importar el módulo.
+    El lock solo protege el estado: la conexión corre fuera de él, así que un
+    intento colgado (y abandonado por el timeout del pipeline) no bloquea a los
+    demás hilos más de GEE_INIT_WAIT_S. Un fallo se recuerda GEE_RETRY_S y luego
+    se reintenta.
+    """
+    with _GEE_LOCK:
+        if _GEE['ok']:
             return True
-        except Exception as e2:
-            print(f"❌ GEE Error: {e2}")
+        if _GEE['failed_at'] is not None and time.monotonic() - _GEE['failed_at'] < GEE_RETRY_S:
             return False
+        attempt = _GEE['attempt']
+        owner = attempt is None
+        if owner:
+            attempt = _GEE['attempt'] = {'started': time.monotonic(), 'done': threading.Event()}
 
-if 'gee_initialized' not in st.session_state:
-    st.session_state['gee_initialized'] = initialize_gee()
+    if not owner:
+        waited = time.monotonic() - attempt['started']
+        attempt['done'].wait(max(0.0, GEE_INIT_WAIT_S - waited))
+        return _GEE['ok']
+
+    ok = False
+    try:
+        ok = initialize_gee()
+    finally:
+        with _GEE_LOCK:
+            _GEE.update({'ok': ok, 'failed_at': None if ok else time.monotonic(), 'attempt': None})
+        attempt['done'].set()
+    return ok
+
+GEDI_COLLECTION = 'LARSE/GEDI/GEDI04_A_002_MONTHLY'
+CANOPY_COLLECTION = "projects/meta-forest-monitoring-okw37/assets/CanopyHeight"
 
 # ===================== UTILIDADES =====================
 def shapely_to_ee(geometry):
@@ -47,116 +106,143 @@ def shapely_to_ee(geometry):
         print(f"❌ Error convirtiendo geometría: {e}")
     return None
 
-# ===================== BIOMASA Y CO2 (GEDI) =====================
-def analyze_biomass_agbd(geometry):
-    print("🛰️ Iniciando análisis de Biomasa (GEDI)...")
-    if not st.session_state.get('gee_initialized'): return None, None, None
-    
+# ===================== BIOMASA Y ALTURA (UNA SOLA CONSULTA) =====================
+def _stats_reducer():
+    """Media, desviación estándar y percentiles en un solo reductor."""
+    return ee.Reducer.mean() \
+        .combine(ee.Reducer.stdDev(), sharedInputs=True) \
+        .combine(ee.Reducer.percentile(STATS_PERCENTILES), sharedInputs=True)
+
+def _agbd_image(region):
+    """Densidad de biomasa GEDI L4A (banda 'agbd'): promedio de los meses sobre la región."""
+    return ee.ImageCollection(GEDI_COLLECTION) \
+        .filterBounds(region) \
+        .select('agbd') \
+        .mean()
+
+def _canopy_image():
+    """Mosaico de altura del dosel de Meta (banda 'height')."""
+    return ee.ImageCollection(CANOPY_COLLECTION) \
+        .mosaic() \
+        .rename('height')
+
+def _tile_url(image, vis_params):
+    return image.getMapId(vis_params)['tile_fetcher'].url_format
+
+def _band_stats(stats, band):
+    """Media, desviación y percentiles de una banda en el diccionario del reductor."""
+    return (
+        stats.get(f"{band}_mean"),
+        stats.get(f"{band}_stdDev"),
+        {p: stats.get(f"{band}_p{p}") for p in STATS_PERCENTILES}
+    )
+
+@traced()
+def analyze_satellite(geometry, backend=None):
+    """
+    Biomasa/CO2 y altura del dosel con el backend configurado (SATELLITE_BACKEND).
+    Ambos backends retornan el mismo contrato.
+    Returns:
+        dict: {'biomass': (tile_url, stats, vis_params), 'canopy': (tile_url, stats, None)}
+    """
+    backend = backend or SATELLITE_BACKEND
+    if backend == 'auto':
+        from src.analysis.satellite_local import has_local_rasters
+        backend = 'local' if has_local_rasters() and not ensure_gee() else 'gee'
+
+    if backend == 'local':
+        from src.analysis.satellite_local import analyze_satellite_local
+        return analyze_satellite_local(geometry)
+    return _analyze_satellite_gee(geometry)
+
+# Un getMapId fallido no debe quedar en caché durante todo el TTL de GEE
+def _complete_result(result):
+    """True si el resultado tiene estadísticas y las dos URLs de teselas."""
+    return result['biomass'][1] is not None and all(result[name][0] is not None for name in ('biomass', 'canopy'))
+
+@traced()
+@persistent_cache(
+    'gee', dataset=f"{GEDI_COLLECTION}+{CANOPY_COLLECTION}", version=SATELLITE_VERSION,
+    cache_if=_complete_result
+)
+def _analyze_satellite_gee(geometry):
+    """
+    Biomasa/CO2 (GEDI L4A) y altura del dosel (Meta) en una sola ida y vuelta.
+    Las bandas 'agbd' y 'height' se apilan y se reducen juntas (media, desviación y
+    percentiles) con el área en el mismo diccionario y un único getInfo; los dos
+    getMapId se piden en paralelo con esa consulta.
+    Returns:
+        dict: {'biomass': (tile_url, stats, vis_params), 'canopy': (tile_url, stats, None)}
+    """
+    print("🛰️ GEE: Iniciando análisis de Biomasa (GEDI) y Altura del Dosel (Meta)...")
+    empty = {'biomass': (None, None, None), 'canopy': (None, None, None)}
+    if not ensure_gee(): return empty
+
     ee_geom = shapely_to_ee(geometry)
-    if not ee_geom: return None, None, None
-    
-    # 1. Cargar Colección GEDI L4A (Densidad de Biomasa Aérea)
-    # Usamos la versión rasterizada mensual para rapidez
+    if not ee_geom: return empty
+
     try:
-        gedi_col = ee.ImageCollection('LARSE/GEDI/GEDI04_A_002_MONTHLY') \
-            .filterBounds(ee_geom) \
-            .select('agbd')
-        
-        # Si no hay datos en la colección filtrada, retornamos error controlado
-        gedi_img = gedi_col.mean().clip(ee_geom)
-        
-        # 2. Estadísticas (Aquí es donde solía fallar)
-        stats = gedi_img.reduceRegion(
-            reducer=ee.Reducer.mean(),
+        # 1. Imágenes: GEDI mensual promediado y mosaico de Meta (banda 'height')
+        agbd = _agbd_image(ee_geom).clip(ee_geom)
+        canopy = _canopy_image().clip(ee_geom)
+
+        # 2. Estadísticas de ambas bandas + área en un solo diccionario
+        stats = agbd.addBands(canopy).reduceRegion(
+            reducer=_stats_reducer(),
             geometry=ee_geom,
-            scale=100,      # Aumentamos escala a 100m para asegurar que capture datos promedio
+            scale=STATS_SCALE_M,
             maxPixels=1e9,
-            tileScale=4,
-            bestEffort=True
-        ).getInfo()
-        
-        print(f"📊 Stats GEDI crudos: {stats}")
+            bestEffort=True,
+            tileScale=4
+        )
+        request = ee.Dictionary({'stats': stats, 'area_m2': ee_geom.area(1)})
 
-        # Procesar valores
-        mean_agbd = stats.get('agbd', 0)
-        if mean_agbd is None: mean_agbd = 0
-        
-        # Calcular Área (en hectáreas)
-        area_ha = ee_geom.area(1).getInfo() / 10000
-        
-        # CÁLCULOS DE BIOMASA Y CO2
-        total_biomass = mean_agbd * area_ha
-        total_carbon = total_biomass * 0.5  # Aprox. 50% de la biomasa es carbono
-        total_co2 = total_carbon * 3.67     # Factor de conversión C -> CO2e
-
-        stats_dict = {
-            "Media (Mg/ha)": round(mean_agbd, 2),
-            "Biomasa Total (Mg)": round(total_biomass, 2),
-            "Carbono (Mg)": round(total_carbon, 2),
-            "Captura Potencial CO2 (Mg)": round(total_co2, 2)
-        }
-        
-        # 3. Visualización
-        vis_params = {
-            'min': 0, 
-            'max': 150, 
-            'palette': ['ffffe5', 'f7fcb9', 'addd8e', '41ab5d', '238443', '005a32']
+        # 3. getInfo y los dos getMapId en paralelo (~una ida y vuelta)
+        with span('gee.getInfo+getMapId'), concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            count('llamadas_http', 3)
+            info_future = executor.submit(request.getInfo)
+            tile_futures = {
+                'biomass': executor.submit(_tile_url, agbd, BIOMASS_VIS),
+                'canopy': executor.submit(_tile_url, canopy, CANOPY_VIS)
+            }
+            info = info_future.result()
+            tiles = {}
+            for name, future in tile_futures.items():
+                try:
+                    tiles[name] = future.result()
+                except Exception as e:
+                    print(f"⚠️ GEE: sin teselas de {name}: {e}")
+                    tiles[name] = None
+
+        print(f"📊 Stats GEE crudos: {info['stats']}")
+        area_ha = info['area_m2'] / 10000
+        mean_agbd, std_agbd, pct_agbd = _band_stats(info['stats'], 'agbd')
+        mean_h, std_h, pct_h = _band_stats(info['stats'], 'height')
+
+        return {
+            'biomass': (tiles['biomass'], biomass_stats(mean_agbd, area_ha, std_agbd, pct_agbd), BIOMASS_VIS),
+            'canopy': (tiles['canopy'], canopy_stats(mean_h, std_h, pct_h), None)
         }
-        map_id = ee.Image(gedi_img).getMapId(vis_params)
-        tile_url = map_id['tile_fetcher'].url_format
-        
-        return tile_url, stats_dict, vis_params
 
     except Exception as e:
-        print(f"❌ Error en cálculo Biomasa: {e}")
-        return None, None, None
+        print(f"❌ Error en análisis satelital: {e}")
+        return empty
+
+# ===================== BIOMASA Y CO2 (GEDI) =====================
+def analyze_biomass_agbd(geometry):
+    """Biomasa y CO2 (GEDI): (tile_url, stats, vis_params). Ver analyze_satellite."""
+    return analyze_satellite(geometry)['biomass']
 
 # ===================== ALTURA DOSEL (META) =====================
 def analyze_canopy_height(geometry):
-    print("🌳 GEE: Iniciando análisis de Altura del Dosel (Meta)...")
-    if not st.session_state.get('gee_initialized'): return None, None, None
-    
-    ee_geom = shapely_to_ee(geometry)
-    
-    try:
-        # 1. Cargar la Colección y Renombrar banda a 'height' para asegurar
-        canopy = ee.ImageCollection("projects/meta-forest-monitoring-okw37/assets/CanopyHeight") \
-            .mosaic() \
-            .clip(ee_geom) \
-            .rename('height')
-        
-        # 2. Estadísticas (Optimizadas)
-        # scale=100: Sacrificamos detalle microscópico en el número promedio 
-        # para ganar velocidad y asegurar que NO salga "Sin datos".
-        stats_obj = canopy.reduceRegion(
-            reducer=ee.Reducer.mean(),
-            geometry=ee_geom,
-            scale=100,      # <--- AUMENTADO DE 10 a 100 para estabilidad
-            maxPixels=1e9,
-            bestEffort=True, # <--- Permite a GEE ajustar la escala si es necesario
-            tileScale=4
-        ).getInfo()
-        
-        print(f"📊 Stats Canopy crudos: {stats_obj}")
-        
-        mean_val = stats_obj.get('height', 0)
-        
-        # Si devuelve None (puede pasar en zonas sin árboles), ponemos 0
-        if mean_val is None: mean_val = 0
-        
-        stats = {"Promedio (m)": round(mean_val, 2)}
-        
-        # 3. Visualización (Aquí sí mantenemos alta resolución visual)
-        vis_params = {
-            'min': 0, 
-            'max': 25, 
-            'palette': ['f7fcf5', '#caeac3', '#7bc77c', '#2a924a', '#00441b']
-        }
-        map_id = ee.Image(canopy).getMapId(vis_params)
-        tile_url = map_id['tile_fetcher'].url_format
-        
-        return tile_url, stats, None
+    """Altura del dosel (Meta): (tile_url, stats, None). Ver analyze_satellite."""
+    return analyze_satellite(geometry)['canopy']
 
-    except Exception as e:
-        print(f"❌ Error en cálculo Altura: {e}")
-        return None, None, None
\ No newline at end of file
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Conexión con Google Earth Engine.")
+    parser.add_argument("--autenticar", action="store_true", help="Autenticación interactiva (una vez por máquina)")
+    args = parser.parse_args()
+    ok = authenticate_gee() if args.autenticar else initialize_gee()
+    raise SystemExit(0 if ok else 1)
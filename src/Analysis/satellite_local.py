@@ -0,0 +1,260 @@
+"""
+Backend local (sin Earth Engine) para biomasa GEDI y altura del dosel de Meta.
+
+Usa exportaciones Cloud-Optimized GeoTIFF de las mismas capas guardadas en
+disco y respeta el contrato de satellite_fetch: (tile_url, stats, vis_params).
+Las estadísticas se calculan con lecturas por ventanas sobre el overview más
+cercano a STATS_SCALE_M (como `scale=100` en GEE) y con los mismos factores
+biomasa -> carbono -> CO2 de biomass_co2.py. Las teselas XYZ las sirve un
+endpoint HTTP local que se levanta en un hilo la primera vez que se pide una URL.
+
+Permite correr el paso satelital en lotes sin red y en pruebas.
+    SATELLITE_BACKEND=local streamlit run main.py
+"""
+import os
+import threading
+import numpy as np
+import rasterio
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pyproj import Geod
+from rasterio import features
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, Resampling
+from src.analysis.extract_raster import _polygon_to_raster_crs, _iter_polygon_windows
+from src.analysis.biomass_co2 import (
+    biomass_stats, canopy_stats, STATS_PERCENTILES, STATS_SCALE_M, BIOMASS_VIS, CANOPY_VIS
+)
+from src.analysis.extract_vector import PROJECT_ROOT
+from src.analysis.tracing import traced, count
+
+LOCAL_RASTER_DIR = PROJECT_ROOT / "data" / "raw" / "satelite"
+
+# Capas exportadas de GEE: GEDI L4A (agbd, Mg/ha) y Meta Canopy Height (m).
+# 'range' acota el histograma de los percentiles; lo que caiga fuera va a los extremos.
+LOCAL_LAYERS = {
+    'biomass': {'path': LOCAL_RASTER_DIR / "gedi_agbd.tif", 'vis': BIOMASS_VIS, 'range': (0, 1000)},
+    'canopy': {'path': LOCAL_RASTER_DIR / "meta_canopy_height.tif", 'vis': CANOPY_VIS, 'range': (0, 100)}
+}
+
+# Bins del histograma de percentiles: ~0.25 Mg/ha y ~2.5 cm con los rangos de arriba
+HISTOGRAM_BINS = 4096
+
+LOCAL_TILE_URL = os.getenv("LOCAL_TILE_URL", "http://127.0.0.1:8765")
+TILE_SIZE = 256
+WEB_MERCATOR_HALF = 20037508.342789244
+
+_SERVER = {}
+_SERVER_LOCK = threading.Lock()
+
+# ===================== LECTURA =====================
+def has_local_rasters():
+    """True si están las dos exportaciones locales."""
+    return all(layer['path'].exists() for layer in LOCAL_LAYERS.values())
+
+def _pixel_size_m(src, factor=1):
+    """Tamaño de píxel aproximado en metros (rasters en grados o proyectados)."""
+    size = abs(src.res[0]) * factor
+    return size * 111_320 if src.crs and src.crs.is_geographic else size
+
+def _overview_level(path, target_m):
+    """Índice del overview más grueso con píxel <= target_m (None = resolución completa)."""
+    with rasterio.open(path) as src:
+        level = None
+        for i, factor in enumerate(src.overviews(1)):
+            if _pixel_size_m(src, factor) <= target_m:
+                level = i
+        return level
+
+def _open(path, level=None):
+    return rasterio.open(path, overview_level=level) if level is not None else rasterio.open(path)
+
+def _window_values(src, geom, window):
+    """Valores válidos (sin nodata/NaN) cuyo centro de píxel cae en el polígono."""
+    data = src.read(1, window=window, masked=True)
+    count('pixeles_leidos', data.size)
+    count('bytes_leidos', data.data.nbytes)
+    inside = features.geometry_mask(
+        [geom], out_shape=data.shape, transform=src.window_transform(window), invert=True
+    )
+    values = data.data[inside & ~np.ma.getmaskarray(data)].astype(np.float64)
+    return values[np.isfinite(values)]
+
+def _histogram_percentiles(hist, edges, vmin, vmax, percentiles):
+    """Percentiles interpolando linealmente dentro del bin (acotados al mínimo y máximo reales)."""
+    cumulative = np.cumsum(hist)
+    result = {}
+    for p in percentiles:
+        rank = p / 100 * cumulative[-1]
+        i = min(int(np.searchsorted(cumulative, rank)), len(hist) - 1)
+        before = cumulative[i - 1] if i > 0 else 0
+        frac = (rank - before) / hist[i] if hist[i] else 0.0
+        value = edges[i] + frac * (edges[i + 1] - edges[i])
+        result[p] = float(min(max(value, vmin), vmax))
+    return result
+
+@traced()
+def raster_stats(path, polygon, value_range, scale_m=STATS_SCALE_M):
+    """
+    Media, desviación estándar y percentiles del raster dentro del polígono (WGS84).
+
+    Memoria acotada: por ventana se acumulan conteo, suma, suma de cuadrados y un
+    histograma de HISTOGRAM_BINS bins en `value_range`; los percentiles salen del
+    histograma (error menor que el ancho de un bin).
+    Returns:
+        tuple: (media, desviación, {percentil: valor}); None si no hay píxeles válidos.
+    """
+    lo, hi = value_range
+    edges = np.linspace(lo, hi, HISTOGRAM_BINS + 1)
+    hist = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+    n, total, total_sq = 0, 0.0, 0.0
+    vmin, vmax = np.inf, -np.inf
+
+    with _open(path, _overview_level(path, scale_m)) as src:
+        geom = _polygon_to_raster_crs(polygon, src)
+        for window in _iter_polygon_windows(src, geom):
+            values = _window_values(src, geom, window)
+            if values.size == 0:
+                continue
+            n += values.size
+            total += values.sum()
+            total_sq += np.square(values).sum()
+            vmin, vmax = min(vmin, values.min()), max(vmax, values.max())
+            hist += np.histogram(np.clip(values, lo, hi), bins=edges)[0]
+
+    if n == 0:
+        return None, None, {p: None for p in STATS_PERCENTILES}
+    mean = total / n
+    std = np.sqrt(max(total_sq / n - mean ** 2, 0.0))
+    return float(mean), float(std), _histogram_percentiles(hist, edges, vmin, vmax, STATS_PERCENTILES)
+
+def geodesic_area_ha(polygon):
+    """Área geodésica del polígono WGS84 (equivale a ee.Geometry.area)."""
+    area, _ = Geod(ellps="WGS84").geometry_area_perimeter(polygon)
+    return abs(area) / 10000
+
+# ===================== TESELAS =====================
+def _tile_bounds(z, x, y):
+    """Límites de una tesela XYZ en EPSG:3857."""
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def _palette_rgb(palette):
+    return np.array([[int(c.lstrip('#')[i:i + 2], 16) for i in (0, 2, 4)] for c in palette], dtype=np.float64)
+
+def _colorize(values, vis_params):
+    """Aplica min/max/paleta como GEE: RGBA con transparencia donde no hay dato."""
+    colors = _palette_rgb(vis_params['palette'])
+    t = (values - vis_params['min']) / (vis_params['max'] - vis_params['min'])
+    t = np.clip(np.nan_to_num(t), 0, 1) * (len(colors) - 1)
+    lo = np.floor(t).astype(int)
+    hi = np.minimum(lo + 1, len(colors) - 1)
+    frac = (t - lo)[..., None]
+    rgb = colors[lo] * (1 - frac) + colors[hi] * frac
+
+    rgba = np.zeros((4,) + values.shape, dtype=np.uint8)
+    rgba[:3] = np.moveaxis(rgb, -1, 0).round().astype(np.uint8)
+    rgba[3] = np.where(np.isfinite(values), 255, 0)
+    return rgba
+
+def render_tile(layer_name, z, x, y):
+    """PNG de la tesela XYZ de una capa local."""
+    layer = LOCAL_LAYERS[layer_name]
+    bounds = _tile_bounds(z, x, y)
+    tile_m = (bounds[2] - bounds[0]) / TILE_SIZE
+    dst_transform = from_bounds(*bounds, TILE_SIZE, TILE_SIZE)
+    values = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+
+    with _open(layer['path'], _overview_level(layer['path'], tile_m)) as src:
+        reproject(
+            rasterio.band(src, 1), values,
+            dst_transform=dst_transform, dst_crs="EPSG:3857", dst_nodata=np.nan,
+            resampling=Resampling.nearest
+        )
+
+    rgba = _colorize(values, layer['vis'])
+    with MemoryFile() as memfile:
+        with memfile.open(driver='PNG', width=TILE_SIZE, height=TILE_SIZE, count=4, dtype='uint8') as dst:
+            dst.write(rgba)
+        return memfile.read()
+
+class _TileHandler(BaseHTTPRequestHandler):
+    """GET /<capa>/<z>/<x>/<y>.png"""
+
+    def do_GET(self):
+        try:
+            layer_name, z, x, y = self.path.strip('/').removesuffix('.png').split('/')
+            z, x, y = int(z), int(x), int(y)
+        except ValueError:
+            self.send_error(404)
+            return
+        if layer_name not in LOCAL_LAYERS:
+            self.send_error(404)
+            return
+        try:
+            body = render_tile(layer_name, z, x, y)
+        except Exception as e:
+            # Archivo corrupto, tesela fuera de rango, error de reproyección...: respuesta, no conexión cortada
+            print(f"❌ Tesela local {self.path}: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'max-age=86400')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def ensure_tile_server(base_url=None):
+    """Levanta el endpoint de teselas una vez por proceso (si el puerto ya está en uso, se asume servido)."""
+    base_url = base_url or LOCAL_TILE_URL
+    with _SERVER_LOCK:
+        if 'server' in _SERVER:
+            return
+        host, port = base_url.split('//')[-1].rstrip('/').split(':')
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _TileHandler)
+        except OSError:
+            print(f"ℹ️ Endpoint de teselas ya activo en {base_url}")
+            _SERVER['server'] = None
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _SERVER['server'] = server
+        print(f"🗺️ Endpoint de teselas local en {base_url}")
+
+def tile_url(layer_name):
+    """Plantilla XYZ de la capa en el endpoint local (mismo formato que url_format de GEE)."""
+    ensure_tile_server()
+    return f"{LOCAL_TILE_URL}/{layer_name}/{{z}}/{{x}}/{{y}}.png"
+
+# ===================== API =====================
+@traced()
+def analyze_satellite_local(geometry):
+    """
+    Igual que satellite_fetch.analyze_satellite, con las exportaciones locales.
+    Returns:
+        dict: {'biomass': (tile_url, stats, vis_params), 'canopy': (tile_url, stats, None)}
+    """
+    print("🛰️ Local: Iniciando análisis de Biomasa (GEDI) y Altura del Dosel (Meta)...")
+    empty = {'biomass': (None, None, None), 'canopy': (None, None, None)}
+    if not has_local_rasters():
+        print(f"❌ No se encontraron las exportaciones locales en {LOCAL_RASTER_DIR}")
+        return empty
+
+    try:
+        biomass, canopy = LOCAL_LAYERS['biomass'], LOCAL_LAYERS['canopy']
+        mean_agbd, std_agbd, pct_agbd = raster_stats(biomass['path'], geometry, biomass['range'])
+        mean_h, std_h, pct_h = raster_stats(canopy['path'], geometry, canopy['range'])
+        area_ha = geodesic_area_ha(geometry)
+        return {
+            'biomass': (tile_url('biomass'), biomass_stats(mean_agbd, area_ha, std_agbd, pct_agbd), BIOMASS_VIS),
+            'canopy': (tile_url('canopy'), canopy_stats(mean_h, std_h, pct_h), None)
+        }
+    except Exception as e:
+        print(f"❌ Error en análisis satelital local: {e}")
+        return empty
@@ -0,0 +1,203 @@
+"""
+Trazas de rendimiento: spans anidados, contadores y memoria máxima.
+
+Los módulos de análisis marcan sus funciones con `@traced()` (o bloques con
+`span()`) y suman contadores con `count()` (bytes leídos, píxeles recorridos,
+features cruzados, llamadas HTTP, aciertos de caché). Sin una traza activa todo
+es un no-op barato. La traza activa y el span actual viajan en contextvars: el
+pipeline copia el contexto a sus hilos, así que los spans de cada etapa cuelgan
+de la traza del diagnóstico.
+
+    with start_trace("diagnostico") as traza:
+        extract_forest_info(poly)
+    traza.summary()          # desglose por nombre de span
+    traza.to_chrome_trace()  # para chrome://tracing o Perfetto
+"""
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_TRACE = contextvars.ContextVar('traza', default=None)
+_SPAN = contextvars.ContextVar('span', default=None)
+# Hilos que comparten el span actual (contexto copiado) suman contadores a la vez
+_COUNT_LOCK = threading.Lock()
+
+# ===================== MEMORIA =====================
+def rss_max_mb():
+    """Memoria residente máxima del proceso hasta ahora (MB); None si no se puede medir."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+# ===================== TRAZA =====================
+class Trace:
+    """Spans y contadores de una ejecución."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = []
+        self.counters = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _add(self, record):
+        with self._lock:
+            self.spans.append(record)
+            for key, value in record['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_dict(self):
+        """Traza serializable (JSON)."""
+        spans = sorted(self.spans, key=lambda s: s['start_s'])
+        return {
+            'name': self.name,
+            'started': self.wall_started,
+            'duration_s': max((s['start_s'] + s['duration_s'] for s in spans), default=0.0),
+            'counters': dict(self.counters),
+            'rss_max_mb': rss_max_mb(),
+            'spans': spans
+        }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.to_dict(), ensure_ascii=False, indent=2, default=str)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def to_chrome_trace(self, path=None):
+        """Formato Trace Event (chrome://tracing, Perfetto): un evento 'X' por span."""
+        events = [{
+            'name': s['name'],
+            'ph': 'X',
+            'ts': round(s['start_s'] * 1e6),
+            'dur': round(s['duration_s'] * 1e6),
+            'pid': 1,
+            'tid': s['thread'],
+            'args': {**s['attrs'], **s['counters'], 'rss_max_mb': s['rss_max_mb']}
+        } for s in self.spans]
+        text = json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, default=str)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def summary(self):
+        """
+        Desglose por nombre de span.
+        Returns:
+            list[dict]: {'span', 'llamadas', 'total_s', 'propio_s', 'max_s', contadores...}
+                ordenado por tiempo total; 'propio_s' descuenta los spans hijos.
+        """
+        return summarize(self.to_dict())
+
+def summarize(trace_dict):
+    """Desglose por nombre de span de una traza ya exportada con to_dict()."""
+    spans = trace_dict['spans']
+    children = {}
+    for s in spans:
+        children[s['parent']] = children.get(s['parent'], 0) + s['duration_s']
+    rows = {}
+    for s in spans:
+        row = rows.setdefault(s['name'], {'span': s['name'], 'llamadas': 0, 'total_s': 0.0, 'propio_s': 0.0, 'max_s': 0.0})
+        row['llamadas'] += 1
+        row['total_s'] += s['duration_s']
+        row['propio_s'] += max(0.0, s['duration_s'] - children.get(s['id'], 0.0))
+        row['max_s'] = max(row['max_s'], s['duration_s'])
+        for key, value in s['counters'].items():
+            row[key] = row.get(key, 0) + value
+    return sorted(rows.values(), key=lambda r: r['total_s'], reverse=True)
+
+@contextlib.contextmanager
+def start_trace(name):
+    """Activa una traza nueva en el contexto actual (y en los hilos del pipeline)."""
+    trace = Trace(name)
+    trace_token = _TRACE.set(trace)
+    span_token = _SPAN.set(None)
+    try:
+        with span(name):
+            yield trace
+    finally:
+        _SPAN.reset(span_token)
+        _TRACE.reset(trace_token)
+
+def current_trace():
+    return _TRACE.get()
+
+# ===================== SPANS =====================
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Mide el bloque como un span hijo del actual; no hace nada sin traza activa."""
+    trace = _TRACE.get()
+    if trace is None:
+        yield None
+        return
+    parent = _SPAN.get()
+    record = {
+        'id': next(trace._ids),
+        'parent': parent['id'] if parent else None,
+        'name': name,
+        'thread': threading.get_ident(),
+        'attrs': attrs,
+        'counters': {}
+    }
+    token = _SPAN.set(record)
+    rss_before = rss_max_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['attrs']['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record['start_s'] = start - trace.started
+        record['duration_s'] = time.perf_counter() - start
+        record['rss_max_mb'] = rss_max_mb()
+        record['rss_growth_mb'] = (record['rss_max_mb'] - rss_before) if rss_before is not None else None
+        _SPAN.reset(token)
+        trace._add(record)
+
+def count(name, value=1):
+    """Suma `value` al contador `name` del span actual (no-op sin traza activa)."""
+    record = _SPAN.get()
+    if record is None:
+        return
+    with _COUNT_LOCK:
+        counters = record['counters']
+        counters[name] = counters.get(name, 0) + value
+
+def traced(name=None):
+    """Decorador: cada llamada a la función es un span (por defecto, módulo.función)."""
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _TRACE.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def copy_context_call(func):
+    """
+    Envuelve `func` para ejecutarla en otro hilo con la traza y el span actuales.
+    Cada llamada copia el contexto: usar una por tarea enviada al pool.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
@@ -0,0 +1,306 @@
+"""
+Cubo de pre-agregación de capas legales sobre una grilla jerárquica.
+
+Para polígonos del tamaño de un departamento el cruce exacto materializa y recorta
+decenas de miles de features solo para producir un resumen pequeño
+(Categoría / area_total_ha / count_features). El cubo guarda, para cada celda de
+una grilla cuadrada jerárquica (estilo quadkey) en EQUAL_AREA_CRS, el área de cada
+feature dentro de la celda. El nivel 0 son celdas de CUBE_BASE_CELL_M metros y cada
+nivel superior agrupa 2x2 celdas del anterior.
+
+En consulta, las celdas completamente dentro del polígono se suman desde el cubo
+(en el nivel más grueso posible) y solo las celdas de borde del nivel 0 se
+refinan con el cruce exacto de extract_vector.
+
+Tolerancia: el resultado coincide con la ruta exacta salvo error de punto flotante
+en la partición por celdas; la diferencia por categoría queda por debajo de
+CUBE_TOLERANCE_HA (el redondeo a 0.01 ha del resumen) y los conteos de features
+son idénticos.
+
+Uso (paso offline, requiere las capas preparadas con prepare_vectors.py):
+    python -m src.analysis.vector_cube                    # todas las capas de LAYER_CONFIG
+    python -m src.analysis.vector_cube centro_poblado
+"""
+import argparse
+import json
+import math
+import threading
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS
+from src.analysis.extract_vector import (
+    PROJECT_ROOT, LAYER_CONFIG, AREA_COL, EQUAL_AREA_CRS, _category_column, _clip_to_polygon
+)
+from src.analysis.layer_store import get_layer
+from src.analysis.tracing import traced
+
+CUBE_DIR = PROJECT_ROOT / "data" / "processed" / "cubo"
+
+# Grilla: celdas de 2 km en el nivel 0; la celda raíz (nivel 11) mide 4096 km
+CUBE_BASE_CELL_M = 2000
+CUBE_LEVELS = 12
+# Esquina suroeste de la grilla en EQUAL_AREA_CRS (cubre Colombia con holgura)
+GRID_ORIGIN = (-2_000_000.0, -2_000_000.0)
+
+# Diferencia máxima esperada por categoría frente a la ruta exacta (ha)
+CUBE_TOLERANCE_HA = 0.01
+
+UNCLASSIFIED = 'Total Área (Sin clasificar)'
+
+_CUBES = {}
+_LOCK = threading.Lock()
+
+# ===================== GRILLA =====================
+def _cell_size(level):
+    return CUBE_BASE_CELL_M * 2 ** level
+
+def _cell_box(level, ix, iy):
+    size = _cell_size(level)
+    x0 = GRID_ORIGIN[0] + ix * size
+    y0 = GRID_ORIGIN[1] + iy * size
+    return shapely.box(x0, y0, x0 + size, y0 + size)
+
+def _cell_key(ix, iy):
+    """Clave entera única de una celda dentro de un nivel."""
+    return (np.asarray(ix, dtype=np.int64) << 32) | np.asarray(iy, dtype=np.int64)
+
+def _cell_range(level, minx, miny, maxx, maxy):
+    """Índices de celdas del nivel que cubren un bbox."""
+    size = _cell_size(level)
+    return (
+        range(int((minx - GRID_ORIGIN[0]) // size), int((maxx - GRID_ORIGIN[0]) // size) + 1),
+        range(int((miny - GRID_ORIGIN[1]) // size), int((maxy - GRID_ORIGIN[1]) // size) + 1)
+    )
+
+# ===================== CONSTRUCCIÓN (OFFLINE) =====================
+def _feature_cells(geom):
+    """
+    Área (m²) de una feature en cada celda del nivel 0 que toca.
+    Recorta de forma recursiva desde el nivel que contiene su bbox: cada pieza solo
+    se recorta contra las hijas de su celda y las celdas cubiertas por completo se
+    expanden sin recortar.
+    """
+    minx, miny, maxx, maxy = geom.bounds
+    span = max(maxx - minx, maxy - miny, 1.0)
+    level = min(CUBE_LEVELS - 1, max(0, math.ceil(math.log2(span / CUBE_BASE_CELL_M))))
+    xs, ys = _cell_range(level, minx, miny, maxx, maxy)
+    stack = [(level, ix, iy, geom) for ix in xs for iy in ys]
+
+    out_ix, out_iy, out_area = [], [], []
+    while stack:
+        level, ix, iy, piece = stack.pop()
+        part = shapely.intersection(piece, _cell_box(level, ix, iy))
+        area = part.area
+        if area <= 0:
+            continue
+
+        full = _cell_size(level) ** 2
+        if level == 0:
+            out_ix.append(ix); out_iy.append(iy); out_area.append(area)
+        elif area >= full * (1 - 1e-12):
+            # Celda cubierta por completo: todas sus celdas de nivel 0 tienen área completa
+            n = 2 ** level
+            sub_ix, sub_iy = np.meshgrid(ix * n + np.arange(n), iy * n + np.arange(n))
+            out_ix.extend(sub_ix.ravel()); out_iy.extend(sub_iy.ravel())
+            out_area.extend([float(CUBE_BASE_CELL_M ** 2)] * sub_ix.size)
+        else:
+            stack.extend((level - 1, 2 * ix + dx, 2 * iy + dy, part) for dx in (0, 1) for dy in (0, 1))
+
+    return out_ix, out_iy, out_area
+
+def build_vector_cube(layer_name, output_dir=CUBE_DIR):
+    """Construye el cubo de una capa preparada (geometrías en EQUAL_AREA_CRS)."""
+    layer = get_layer(layer_name)
+    if layer.crs is None or not CRS.from_user_input(EQUAL_AREA_CRS).equals(layer.crs):
+        raise ValueError(f"{layer_name} no está en EQUAL_AREA_CRS: ejecuta prepare_vectors primero")
+
+    cat_col = _category_column(layer.attributes.columns, layer_name)
+    categories = layer.attributes[cat_col] if cat_col else pd.Series(UNCLASSIFIED, index=layer.attributes.index)
+
+    frames = []
+    for fid, geom in enumerate(layer.geometries):
+        ix, iy, area = _feature_cells(geom)
+        if ix:
+            frames.append(pd.DataFrame({'ix': ix, 'iy': iy, 'fid': fid, AREA_COL: np.asarray(area) / 10000}))
+        if fid % 1000 == 0:
+            print(f"🧊 {layer_name}: {fid}/{len(layer)} features")
+
+    base = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['ix', 'iy', 'fid', AREA_COL])
+    levels = []
+    for level in range(CUBE_LEVELS):
+        if level == 0:
+            cells = base
+        else:
+            cells = base.assign(ix=base['ix'] // 2 ** level, iy=base['iy'] // 2 ** level)
+            cells = cells.groupby(['ix', 'iy', 'fid'], as_index=False)[AREA_COL].sum()
+        levels.append(cells.assign(level=level))
+
+    cube = pd.concat(levels, ignore_index=True).astype({'level': 'int8', 'ix': 'int32', 'iy': 'int32', 'fid': 'int32'})
+    cube['categoria'] = categories.to_numpy()[cube['fid'].to_numpy()]
+
+    source = layer.source
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b'cubo': json.dumps({'source': str(source), 'source_mtime': source.stat().st_mtime}).encode()
+    })
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"{layer_name}.parquet"
+    pq.write_table(table, output_path, compression='zstd')
+    print(f"✅ Cubo {layer_name}: {len(base)} celdas-feature en nivel 0 -> {output_path}")
+    return output_path
+
+# ===================== CARGA =====================
+def _cube_version(layer_name):
+    """Fechas del cubo y de la fuente de la capa: el resultado de _load_cube vale mientras no cambien."""
+    path = CUBE_DIR / f"{layer_name}.parquet"
+    source = get_layer(layer_name).source
+    return path.stat().st_mtime if path.exists() else None, str(source), source.stat().st_mtime
+
+def _load_cube(layer_name):
+    """
+    Cubo en memoria (una vez por versión del cubo y de la capa). None si no existe
+    o está desactualizado; ese resultado también se guarda, para no releer el cubo
+    en cada consulta mientras no cambie ninguno de los dos archivos.
+    """
+    version = _cube_version(layer_name)
+    with _LOCK:
+        cached = _CUBES.get(layer_name)
+        if cached is None or cached['version'] != version:
+            _CUBES[layer_name] = {'version': version, 'cube': _read_cube(layer_name)}
+        return _CUBES[layer_name]['cube']
+
+def _read_cube(layer_name):
+    """Lee y valida el cubo de la capa. None si no existe o está desactualizado."""
+    path = CUBE_DIR / f"{layer_name}.parquet"
+    if not path.exists():
+        return None
+
+    table = pq.read_table(path)
+    meta = json.loads(table.schema.metadata[b'cubo'])
+    source = get_layer(layer_name).source
+    if str(source) != meta['source'] or source.stat().st_mtime != meta['source_mtime']:
+        print(f"⚠️ Cubo de {layer_name} desactualizado frente a la capa; se usará la ruta exacta.")
+        return None
+
+    df = table.to_pandas()
+    codes, categories = pd.factorize(df['categoria'])
+    cube = {'categories': np.asarray(categories, dtype=object), 'levels': {}}
+    for level, idx in df.groupby('level').indices.items():
+        cube['levels'][int(level)] = {
+            'key': _cell_key(df['ix'].to_numpy()[idx], df['iy'].to_numpy()[idx]),
+            'fid': df['fid'].to_numpy()[idx],
+            'area': df[AREA_COL].to_numpy()[idx],
+            'code': codes[idx]
+        }
+    return cube
+
+# ===================== CONSULTA =====================
+def _classify_cells(geom):
+    """
+    Desciende la grilla desde la raíz: celdas dentro del polígono por nivel y
+    celdas de borde del nivel 0.
+    """
+    shapely.prepare(geom)
+    top = CUBE_LEVELS - 1
+    xs, ys = _cell_range(top, *geom.bounds)
+    stack = [(top, ix, iy) for ix in xs for iy in ys]
+
+    inner, boundary = {}, []
+    while stack:
+        level, ix, iy = stack.pop()
+        box = _cell_box(level, ix, iy)
+        if not geom.intersects(box):
+            continue
+        if geom.contains(box):
+            inner.setdefault(level, []).append((ix, iy))
+        elif level == 0:
+            boundary.append(box)
+        else:
+            stack.extend((level - 1, 2 * ix + dx, 2 * iy + dy) for dx in (0, 1) for dy in (0, 1))
+    return inner, boundary
+
+def _boundary_pieces(layer, layer_name, region):
+    """Cruce exacto (como extract_vector) restringido a la región de borde."""
+    idx = layer.query_index(region)
+    gdf = gpd.GeoDataFrame(
+        layer.attributes.iloc[idx].reset_index(drop=True), geometry=layer.geometries[idx], crs=layer.crs
+    )
+    gdf['fid'] = idx
+    clipped = _clip_to_polygon(gdf, region)
+    if clipped.empty:
+        return pd.DataFrame(columns=['fid', AREA_COL, 'Categoría'])
+
+    measured = clipped.area / 10000
+    if AREA_COL in clipped.columns:
+        measured = clipped[AREA_COL].where(~clipped['_recortado'], measured)
+
+    cat_col = _category_column(layer.attributes.columns, layer_name)
+    return pd.DataFrame({
+        'fid': clipped['fid'],
+        AREA_COL: measured,
+        'Categoría': clipped[cat_col] if cat_col else UNCLASSIFIED
+    })
+
+@traced()
+def query_vector_cube(layer_polygon, layer_name):
+    """
+    Resumen Categoría / area_total_ha / count_features usando el cubo.
+    Args:
+        layer_polygon (shapely.Geometry): Polígono en EQUAL_AREA_CRS.
+    Returns:
+        pd.DataFrame | None: None si la capa no tiene cubo vigente.
+    """
+    cube = _load_cube(layer_name)
+    if cube is None:
+        return None
+    layer = get_layer(layer_name)
+
+    inner, boundary = _classify_cells(layer_polygon)
+
+    # 1. Celdas completamente dentro: sumas precalculadas
+    parts = []
+    for level, cells in inner.items():
+        data = cube['levels'].get(level)
+        if data is None:
+            continue
+        ix, iy = zip(*cells)
+        mask = np.isin(data['key'], _cell_key(ix, iy)) & (data['code'] >= 0)
+        parts.append(pd.DataFrame({
+            'fid': data['fid'][mask],
+            AREA_COL: data['area'][mask],
+            'Categoría': cube['categories'][data['code'][mask]]
+        }))
+
+    # 2. Celdas de borde: cruce exacto solo en (polígono ∩ celdas de borde)
+    if boundary:
+        region = shapely.intersection(layer_polygon, shapely.coverage_union_all(boundary))
+        if not region.is_empty:
+            parts.append(_boundary_pieces(layer, layer_name, region))
+
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+
+    combined = pd.concat(parts, ignore_index=True)
+    summary = combined.groupby('Categoría', as_index=False).agg(
+        area_total_ha=(AREA_COL, 'sum'),
+        count_features=('fid', 'nunique')
+    )
+    summary['area_total_ha'] = summary['area_total_ha'].round(2)
+    return summary.sort_values(by='area_total_ha', ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye el cubo de pre-agregación de las capas legales.")
+    parser.add_argument("layers", nargs="*", help="Capas a procesar (por defecto, todas)")
+    args = parser.parse_args()
+    for name in args.layers or LAYER_CONFIG:
+        try:
+            build_vector_cube(name)
+        except Exception as e:
+            print(f"❌ Error construyendo cubo {name}: {e}")
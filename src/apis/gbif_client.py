@@ -0,0 +1,268 @@
+"""
+Cliente asíncrono para la API de ocurrencias de GBIF.
+
+Una sola sesión httpx (pool de conexiones) y un solo token bucket por proceso,
+que viven en un event loop propio en un hilo de fondo: todas las sesiones de
+Streamlit y etapas concurrentes comparten la conexión, la concurrencia acotada y
+la tasa de REQUESTS_PER_SECOND. Reintentos con backoff exponencial
+(429/5xx/errores de red). Las facetas de speciesKey se paginan con
+facetOffset hasta agotar las especies, así que la riqueza no se corta en 1000.
+
+Cada grupo retorna {'especies', 'completo', 'error'}: si una página falla tras
+los reintentos, se conservan las especies ya contadas y 'completo' queda en False.
+
+La URL base se configura con GBIF_API_URL (variable de entorno o argumento
+`base_url`), lo que permite probar el cliente contra un servidor local con
+respuestas fijas.
+
+Los pools de procesos (p. ej. diagnostic_batch) llaman a `set_process_share(n)`
+en el inicializador de cada worker: cada proceso usa REQUESTS_PER_SECOND / n, así
+que el lote completo no supera la cuota de la API.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import random
+import threading
+import time
+import httpx
+from src.analysis.tracing import traced, count, copy_context_call
+
+GBIF_API_URL = os.getenv("GBIF_API_URL", "https://api.gbif.org/v1")
+
+FACET_PAGE_SIZE = 1000
+MAX_CONCURRENCY = 8
+REQUESTS_PER_SECOND = 5
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30
+TIMEOUT_S = 60
+
+# Respuestas que vale la pena reintentar
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Cliente compartido del proceso: {'loop', 'client'} y la tasa ('rate') de este proceso
+_SHARED = {'rate': REQUESTS_PER_SECOND}
+_SHARED_LOCK = threading.Lock()
+
+class GBIFError(Exception):
+    """Error de la API de GBIF tras agotar los reintentos (o no reintentable)."""
+
+class TokenBucket:
+    """Limitador de tasa: `rate` solicitudes por segundo con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.tokens = 0
+        self.set_rate(rate, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = min(self.tokens, self.capacity)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class GBIFClient:
+    """
+    Sesión asíncrona contra la API de GBIF. Se usa como context manager:
+
+        async with GBIFClient() as client:
+            result = await client.species_keys(212, wkt)
+    """
+
+    def __init__(self, base_url=None, max_concurrency=MAX_CONCURRENCY, rate=REQUESTS_PER_SECOND,
+                 max_retries=MAX_RETRIES, timeout=TIMEOUT_S, transport=None):
+        self.base_url = base_url or GBIF_API_URL
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.transport = transport
+        self.requests = 0
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            transport=self.transport
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(self.rate)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    def _backoff(self, attempt, retry_after=None):
+        """Espera antes del reintento: Retry-After si viene, si no exponencial con jitter."""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX_S)
+        return min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def get_json(self, path, params):
+        """GET con limitación de tasa, concurrencia acotada y reintentos."""
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    count('llamadas_http')
+                    response = await self._client.get(path, params=params)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                count('bytes_http', len(response.content))
+                if response.status_code == 200:
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUS:
+                    raise GBIFError(error)
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt == self.max_retries:
+                raise GBIFError(f"{error} tras {attempt + 1} intentos")
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def species_keys(self, taxon_key, geometry_wkt):
+        """
+        speciesKey distintos de un taxón dentro de la geometría (WKT antihorario).
+        Returns:
+            dict: {'especies': set, 'completo': bool, 'error': str | None}
+        """
+        result = {'especies': set(), 'completo': False, 'error': None}
+        offset = 0
+        try:
+            while True:
+                data = await self.get_json('/occurrence/search', {
+                    'geometry': geometry_wkt,
+                    'taxonKey': taxon_key,
+                    'hasCoordinate': 'true',
+                    'limit': 0,              # Solo metadatos, no descargas
+                    'facet': 'speciesKey',   # Contar especies únicas
+                    'facetLimit': FACET_PAGE_SIZE,
+                    'facetOffset': offset
+                })
+                facets = data.get('facets') or []
+                counts = facets[0]['counts'] if facets else []
+                result['especies'].update(int(c['name']) for c in counts)
+                if len(counts) < FACET_PAGE_SIZE:
+                    break
+                offset += FACET_PAGE_SIZE
+            result['completo'] = True
+        except (GBIFError, ValueError, KeyError, IndexError) as e:
+            result['error'] = str(e)
+        return result
+
+# ===================== CLIENTE DEL PROCESO =====================
+def set_process_share(n_processes):
+    """
+    Reparte la cuota entre `n_processes` procesos que consultan a la vez: este
+    proceso usará REQUESTS_PER_SECOND / n_processes. Llamar desde el inicializador
+    del pool (antes de la primera consulta; si el cliente ya existe, se ajusta).
+    """
+    with _SHARED_LOCK:
+        _SHARED['rate'] = REQUESTS_PER_SECOND / max(1, n_processes)
+        if 'client' in _SHARED:
+            _SHARED['loop'].call_soon_threadsafe(_SHARED['client']._bucket.set_rate, _SHARED['rate'])
+
+def shared_client():
+    """
+    Cliente GBIF del proceso (una sesión y un token bucket), creado la primera vez
+    junto con el event loop de fondo donde corre.
+    Returns:
+        tuple: (GBIFClient, event loop)
+    """
+    with _SHARED_LOCK:
+        if 'client' not in _SHARED:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gbif-client", daemon=True).start()
+            client = GBIFClient(rate=_SHARED['rate'])
+            asyncio.run_coroutine_threadsafe(client.__aenter__(), loop).result()
+            _SHARED.update(loop=loop, client=client)
+        return _SHARED['client'], _SHARED['loop']
+
+def _run_shared(coro_func):
+    """Corre `coro_func(client)` en el loop del cliente compartido, con la traza y el span del llamador."""
+    client, loop = shared_client()
+    done = concurrent.futures.Future()
+
+    def on_done(task):
+        if task.cancelled():
+            done.cancel()
+        elif task.exception() is not None:
+            done.set_exception(task.exception())
+        else:
+            done.set_result(task.result())
+
+    def start():
+        # La tarea hereda el contexto copiado (contadores en el span actual)
+        loop.create_task(coro_func(client)).add_done_callback(on_done)
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return done.result()
+
+# ===================== API SÍNCRONA =====================
+def run_sync(coro):
+    """Ejecuta una corrutina desde código síncrono, aunque ya haya un event loop activo."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(copy_context_call(asyncio.run), coro).result()
+
+def _merge_tiles(results):
+    """Une los resultados de las teselas de un grupo (especies sin duplicados)."""
+    if len(results) == 1:
+        return results[0]
+    errors = [r['error'] for r in results if not r['completo']]
+    return {
+        'especies': set().union(*(r['especies'] for r in results)),
+        'completo': not errors,
+        'error': f"{len(errors)}/{len(results)} teselas con error: {errors[0]}" if errors else None
+    }
+
+async def _species_by_group(client, taxon_groups, geometry_wkts):
+    tasks = [client.species_keys(key, wkt) for key in taxon_groups.values() for wkt in geometry_wkts]
+    results = await asyncio.gather(*tasks)
+    n = len(geometry_wkts)
+    return {name: _merge_tiles(results[i * n:(i + 1) * n]) for i, name in enumerate(taxon_groups)}
+
+async def _species_by_group_session(taxon_groups, geometry_wkts, **client_kwargs):
+    async with GBIFClient(**client_kwargs) as client:
+        return await _species_by_group(client, taxon_groups, geometry_wkts)
+
+@traced()
+def fetch_species_by_group(taxon_groups, geometry_wkts, **client_kwargs):
+    """
+    Especies por grupo con todas las consultas concurrentes en el cliente del proceso.
+    Args:
+        taxon_groups (dict): {nombre: taxonKey}.
+        geometry_wkts (str | list): WKT del área o de cada una de sus teselas; las
+            especies de todas las teselas se unen sin duplicados.
+        client_kwargs: Parámetros de GBIFClient (base_url, max_concurrency, rate, ...);
+            si se pasan, se usa una sesión propia en vez del cliente compartido.
+    Returns:
+        dict: {nombre: {'especies', 'completo', 'error'}}
+    """
+    if isinstance(geometry_wkts, str):
+        geometry_wkts = [geometry_wkts]
+    geometry_wkts = list(geometry_wkts)
+    if client_kwargs:
+        return run_sync(_species_by_group_session(taxon_groups, geometry_wkts, **client_kwargs))
+    return _run_shared(lambda client: _species_by_group(client, taxon_groups, geometry_wkts))
@@ -0,0 +1,361 @@
+"""
+Benchmarks reproducibles de las funciones críticas con datos sintéticos.
+
+Genera (una vez por escala y semilla) un raster tipo IDEAM, un GPKG con las capas
+de LAYER_CONFIG y su GeoParquet preparado (ver synthetic_data.py), redirige a
+ellos las rutas de los módulos de análisis y mide:
+  - extract_forest_info (modos 'stream' y 'mask') por tamaño de polígono;
+  - _load_vector_data (formatos 'gpkg', 'parquet' y 'store', sin la caché persistente);
+  - generate_docx_report (sin descargar el mapa base) y build_system_prompt.
+
+Cada caso corre una vez con traza (calentamiento + contadores de tracing.py) y
+luego `--repeat` muestras; las funciones rápidas se repiten dentro de cada
+muestra hasta durar MIN_SAMPLE_S. La mediana por llamada se compara con la
+línea base guardada para la misma escala y semilla: más lenta que
+(1 + tolerancia) es una regresión y el comando termina con código 1.
+
+Uso:
+    python -m src.benchmark_suite --scale small --save-baseline   # fija la línea base
+    python -m src.benchmark_suite --scale small                   # compara contra ella
+    python -m src.benchmark_suite -k vector --repeat 10
+"""
+import argparse
+import contextlib
+import importlib
+import inspect
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = PROJECT_ROOT / "data" / "benchmark"
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+BASELINE_DIR = BENCH_DIR / "baselines"
+
+# Cambiar al modificar los generadores: invalida los fixtures ya escritos
+FIXTURE_VERSION = 1
+
+# Escalas de los fixtures: lado del raster (px), features de la Frontera Agrícola
+# y vértices por feature
+SCALES = {
+    'small': {'raster_px': 2048, 'features': 2000, 'vertices': 32},
+    'medium': {'raster_px': 4096, 'features': 10000, 'vertices': 64},
+    'large': {'raster_px': 8192, 'features': 50000, 'vertices': 128}
+}
+
+# Polígonos de consulta: radio (fracción del medio lado del área sintética) y vértices
+POLYGONS = {
+    'chico': (0.03, 32),
+    'mediano': (0.15, 512),
+    'grande': (0.45, 4096)
+}
+
+# Capa que se mide en _load_vector_data (la más grande y la única con contexto administrativo)
+BENCH_LAYER = 'frontera_agricola_jun2025'
+VECTOR_FORMATS = ('gpkg', 'parquet', 'store')
+RASTER_MODES = ('stream', 'mask')
+
+# Regresión: mediana > línea base * (1 + tolerancia)
+REGRESSION_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.30"))
+# Duración mínima de cada muestra (s); las llamadas más rápidas se repiten dentro de ella
+MIN_SAMPLE_S = 0.2
+
+# Rutas de datos que se redirigen a los fixtures: (módulo, atributo, fixture)
+_PATCHED_PATHS = [
+    ('src.analysis.extract_raster', 'RASTER_PATH', 'raster'),
+    ('src.analysis.extract_vector', 'GPKG_PATH', 'gpkg'),
+    ('src.analysis.extract_vector', 'PARQUET_DIR', 'parquet'),
+    ('src.analysis.layer_store', 'GPKG_PATH', 'gpkg'),
+    ('src.analysis.layer_store', 'PARQUET_DIR', 'parquet'),
+    ('src.analysis.prepare_vectors', 'GPKG_PATH', 'gpkg')
+]
+
+# ===================== FIXTURES =====================
+def _fixture_paths(fixture_dir):
+    return {
+        'raster': fixture_dir / "superficie_bosques.img",
+        'gpkg': fixture_dir / "datos.gpkg",
+        'parquet': fixture_dir / "geoparquet"
+    }
+
+@contextlib.contextmanager
+def use_fixtures(fixture_dir):
+    """Redirige las rutas de datos de los módulos de análisis a los fixtures del bloque."""
+    from src.analysis import layer_store
+    paths = _fixture_paths(fixture_dir)
+    previous = []
+    for module_name, attr, key in _PATCHED_PATHS:
+        module = importlib.import_module(module_name)
+        previous.append((module, attr, getattr(module, attr)))
+        setattr(module, attr, paths[key])
+    # Las capas residentes en memoria son de la fuente anterior
+    layer_store.clear()
+    try:
+        yield paths
+    finally:
+        for module, attr, value in reversed(previous):
+            setattr(module, attr, value)
+        layer_store.clear()
+
+def build_fixtures(scale='small', seed=0, force=False):
+    """
+    Genera los fixtures de la escala si no existen (o si cambió FIXTURE_VERSION).
+    Returns:
+        Path: Directorio de los fixtures.
+    """
+    from src import synthetic_data
+    from src.analysis.prepare_vectors import export_layer_geoparquet
+
+    params = {'version': FIXTURE_VERSION, 'scale': scale, 'seed': seed, **SCALES[scale]}
+    fixture_dir = FIXTURES_DIR / f"{scale}-s{seed}"
+    meta_path = fixture_dir / "meta.json"
+    if not force and meta_path.exists() and json.loads(meta_path.read_text(encoding='utf-8')) == params:
+        return fixture_dir
+
+    print(f"🧪 Generando fixtures '{scale}' (semilla {seed}) en {fixture_dir}...")
+    meta_path.unlink(missing_ok=True)
+    paths = _fixture_paths(fixture_dir)
+    start = time.perf_counter()
+    synthetic_data.make_forest_raster(paths['raster'], SCALES[scale]['raster_px'], seed)
+    synthetic_data.make_vector_layers(
+        paths['gpkg'], SCALES[scale]['raster_px'], SCALES[scale]['features'], SCALES[scale]['vertices'], seed
+    )
+    with use_fixtures(fixture_dir):
+        export_layer_geoparquet(BENCH_LAYER, output_dir=paths['parquet'])
+    meta_path.write_text(json.dumps(params), encoding='utf-8')
+    print(f"✅ Fixtures listos en {time.perf_counter() - start:.1f} s")
+    return fixture_dir
+
+# ===================== CASOS =====================
+@contextlib.contextmanager
+def _offline_basemap(generate_reports):
+    """El mapa base del reporte se descarga de internet: se desactiva para medir solo el reporte."""
+    def disabled(*args, **kwargs):
+        raise ConnectionError("Mapa base desactivado en el benchmark")
+    original = generate_reports.ctx.add_basemap
+    generate_reports.ctx.add_basemap = disabled
+    try:
+        yield
+    finally:
+        generate_reports.ctx.add_basemap = original
+
+def _polygons(scale, seed):
+    from src.synthetic_data import make_polygon, PIXEL_SIZE_M
+    half_side_m = SCALES[scale]['raster_px'] * PIXEL_SIZE_M / 2
+    return {
+        name: make_polygon(fraction * half_side_m, vertices, seed=seed + i, size_px=SCALES[scale]['raster_px'])
+        for i, (name, (fraction, vertices)) in enumerate(POLYGONS.items())
+    }
+
+def _cases(scale, seed):
+    """
+    Casos del benchmark: {nombre: función sin argumentos}.
+    Las importaciones fallidas (dependencias opcionales) se reportan como error del caso.
+    """
+    polygons = _polygons(scale, seed)
+    cases = {}
+
+    def add(name, builder):
+        try:
+            cases[name] = builder()
+        except ImportError as e:
+            cases[name] = e
+
+    def raster_case(mode, polygon):
+        from src.analysis.extract_raster import extract_forest_info
+        return lambda: extract_forest_info(polygon, mode=mode)
+
+    def vector_case(format_type, polygon):
+        from src.analysis.extract_vector import _load_vector_data
+        # Sin la caché persistente: se mide la consulta, no la lectura de SQLite
+        load = inspect.unwrap(_load_vector_data)
+        return lambda: load(polygon, BENCH_LAYER, format_type, raise_errors=True)
+
+    def report_case(context):
+        from src.reports import generate_reports
+        def run():
+            with _offline_basemap(generate_reports):
+                return generate_reports.generate_docx_report(context)
+        return run
+
+    def prompt_case(context):
+        from src.chatbot.prompt_builder import build_system_prompt
+        return lambda: build_system_prompt(context)
+
+    for poly_name, polygon in polygons.items():
+        for mode in RASTER_MODES:
+            add(f"extract_forest_info[{mode}/{poly_name}]", lambda: raster_case(mode, polygon))
+        for format_type in VECTOR_FORMATS:
+            add(f"_load_vector_data[{format_type}/{poly_name}]", lambda: vector_case(format_type, polygon))
+
+    from src.synthetic_data import make_context
+    context = make_context(polygons['mediano'], seed=seed)
+    add("generate_docx_report", lambda: report_case(context))
+    add("build_system_prompt", lambda: prompt_case(context))
+    return cases
+
+# ===================== MEDICIÓN =====================
+def measure(name, func, repeat=5, min_sample_s=MIN_SAMPLE_S):
+    """
+    Mide una función: una llamada con traza (calentamiento y contadores) y luego
+    `repeat` muestras de `number` llamadas cada una.
+    Returns:
+        dict: {'mediana_s', 'min_s', 'max_s', 'primera_s', 'llamadas', 'contadores',
+            'avisos', 'rss_max_mb', 'error'} (tiempos por llamada).
+    """
+    from src.analysis import notify
+    from src.analysis.tracing import start_trace
+
+    result = {'error': None}
+    try:
+        with notify.capture() as avisos, start_trace(name) as traza:
+            start = time.perf_counter()
+            func()
+            first = time.perf_counter() - start
+        number = max(1, math.ceil(min_sample_s / first)) if first > 0 else 1000
+        with notify.capture():
+            samples = [total / number for total in timeit.Timer(func).repeat(repeat, number)]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+
+    trace = traza.to_dict()
+    result.update({
+        'mediana_s': statistics.median(samples),
+        'min_s': min(samples),
+        'max_s': max(samples),
+        'primera_s': first,
+        'llamadas': number * repeat,
+        'contadores': trace['counters'],
+        'avisos': [message for _, message in avisos],
+        'rss_max_mb': trace['rss_max_mb']
+    })
+    return result
+
+def environment():
+    """Datos de la máquina: una línea base solo es comparable en el mismo entorno."""
+    return {
+        'python': platform.python_version(),
+        'sistema': platform.platform(),
+        'maquina': platform.machine(),
+        'cpus': os.cpu_count()
+    }
+
+def run_suite(scale='small', seed=0, pattern=None, repeat=5, min_sample_s=MIN_SAMPLE_S, regenerate=False):
+    """
+    Corre los casos (los que contienen `pattern`, si se indica) sobre los fixtures de la escala.
+    Returns:
+        dict: {'escala', 'semilla', 'entorno', 'casos': {nombre: resultado de measure}}
+    """
+    fixture_dir = build_fixtures(scale, seed, force=regenerate)
+    results = {}
+    with use_fixtures(fixture_dir):
+        for name, func in _cases(scale, seed).items():
+            if pattern and pattern not in name:
+                continue
+            if isinstance(func, Exception):
+                results[name] = {'error': f"{type(func).__name__}: {func}"}
+            else:
+                results[name] = measure(name, func, repeat, min_sample_s)
+            status = results[name]['error'] or f"{results[name]['mediana_s'] * 1000:.2f} ms"
+            print(f"   {name}: {status}")
+    return {'escala': scale, 'semilla': seed, 'entorno': environment(), 'casos': results}
+
+# ===================== LÍNEA BASE =====================
+def baseline_path(scale, seed):
+    return BASELINE_DIR / f"{scale}-s{seed}.json"
+
+def load_baseline(scale, seed):
+    path = baseline_path(scale, seed)
+    return json.loads(path.read_text(encoding='utf-8')) if path.exists() else None
+
+def save_baseline(report):
+    """Guarda las medianas de los casos sin error (conserva los casos que no se corrieron)."""
+    path = baseline_path(report['escala'], report['semilla'])
+    baseline = load_baseline(report['escala'], report['semilla']) or {'casos': {}}
+    baseline['casos'].update({
+        name: {'mediana_s': res['mediana_s'], 'min_s': res['min_s']}
+        for name, res in report['casos'].items() if not res['error']
+    })
+    baseline.update({'actualizada': time.strftime('%Y-%m-%dT%H:%M:%S'), 'entorno': report['entorno']})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False), encoding='utf-8')
+    return path
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Agrega a cada caso 'base_s', 'cambio' (mediana / base - 1) y 'estado':
+    'ok', 'regresion', 'mejora', 'nuevo' (sin línea base) o 'error'.
+    Returns:
+        bool: True si no hay regresiones ni errores.
+    """
+    base_cases = (baseline or {}).get('casos', {})
+    ok = True
+    for name, res in report['casos'].items():
+        base = base_cases.get(name)
+        if res['error']:
+            res['estado'] = 'error'
+            ok = False
+            continue
+        if base is None:
+            res['estado'] = 'nuevo'
+            continue
+        res['base_s'] = base['mediana_s']
+        res['cambio'] = res['mediana_s'] / base['mediana_s'] - 1
+        if res['cambio'] > tolerance:
+            res['estado'] = 'regresion'
+            ok = False
+        elif res['cambio'] < -tolerance:
+            res['estado'] = 'mejora'
+        else:
+            res['estado'] = 'ok'
+    return ok
+
+STATUS_ICONS = {'ok': "✅", 'mejora': "🚀", 'nuevo': "🆕", 'regresion': "❌", 'error': "💥"}
+
+def print_report(report):
+    for name, res in report['casos'].items():
+        icon = STATUS_ICONS.get(res.get('estado'), "")
+        if res['error']:
+            print(f"{icon} {name:<42} {res['error']}")
+            continue
+        line = f"{icon} {name:<42} {res['mediana_s'] * 1000:10.2f} ms"
+        if 'base_s' in res:
+            line += f"  (base {res['base_s'] * 1000:.2f} ms, {res['cambio']:+.0%})"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de las funciones críticas con datos sintéticos.")
+    parser.add_argument("--scale", choices=list(SCALES), default='small', help="Tamaño de los fixtures")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los generadores")
+    parser.add_argument("-k", dest="pattern", default=None, help="Solo los casos cuyo nombre contiene este texto")
+    parser.add_argument("--repeat", type=int, default=5, help="Muestras por caso")
+    parser.add_argument("--min-sample", type=float, default=MIN_SAMPLE_S, help="Duración mínima de cada muestra (s)")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Aumento admitido (0.3 = 30 %%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda los resultados como línea base")
+    parser.add_argument("--regenerate", action="store_true", help="Regenera los fixtures")
+    parser.add_argument("--output", type=Path, default=None, help="Guarda el reporte completo en JSON")
+    args = parser.parse_args()
+
+    report = run_suite(args.scale, args.seed, args.pattern, args.repeat, args.min_sample, args.regenerate)
+    baseline = load_baseline(args.scale, args.seed)
+    if baseline and baseline.get('entorno') != report['entorno']:
+        print("⚠️ La línea base se midió en otro entorno; las comparaciones son orientativas.")
+    ok = compare(report, baseline, args.tolerance)
+    print_report(report)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False, default=str), encoding='utf-8')
+    if args.save_baseline:
+        print(f"💾 Línea base -> {save_baseline(report)}")
+    elif not ok:
+        print("❌ Hay regresiones o casos con error.")
+    sys.exit(0 if ok or args.save_baseline else 1)
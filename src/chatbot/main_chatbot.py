@@ -1,5 +1,5 @@
 import streamlit as st
-from src.chatbot.utils import get_groq_client
+from src.chatbot.utils import get_groq_api_key, get_groq_client
 from src.chatbot.prompt_builder import build_system_prompt
 
 def parse_groq_stream(stream):
@@ -17,11 +17,10 @@ def show_chatbot_interface():
     st.markdown("### 💬 Asistente Territorial IA")
     st.caption("Pregúntame sobre el análisis realizado: ¿Cuánto carbono captura? ¿Hay restricciones legales?")
 
-    # 1. Obtener Contexto y Cliente
+    # 1. Obtener Contexto (el cliente se crea con la primera pregunta)
     ctx = st.session_state.get('analysis_context', {})
-    client = get_groq_client()
 
-    if not client:
+    if not get_groq_api_key():
         return # Error ya mostrado en utils
 
     # 2. Inicializar Historial
@@ -43,6 +42,7 @@ def show_chatbot_interface():
         # 5. Generar Respuesta
         with st.chat_message("assistant"):
             try:
+                client = get_groq_client()
                 system_context = build_system_prompt(ctx)
                 
                 messages_payload = [
@@ -1,17 +1,27 @@
 import os
 import streamlit as st
-from groq import Groq
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
 load_dotenv(os.path.join("config", ".env"))
 
-def get_groq_client():
-    """Inicializa el cliente de Groq de forma segura."""
+def get_groq_api_key():
+    """API Key de Groq; muestra el error si no está configurada."""
     api_key = os.getenv("GROQ_API_KEY")
     
     if not api_key:
         st.error("⚠️ No se encontró la API Key de Groq en .env")
         return None
     
-    return Groq(api_key=api_key)
\ No newline at end of file
+    return api_key
+
+@st.cache_resource(show_spinner=False)
+def _groq_client(api_key):
+    """Cliente de Groq compartido por todas las sesiones del proceso (import diferido)."""
+    from groq import Groq
+    return Groq(api_key=api_key)
+
+def get_groq_client():
+    """Inicializa el cliente de Groq de forma segura."""
+    api_key = get_groq_api_key()
+    return _groq_client(api_key) if api_key else None
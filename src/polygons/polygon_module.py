@@ -5,9 +5,7 @@ import tempfile #directorios y archivos temporales que se borran despues de usad
 import zipfile #manejo de archivos zip
 
 #librerias instaladas
-import openpyxl #lectura y escritura de archivos de excel
 import pandas as pd #manipula datos en formato tabular
-import geopandas as gpd #manejo de datos geoespaciales
 import shapely.geometry #manipula geometrias espaciales
 import streamlit as st #crea interfaces web
 import folium #crea mapas interactivos
@@ -93,6 +91,7 @@ def show_polygon_section():
                 shp_files = [f for f in os.listdir(tmpdir) if f.endswith('.shp')]
                 #buscar archivos .shp en temporal
                 if shp_files:
+                    import geopandas as gpd #importación diferida: solo al cargar un shapefile
                     gdf = gpd.read_file(os.path.join(tmpdir, shp_files[0]))
                     if gdf.crs and gdf.crs.to_string() != "EPSG:4326":
                         gdf = gdf.to_crs(epsg=4326) # <--- Agrega esto
@@ -0,0 +1,95 @@
+"""
+Benchmark del arranque en frío de la app (primera pintada de main.py).
+
+Cada repetición corre main.py con el AppTest de Streamlit en un proceso nuevo
+(imports en frío), mide el tiempo hasta terminar la primera ejecución del script
+y revisa qué librerías pesadas quedaron importadas. Falla (código 1) si la
+mediana supera el presupuesto, si se cargó alguna librería pesada o si el
+script lanzó excepciones.
+
+Uso:
+    python -m src.startup_benchmark --runs 5 --budget 3.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MAIN_PATH = PROJECT_ROOT / "main.py"
+
+# Presupuesto de la primera pintada (segundos, incluye importar streamlit)
+STARTUP_BUDGET_S = float(os.getenv("STARTUP_BUDGET_S", "3.0"))
+
+# Librerías que solo deben cargarse cuando corre su pestaña o etapa
+HEAVY_MODULES = ('ee', 'rasterio', 'geopandas', 'pygbif', 'matplotlib', 'contextily', 'docx', 'groq')
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+at = AppTest.from_file({main!r}, default_timeout={timeout}).run()
+done = time.perf_counter()
+print(json.dumps({{
+    'total_s': done - start,
+    'streamlit_s': imported - start,
+    'script_s': done - imported,
+    'exceptions': [e.message for e in at.exception],
+    'heavy': sorted(m for m in {heavy!r} if m in sys.modules)
+}}))
+"""
+
+def measure_once(main_path=MAIN_PATH, timeout=60):
+    """Una ejecución en frío en un proceso nuevo."""
+    code = _CHILD.format(main=str(main_path), timeout=timeout, heavy=HEAVY_MODULES)
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=timeout + 30
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "sin salida")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def run_benchmark(runs=5, budget_s=STARTUP_BUDGET_S, main_path=MAIN_PATH):
+    """
+    Mide `runs` arranques en frío.
+    Returns:
+        dict: {'mediana_s', 'max_s', 'presupuesto_s', 'pesadas', 'excepciones', 'ok'}
+    """
+    results = [measure_once(main_path) for _ in range(runs)]
+    totals = [r['total_s'] for r in results]
+    heavy = sorted({m for r in results for m in r['heavy']})
+    exceptions = sorted({e for r in results for e in r['exceptions']})
+    median = statistics.median(totals)
+    return {
+        'mediana_s': round(median, 3),
+        'max_s': round(max(totals), 3),
+        'streamlit_s': round(statistics.median(r['streamlit_s'] for r in results), 3),
+        'script_s': round(statistics.median(r['script_s'] for r in results), 3),
+        'presupuesto_s': budget_s,
+        'pesadas': heavy,
+        'excepciones': exceptions,
+        'ok': median <= budget_s and not heavy and not exceptions
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío de main.py.")
+    parser.add_argument("--runs", type=int, default=5, help="Repeticiones (un proceso nuevo cada una)")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_S, help="Presupuesto de la mediana (s)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs, args.budget)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report['pesadas']:
+        print(f"❌ Librerías pesadas en el arranque: {', '.join(report['pesadas'])}")
+    if report['excepciones']:
+        print(f"❌ Excepciones en la primera ejecución: {report['excepciones']}")
+    if report['mediana_s'] > args.budget:
+        print(f"❌ Arranque {report['mediana_s']} s > presupuesto {args.budget} s")
+    if report['ok']:
+        print(f"✅ Arranque en {report['mediana_s']} s (presupuesto {args.budget} s)")
+    sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,204 @@
+"""
+Datos sintéticos reproducibles para benchmarks (sin depender de data/raw).
+
+Generadores deterministas por semilla, a la escala que se pida:
+  - un raster categórico como `superficie_bosques.img` (HFA, uint8, clases 1-5
+    de LEYENDAS en parches, nodata 0, MAGNA-SIRGAS Origen Nacional a 30 m);
+  - un GeoPackage con las capas de LAYER_CONFIG y su columna de atributos
+    (la Frontera Agrícola teselada con 'municipio'/'departamen'; las demás como
+    manchas dispersas);
+  - polígonos de consulta en estrella con tamaño y número de vértices dados;
+  - un contexto de análisis completo para el reporte y el prompt del chatbot.
+
+Todo cae sobre la misma zona (alrededor de -73°, 4°), así que los polígonos
+intersectan el raster y las capas.
+"""
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# MAGNA-SIRGAS 2018 / Origen Nacional (metros); su origen está en (-73°, 4°)
+SYNTHETIC_CRS = "EPSG:9377"
+ORIGIN_XY = (5_000_000.0, 2_000_000.0)
+PIXEL_SIZE_M = 30.0
+
+# Lado (en píxeles) de los parches de cobertura y fracción de píxeles sueltos
+PATCH_PX = 32
+SPECKLE_FRACTION = 0.05
+# Proporción de cada clase (1 Bosque estable ... 5 Sin información) y de nodata
+CLASS_WEIGHTS = {0: 0.02, 1: 0.45, 2: 0.08, 3: 0.05, 4: 0.35, 5: 0.05}
+
+FRONTERA_ELEMENTOS = [
+    "Frontera agrícola nacional", "Bosques naturales y áreas no agropecuarias", "Exclusiones legales"
+]
+
+def _extent(size_px):
+    """Bounds (minx, miny, maxx, maxy) en SYNTHETIC_CRS del raster de `size_px` píxeles de lado."""
+    half = size_px * PIXEL_SIZE_M / 2
+    x0, y0 = ORIGIN_XY
+    return x0 - half, y0 - half, x0 + half, y0 + half
+
+# ===================== RASTER =====================
+def make_forest_raster(path, size_px=4096, seed=0):
+    """
+    Escribe un raster categórico tipo IDEAM (HFA/.img, uint8, nodata 0).
+    Parches de PATCH_PX píxeles con SPECKLE_FRACTION de píxeles de otra clase,
+    para que los conteos no sean triviales.
+    """
+    import rasterio
+    from rasterio.transform import from_origin
+
+    rng = np.random.default_rng(seed)
+    classes = np.array(list(CLASS_WEIGHTS), dtype=np.uint8)
+    weights = np.array(list(CLASS_WEIGHTS.values()))
+    weights = weights / weights.sum()
+
+    n_patches = -(-size_px // PATCH_PX)
+    patches = rng.choice(classes, size=(n_patches, n_patches), p=weights)
+    data = np.repeat(np.repeat(patches, PATCH_PX, axis=0), PATCH_PX, axis=1)[:size_px, :size_px]
+    speckle = rng.random(data.shape) < SPECKLE_FRACTION
+    data[speckle] = rng.choice(classes[1:], size=int(speckle.sum()))
+
+    minx, _, _, maxy = _extent(size_px)
+    profile = {
+        'driver': 'HFA', 'width': size_px, 'height': size_px, 'count': 1, 'dtype': 'uint8',
+        'nodata': 0, 'crs': SYNTHETIC_CRS, 'transform': from_origin(minx, maxy, PIXEL_SIZE_M, PIXEL_SIZE_M)
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+    return path
+
+# ===================== CAPAS VECTORIALES =====================
+def _densify(geoms, vertices):
+    """Agrega vértices a los bordes hasta ~`vertices` por geometría (como las capas reales)."""
+    perimeter = np.median(shapely.length(geoms))
+    return shapely.segmentize(geoms, max(perimeter / vertices, 1.0))
+
+def _tessellation(rng, n, bounds, vertices):
+    """Voronoi de puntos aleatorios recortado al área: cubre todo sin huecos."""
+    minx, miny, maxx, maxy = bounds
+    points = shapely.multipoints(np.column_stack([rng.uniform(minx, maxx, n), rng.uniform(miny, maxy, n)]))
+    cells = shapely.get_parts(shapely.voronoi_polygons(points, extend_to=shapely.box(*bounds)))
+    cells = shapely.intersection(cells, shapely.box(*bounds))
+    return _densify(cells[shapely.area(cells) > 0], vertices)
+
+def _blobs(rng, n, bounds, vertices, max_radius_m):
+    """Manchas circulares dispersas (áreas protegidas, resguardos, centros poblados)."""
+    minx, miny, maxx, maxy = bounds
+    centers = shapely.points(rng.uniform(minx, maxx, n), rng.uniform(miny, maxy, n))
+    radii = rng.uniform(0.1, 1.0, n) * max_radius_m
+    return shapely.buffer(centers, radii, quad_segs=max(1, vertices // 4))
+
+def make_vector_layers(path, size_px=4096, n_features=10000, vertices=64, seed=0):
+    """
+    Escribe un GPKG con una capa por cada entrada de LAYER_CONFIG (en EPSG:4326).
+    'frontera_agricola_jun2025' tiene `n_features` celdas con 'elemento',
+    'municipio' y 'departamen'; las demás, n_features/10 manchas con su columna
+    de LAYER_CONFIG.
+    """
+    from src.analysis.extract_vector import LAYER_CONFIG
+
+    rng = np.random.default_rng(seed)
+    bounds = _extent(size_px)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    for layer_name, column in LAYER_CONFIG.items():
+        if layer_name == 'frontera_agricola_jun2025':
+            geoms = _tessellation(rng, n_features, bounds, vertices)
+            # Municipios en una rejilla de 4x4 sobre el área; departamentos de 2x2
+            centroids = shapely.centroid(geoms)
+            gx = np.clip(((shapely.get_x(centroids) - bounds[0]) / (bounds[2] - bounds[0]) * 4).astype(int), 0, 3)
+            gy = np.clip(((shapely.get_y(centroids) - bounds[1]) / (bounds[3] - bounds[1]) * 4).astype(int), 0, 3)
+            attrs = {
+                column: rng.choice(FRONTERA_ELEMENTOS, len(geoms)),
+                'municipio': [f"Municipio {y * 4 + x + 1:02d}" for x, y in zip(gx, gy)],
+                'departamen': [f"Departamento {(y // 2) * 2 + x // 2 + 1}" for x, y in zip(gx, gy)]
+            }
+        else:
+            n = max(1, n_features // 10)
+            geoms = _blobs(rng, n, bounds, vertices, max_radius_m=(bounds[2] - bounds[0]) / 20)
+            attrs = {column: [f"{layer_name} {i % 25 + 1:02d}" for i in range(n)]}
+
+        gdf = gpd.GeoDataFrame(attrs, geometry=geoms, crs=SYNTHETIC_CRS).to_crs("EPSG:4326")
+        gdf.to_file(path, layer=layer_name, driver="GPKG")
+    return path
+
+# ===================== POLÍGONOS DE CONSULTA =====================
+def make_polygon(radius_m, vertices, seed=0, size_px=4096):
+    """
+    Polígono en estrella (siempre simple) en EPSG:4326 con `vertices` vértices y
+    radio medio `radius_m`, con centro aleatorio dentro del área sintética.
+    """
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = _extent(size_px)
+    margin = min(radius_m * 1.5, (maxx - minx) / 2)
+    cx = rng.uniform(minx + margin, maxx - margin) if maxx - minx > 2 * margin else (minx + maxx) / 2
+    cy = rng.uniform(miny + margin, maxy - margin) if maxy - miny > 2 * margin else (miny + maxy) / 2
+
+    angles = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    # Radio suavizado para que el borde se parezca a un predio y no a ruido
+    noise = np.convolve(rng.normal(0, 0.25, vertices), np.ones(5) / 5, mode='same')
+    radii = radius_m * np.clip(1 + noise, 0.4, 1.5)
+    ring = np.column_stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)])
+    return gpd.GeoSeries([shapely.Polygon(ring)], crs=SYNTHETIC_CRS).to_crs("EPSG:4326").iloc[0]
+
+def polygon_area_ha(polygon):
+    """Área (ha) de un polígono WGS84 medida en SYNTHETIC_CRS."""
+    return float(gpd.GeoSeries([polygon], crs="EPSG:4326").to_crs(SYNTHETIC_CRS).area.iloc[0] / 10000)
+
+# ===================== CONTEXTO DE ANÁLISIS =====================
+def make_context(polygon, n_layers=6, n_groups=8, seed=0):
+    """Contexto de análisis procesado (como el del diagnóstico) con tablas sintéticas."""
+    from src.analysis.diagnostic import new_context
+    from src.analysis.extract_raster import LEYENDAS
+    from src.analysis.biomass_co2 import biomass_stats, canopy_stats, STATS_PERCENTILES
+
+    rng = np.random.default_rng(seed)
+    area_ha = polygon_area_ha(polygon)
+
+    shares = rng.dirichlet(np.ones(len(LEYENDAS)))
+    raster = pd.DataFrame({
+        'Código': list(LEYENDAS),
+        'Leyenda': list(LEYENDAS.values()),
+        'Conteo Píxeles': np.round(shares * area_ha * 10000 / PIXEL_SIZE_M ** 2).astype(int),
+        'Área (ha)': np.round(shares * area_ha, 2),
+        'Porcentaje (%)': np.round(shares * 100, 2)
+    }).sort_values('Área (ha)', ascending=False).reset_index(drop=True)
+
+    vectors = {
+        f"Capa {i + 1}": pd.DataFrame({
+            'Categoría': [f"Categoría {j + 1}" for j in range(3)],
+            'area_total_ha': np.round(rng.uniform(0, area_ha / 3, 3), 2),
+            'count_features': rng.integers(1, 50, 3)
+        })
+        for i in range(n_layers)
+    }
+    bio = pd.DataFrame({
+        'Grupo': [f"Grupo {i + 1}" for i in range(n_groups)],
+        'Especies (GBIF)': rng.integers(0, 400, n_groups)
+    })
+    # Píxeles de biomasa (Mg/ha) y altura (m) resumidos con las funciones de la app
+    agbd = rng.gamma(4.0, rng.uniform(10, 60), 1000)
+    height = rng.gamma(6.0, rng.uniform(1, 5), 1000)
+    context = new_context(polygon)
+    context.update({
+        'raster_data': raster,
+        'vector_data': vectors,
+        'location_info': {'municipio': "Municipio 01", 'departamento': "Departamento 1"},
+        'biodiversity_data': bio,
+        'satellite_data': {
+            'biomass': {'tile': None, 'stats': biomass_stats(
+                float(agbd.mean()), area_ha, float(agbd.std()),
+                {p: float(np.percentile(agbd, p)) for p in STATS_PERCENTILES}
+            )},
+            'canopy': {'tile': None, 'stats': canopy_stats(
+                float(height.mean()), float(height.std()),
+                {p: float(np.percentile(height, p)) for p in STATS_PERCENTILES}
+            )}
+        },
+        'processed': True
+    })
+    return context
@@ -0,0 +1,338 @@
+"""
+Paridad de las rutas de extracción sobre datos sintéticos (src/synthetic_data.py)
+y semántica del pipeline de etapas.
+"""
+import contextlib
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from src import synthetic_data
+from src.benchmark_suite import use_fixtures
+from src.analysis.pipeline import Stage, run_pipeline, DONE, FAILED, TIMEOUT, CANCELLED, SKIPPED
+
+RASTER_PX = 1024
+N_FEATURES = 600
+
+# (radio en m, vértices, semilla): desde un predio hasta casi todo el raster
+POLYGONS = [(500, 16, 1), (3000, 128, 2), (12000, 1024, 3), (15000, 64, 4)]
+
+@pytest.fixture(scope="module")
+def fixtures(tmp_path_factory):
+    from src.analysis.prepare_vectors import export_layer_geoparquet
+    from src.analysis.forest_pyramid import build_forest_pyramid
+
+    root = tmp_path_factory.mktemp("sinteticos")
+    with use_fixtures(root) as paths:
+        synthetic_data.make_forest_raster(paths['raster'], RASTER_PX, seed=0)
+        synthetic_data.make_vector_layers(paths['gpkg'], RASTER_PX, N_FEATURES, vertices=32, seed=0)
+        export_layer_geoparquet('frontera_agricola_jun2025', output_dir=paths['parquet'])
+        paths['pyramid'] = build_forest_pyramid(paths['raster'], root / "piramide.npz", tile_size=64)
+        yield paths
+
+@pytest.fixture(params=POLYGONS, ids=lambda p: f"r{p[0]}m-{p[1]}v")
+def polygon(request):
+    radius_m, vertices, seed = request.param
+    return synthetic_data.make_polygon(radius_m, vertices, seed=seed, size_px=RASTER_PX)
+
+# ===================== RASTER =====================
+def test_raster_modes_give_identical_tables(fixtures, polygon):
+    from src.analysis.extract_raster import (
+        _polygon_to_raster_crs, _zonal_counts, _masked_counts, _counts_to_table
+    )
+    from src.analysis.forest_pyramid import load_forest_pyramid, query_forest_pyramid
+
+    pyramid = load_forest_pyramid(fixtures['raster'], fixtures['pyramid'])
+    assert pyramid is not None
+    with rasterio.open(fixtures['raster']) as src:
+        geom = _polygon_to_raster_crs(polygon, src)
+        tables = {
+            'stream': _counts_to_table(*_zonal_counts(src, geom), src),
+            'mask': _counts_to_table(*_masked_counts(src, geom), src),
+            'pyramid': _counts_to_table(*query_forest_pyramid(pyramid, src, geom), src)
+        }
+    assert not tables['stream'].empty
+    pd.testing.assert_frame_equal(tables['stream'], tables['mask'], check_dtype=False)
+    pd.testing.assert_frame_equal(tables['stream'], tables['pyramid'], check_dtype=False)
+
+def test_extract_forest_info_stream_matches_mask(fixtures, polygon):
+    from src.analysis.extract_raster import extract_forest_info
+    stream = extract_forest_info(polygon, mode='stream')
+    mask = extract_forest_info(polygon, mode='mask')
+    assert not stream.empty
+    pd.testing.assert_frame_equal(stream, mask, check_dtype=False)
+
+def test_stale_pyramid_warns_once(fixtures):
+    import os
+    from src.analysis import notify
+    from src.analysis.forest_pyramid import load_forest_pyramid
+
+    stat = fixtures['raster'].stat()
+    os.utime(fixtures['raster'], (stat.st_atime, stat.st_mtime + 60))
+    try:
+        with notify.capture() as messages:
+            assert load_forest_pyramid(fixtures['raster'], fixtures['pyramid']) is None
+            assert load_forest_pyramid(fixtures['raster'], fixtures['pyramid']) is None
+    finally:
+        os.utime(fixtures['raster'], (stat.st_atime, stat.st_mtime))
+    assert [level for level, _ in messages] == ['warning']
+    assert load_forest_pyramid(fixtures['raster'], fixtures['pyramid']) is not None
+
+# ===================== VECTORES =====================
+def _area_by_category(summary):
+    return summary.set_index('Categoría')['area_total_ha'].sort_index()
+
+def test_vector_formats_agree_within_lod_tolerance(fixtures, polygon):
+    import inspect
+    from src.analysis.extract_vector import _load_vector_data, LOD_MAX_ERROR_FRACTION
+    load = inspect.unwrap(_load_vector_data)   # sin la caché persistente
+
+    results = {
+        fmt: load(polygon, 'frontera_agricola_jun2025', fmt, raise_errors=True)
+        for fmt in ('gpkg', 'parquet', 'store')
+    }
+    polygon_ha = synthetic_data.polygon_area_ha(polygon)
+    # LOD: error total acotado por LOD_MAX_ERROR_FRACTION del área del polígono. Los
+    # formatos recortan en CRS distintos (GPKG en EPSG:4326, el resto en áreas iguales):
+    # se admite además 0.05 % por la curvatura de los bordes y el redondeo a 0.01 ha.
+    tolerance_ha = (LOD_MAX_ERROR_FRACTION + 0.0005) * polygon_ha + 0.01 * len(synthetic_data.FRONTERA_ELEMENTOS)
+
+    reference = _area_by_category(results['gpkg'][0])
+    # El polígono más grande se sale del área sintética: solo se acota por arriba
+    assert 0 < reference.sum() <= polygon_ha * 1.01
+    for fmt in ('parquet', 'store'):
+        areas = _area_by_category(results[fmt][0])
+        assert list(areas.index) == list(reference.index)
+        assert np.abs(areas - reference).sum() <= tolerance_ha, fmt
+        # Municipio con mayor área (metadata de la Frontera Agrícola)
+        assert results[fmt][1].get('municipio') == results['gpkg'][1].get('municipio')
+
+# ===================== TESELAS GBIF =====================
+def test_gbif_tiles_respect_limits_and_cover_polygon(polygon):
+    import shapely
+    from src.analysis.biodiversity import (
+        _simplify_for_gbif, _split_for_gbif, _coverage_loss, MAX_TILE_VERTICES, MAX_TILE_AREA_DEG2
+    )
+    simple = _simplify_for_gbif(polygon)
+    if shapely.get_num_coordinates(polygon) <= MAX_TILE_VERTICES:
+        # Bajo el límite no se simplifica: conteo exacto
+        assert simple is polygon and _coverage_loss(polygon, simple) == 0.0
+    assert _coverage_loss(polygon, simple) < 0.01
+
+    tiles = _split_for_gbif(simple, max_area=MAX_TILE_AREA_DEG2)
+    assert all(shapely.get_num_coordinates(t) <= MAX_TILE_VERTICES for t in tiles)
+    assert shapely.union_all(tiles).symmetric_difference(simple).area < 1e-12
+
+def test_stale_vector_cube_is_read_once(fixtures, tmp_path, monkeypatch):
+    import os
+    from src.analysis import vector_cube
+
+    monkeypatch.setattr(vector_cube, 'CUBE_DIR', tmp_path)
+    monkeypatch.setattr(vector_cube, '_CUBES', {})
+    layer = 'frontera_agricola_jun2025'
+    vector_cube.build_vector_cube(layer, tmp_path)
+    assert vector_cube._load_cube(layer) is not None
+
+    # La capa cambia después del cubo: queda desactualizado
+    source = vector_cube.get_layer(layer).source
+    stat = source.stat()
+    os.utime(source, (stat.st_atime, stat.st_mtime + 60))
+    reads = []
+    read_table = vector_cube.pq.read_table
+    monkeypatch.setattr(vector_cube.pq, 'read_table', lambda *a, **k: reads.append(a) or read_table(*a, **k))
+    try:
+        assert vector_cube._load_cube(layer) is None
+        assert vector_cube._load_cube(layer) is None
+        assert len(reads) == 1
+    finally:
+        os.utime(source, (stat.st_atime, stat.st_mtime))
+
+# ===================== PIPELINE =====================
+def _stage(name, func, inputs=('geometry',), outputs=None, **kwargs):
+    return Stage(name, func, inputs=inputs, outputs=outputs or (name,), **kwargs)
+
+def _statuses(events):
+    return {event['stage']: event['status'] for event in events}
+
+def test_pipeline_runs_independent_stages_in_parallel():
+    def slow(name):
+        def run(geometry):
+            time.sleep(0.3)
+            return {name: geometry}
+        return run
+
+    context = {'geometry': 1}
+    start = time.perf_counter()
+    events = list(run_pipeline([_stage(n, slow(n)) for n in ('a', 'b', 'c')], context))
+    assert time.perf_counter() - start < 0.8
+    assert set(_statuses(events).values()) == {DONE}
+    assert context['a'] == context['b'] == context['c'] == 1
+
+def test_pipeline_timeout_skips_dependents():
+    release = threading.Event()
+
+    def hang(geometry):
+        release.wait(5)
+        return {'lenta': 1}
+
+    stages = [
+        _stage('lenta', hang, timeout=0.2),
+        _stage('dependiente', lambda lenta: {'dependiente': lenta}, inputs=('lenta',)),
+        _stage('rapida', lambda geometry: {'rapida': 2})
+    ]
+    context = {'geometry': 1}
+    start = time.perf_counter()
+    statuses = _statuses(run_pipeline(stages, context))
+    release.set()
+
+    assert time.perf_counter() - start < 2
+    assert statuses == {'lenta': TIMEOUT, 'dependiente': SKIPPED, 'rapida': DONE}
+    assert 'lenta' not in context and context['rapida'] == 2
+
+def test_pipeline_failure_skips_dependents():
+    def fail(geometry):
+        raise RuntimeError("sin datos")
+
+    stages = [
+        _stage('falla', fail),
+        _stage('dependiente', lambda falla: {'dependiente': 1}, inputs=('falla',)),
+    ]
+    events = list(run_pipeline(stages, {'geometry': 1}))
+    assert _statuses(events) == {'falla': FAILED, 'dependiente': SKIPPED}
+    assert events[0]['error'] == "sin datos"
+
+def test_pipeline_cancel_marks_running_and_pending():
+    cancel = threading.Event()
+    release = threading.Event()
+
+    def hang(geometry):
+        release.wait(5)
+        return {'lenta': 1}
+
+    stages = [
+        _stage('rapida', lambda geometry: {'rapida': 1}),
+        _stage('lenta', hang),
+        _stage('dependiente', lambda lenta: {'dependiente': 1}, inputs=('lenta',))
+    ]
+    statuses = {}
+    for event in run_pipeline(stages, {'geometry': 1}, cancel_event=cancel):
+        statuses[event['stage']] = event['status']
+        if event['stage'] == 'rapida':
+            cancel.set()
+    release.set()
+    assert statuses == {'rapida': DONE, 'lenta': CANCELLED, 'dependiente': CANCELLED}
+
+def test_pipeline_rejects_circular_dependencies():
+    stages = [
+        _stage('a', lambda b: {'a': 1}, inputs=('b',)),
+        _stage('b', lambda a: {'b': 1}, inputs=('a',))
+    ]
+    with pytest.raises(ValueError, match="circulares"):
+        list(run_pipeline(stages, {}))
+
+def test_pipeline_close_does_not_wait_for_running_stages():
+    release = threading.Event()
+
+    def hang(geometry):
+        release.wait(5)
+        return {'lenta': 1}
+
+    stages = [_stage('rapida', lambda geometry: {'rapida': 1}), _stage('lenta', hang)]
+    start = time.perf_counter()
+    with contextlib.closing(run_pipeline(stages, {'geometry': 1})) as events:
+        assert next(events)['stage'] == 'rapida'
+    release.set()
+    assert time.perf_counter() - start < 1
+
+def test_reset_stage_outputs_clears_previous_results():
+    from src.analysis.diagnostic import diagnostic_stages, new_context, reset_stage_outputs
+    context = {**new_context("nuevo"), 'raster_data': "anterior", 'satellite_data': {'biomass': 1}, 'processed': True}
+    reset_stage_outputs(context, diagnostic_stages())
+    assert context == {**new_context("nuevo"), 'processed': True}
+
+# ===================== LOTES =====================
+def test_forest_batch_errors_survive_parquet(fixtures, tmp_path):
+    import geopandas as gpd
+    import shapely
+    from src.analysis.forest_batch import extract_forest_info_batch, NO_PIXELS, INVALID_GEOMETRY
+
+    parcels = gpd.GeoDataFrame({'codigo': [1, 2, 3]}, geometry=[
+        synthetic_data.make_polygon(500, 16, seed=1, size_px=RASTER_PX),
+        shapely.box(-60.0, 0.0, -59.9, 0.1),   # fuera del raster
+        None
+    ], crs="EPSG:4326")
+    result = extract_forest_info_batch(parcels, 'codigo', max_workers=1, raster_path=fixtures['raster'])
+
+    assert set(result['codigo']) == {1}
+    assert result.attrs['errores'] == {'2': NO_PIXELS, '3': INVALID_GEOMETRY}
+    result.to_parquet(tmp_path / "coberturas.parquet", index=False)
+    assert pd.read_parquet(tmp_path / "coberturas.parquet").attrs['errores'] == result.attrs['errores']
+
+def test_satellite_batch_errors_survive_parquet(monkeypatch, tmp_path):
+    pytest.importorskip("ee")
+    import geopandas as gpd
+    from src.analysis import satellite_batch
+    from src.analysis.forest_batch import INVALID_GEOMETRY
+
+    def reduce(chunk):
+        # El primer predio falla en GEE; los demás devuelven propiedades
+        return ({pid: {} for pid, _ in chunk if pid != 0}, {pid: "boom" for pid, _ in chunk if pid == 0})
+
+    monkeypatch.setattr(satellite_batch, 'ensure_gee', lambda: True)
+    monkeypatch.setattr(satellite_batch, '_reduce_with_split', reduce)
+    monkeypatch.setattr(satellite_batch, '_stats_row', lambda props: {'Área (ha)': 1.0})
+    polygons = [synthetic_data.make_polygon(500, 16, seed=s) for s in (1, 2)]
+    parcels = gpd.GeoDataFrame({'codigo': [10, 20, 30]}, geometry=polygons + [None], crs="EPSG:4326")
+
+    result = satellite_batch.analyze_satellite_batch(parcels, 'codigo', max_workers=1)
+
+    assert len(result) == 1
+    failed = {10, 20} - set(result['codigo'])
+    assert result.attrs['errores'] == {str(failed.pop()): "boom", '30': INVALID_GEOMETRY}
+    result.to_parquet(tmp_path / "biomasa.parquet", index=False)
+    assert pd.read_parquet(tmp_path / "biomasa.parquet").attrs['errores'] == result.attrs['errores']
+
+# ===================== ÍNDICE GBIF =====================
+def _write_gbif_cell(store_dir, species):
+    from src.analysis.gbif_store import _cell_path, STORE_COLUMNS, LON_COL, LAT_COL
+    n = len(species)
+    df = pd.DataFrame({
+        'taxonKey': species, 'speciesKey': species,
+        LON_COL: np.linspace(-73.9, -73.1, n), LAT_COL: np.linspace(4.1, 4.9, n), 'grupoKey': [212] * n
+    })[STORE_COLUMNS]
+    store_dir.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(_cell_path(store_dir, -74, 4), index=False)
+
+def test_species_index_reloads_after_rebuild(tmp_path):
+    import shapely
+    from src.analysis.gbif_store import build_species_index, _load_species_index, _counts_from_pairs, _species_pairs_indexed
+
+    store, index_dir = tmp_path / "gbif", tmp_path / "gbif" / "indice"
+    area = shapely.box(-74, 4, -73, 5)
+    _write_gbif_cell(store, [1, 2, 3])
+    build_species_index(store, index_dir)
+    before = _load_species_index(index_dir)
+    assert _counts_from_pairs(_species_pairs_indexed(area, before), {'Aves': 212}) == {'Aves': 3}
+
+    _write_gbif_cell(store, [1, 2, 3, 4, 5])
+    build_species_index(store, index_dir)
+    after = _load_species_index(index_dir)
+    assert after is not before
+    assert _counts_from_pairs(_species_pairs_indexed(area, after), {'Aves': 212}) == {'Aves': 5}
+    # Los arreglos ya abiertos siguen siendo legibles (se reemplazó el directorio, no los archivos)
+    assert _counts_from_pairs(_species_pairs_indexed(area, before), {'Aves': 212}) == {'Aves': 3}
+    assert not list(tmp_path.glob("gbif/indice.*"))
+
+def test_diagnostic_batch_records_row_errors(monkeypatch):
+    import json
+    import shapely
+    from src.analysis import diagnostic_batch
+
+    # Tabla de coberturas sin 'Leyenda': context_to_row falla en el worker
+    monkeypatch.setattr(diagnostic_batch, 'run_diagnostic', lambda geom: {'raster_data': pd.DataFrame({'x': [1]})})
+    rows = diagnostic_batch._process_chunk([('a', shapely.to_wkb(shapely.box(0, 0, 1, 1)))])
+
+    assert len(rows) == 1 and rows[0]['id'] == 'a'
+    assert 'fila' in json.loads(rows[0]['errores'])
@@ -0,0 +1,195 @@
+"""
+Cliente GBIF contra un servidor HTTP local con respuestas fijas (sin red).
+
+El servidor simula /occurrence/search con facetas de speciesKey: cada taxón
+tiene `n_species` especies repartidas en páginas de FACET_PAGE_SIZE.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pytest
+from src.apis import gbif_client
+from src.apis.gbif_client import GBIFClient, fetch_species_by_group, run_sync, FACET_PAGE_SIZE
+
+WKT = "POLYGON ((-75.7 4.8, -75.6 4.8, -75.6 4.9, -75.7 4.9, -75.7 4.8))"
+
+class GBIFStub(BaseHTTPRequestHandler):
+    """Respuestas según `self.server.state` (ver la fixture gbif_server)."""
+
+    def do_GET(self):
+        state = self.server.state
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        with state['lock']:
+            state['requests'].append(params)
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            n_request = len(state['requests'])
+        try:
+            time.sleep(state['delay_s'])
+            status, headers = state['respond'](n_request, params)
+            if status != 200:
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                return
+            offset, limit = int(params['facetOffset']), int(params['facetLimit'])
+            taxon = int(params['taxonKey'])
+            keys = range(taxon * 100_000 + offset, taxon * 100_000 + min(offset + limit, state['n_species']))
+            body = json.dumps({'count': 0, 'results': [], 'facets': [
+                {'field': 'SPECIES_KEY', 'counts': [{'name': str(k), 'count': 1} for k in keys]}
+            ]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with state['lock']:
+                state['in_flight'] -= 1
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def gbif_server(monkeypatch):
+    # Backoff corto: las pruebas no deben esperar segundos por cada reintento
+    monkeypatch.setattr(gbif_client, 'BACKOFF_BASE_S', 0.01)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GBIFStub)
+    server.daemon_threads = True
+    server.state = {
+        'lock': threading.Lock(),
+        'requests': [],
+        'in_flight': 0,
+        'max_in_flight': 0,
+        'delay_s': 0.0,
+        'n_species': 10,
+        'respond': lambda n, params: (200, {})
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", server.state
+    server.shutdown()
+    server.server_close()
+
+async def _species_keys(base_url, taxon_key=1, **kwargs):
+    async with GBIFClient(base_url=base_url, rate=1000, **kwargs) as client:
+        return await client.species_keys(taxon_key, WKT)
+
+def test_facet_offset_paging(gbif_server):
+    base_url, state = gbif_server
+    state['n_species'] = 2 * FACET_PAGE_SIZE + 500
+
+    result = run_sync(_species_keys(base_url))
+
+    assert result['completo'] and result['error'] is None
+    assert len(result['especies']) == 2 * FACET_PAGE_SIZE + 500
+    assert [int(r['facetOffset']) for r in state['requests']] == [0, FACET_PAGE_SIZE, 2 * FACET_PAGE_SIZE]
+
+def test_exact_page_size_requests_one_more_page(gbif_server):
+    base_url, state = gbif_server
+    state['n_species'] = FACET_PAGE_SIZE
+
+    result = run_sync(_species_keys(base_url))
+
+    assert result['completo'] and len(result['especies']) == FACET_PAGE_SIZE
+    assert len(state['requests']) == 2
+
+def test_429_waits_retry_after(gbif_server):
+    base_url, state = gbif_server
+    state['respond'] = lambda n, params: (429, {'Retry-After': '1'}) if n == 1 else (200, {})
+
+    start = time.monotonic()
+    result = run_sync(_species_keys(base_url))
+    elapsed = time.monotonic() - start
+
+    assert result['completo'] and len(result['especies']) == 10
+    assert len(state['requests']) == 2
+    # Con Retry-After se espera lo que pide el servidor, no el backoff exponencial
+    assert elapsed >= 1.0
+
+def test_non_retryable_status_fails_without_retries(gbif_server):
+    base_url, state = gbif_server
+    state['respond'] = lambda n, params: (400, {})
+
+    result = run_sync(_species_keys(base_url))
+
+    assert not result['completo'] and "HTTP 400" in result['error']
+    assert len(state['requests']) == 1
+
+def test_partial_result_when_a_page_fails(gbif_server):
+    base_url, state = gbif_server
+    state['n_species'] = 3 * FACET_PAGE_SIZE
+    # La segunda página responde 503 siempre
+    state['respond'] = lambda n, params: (503, {}) if params['facetOffset'] == str(FACET_PAGE_SIZE) else (200, {})
+
+    result = run_sync(_species_keys(base_url, max_retries=2))
+
+    assert not result['completo']
+    assert "HTTP 503 tras 3 intentos" in result['error']
+    # Se conservan las especies de la primera página
+    assert len(result['especies']) == FACET_PAGE_SIZE
+    assert [r['facetOffset'] for r in state['requests']] == ['0'] + [str(FACET_PAGE_SIZE)] * 3
+
+def test_partial_tiles_are_merged(gbif_server):
+    base_url, state = gbif_server
+    other = WKT.replace("-75.7", "-75.8")
+    state['respond'] = lambda n, params: (500, {}) if params['geometry'] == other else (200, {})
+
+    result = fetch_species_by_group({'Aves': 212}, [WKT, other], base_url=base_url, rate=1000, max_retries=0)
+
+    assert not result['Aves']['completo']
+    assert result['Aves']['error'].startswith("1/2 teselas con error")
+    assert len(result['Aves']['especies']) == 10
+
+def test_concurrency_limit(gbif_server):
+    base_url, state = gbif_server
+    state['delay_s'] = 0.1
+    groups = {f"grupo {i}": i for i in range(12)}
+
+    result = fetch_species_by_group(groups, WKT, base_url=base_url, rate=1000, max_concurrency=3)
+
+    assert all(r['completo'] for r in result.values())
+    assert len(state['requests']) == 12
+    assert 1 < state['max_in_flight'] <= 3
+
+@pytest.fixture
+def shared(gbif_server, monkeypatch):
+    """Cliente del proceso apuntando al servidor local; se cierra al terminar."""
+    base_url, state = gbif_server
+    monkeypatch.setattr(gbif_client, 'GBIF_API_URL', base_url)
+    monkeypatch.setattr(gbif_client, '_SHARED', {'rate': 1000})
+    yield state
+    if 'client' in gbif_client._SHARED:
+        client, loop = gbif_client._SHARED['client'], gbif_client._SHARED['loop']
+        gbif_client.asyncio.run_coroutine_threadsafe(client.__aexit__(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+def test_shared_client_is_one_per_process(shared):
+    groups = {f"grupo {i}": i for i in range(4)}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda _: fetch_species_by_group(groups, WKT), range(3)))
+
+    assert all(r['completo'] for result in results for r in result.values())
+    client, _ = gbif_client.shared_client()
+    assert client.requests == len(shared['requests']) == 12
+
+def test_shared_rate_limit_spans_callers(shared):
+    # 20 solicitudes/s para todo el proceso: 36 consultas desde 3 hilos tardan >= (36 - 20) / 20 s
+    gbif_client._SHARED['rate'] = 20
+    groups = {f"grupo {i}": i for i in range(12)}
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(lambda _: fetch_species_by_group(groups, WKT), range(3)))
+
+    assert time.monotonic() - start >= 0.75
+
+def test_process_share_divides_rate(shared):
+    client, loop = gbif_client.shared_client()
+    gbif_client.set_process_share(4)
+    gbif_client.asyncio.run_coroutine_threadsafe(gbif_client.asyncio.sleep(0), loop).result()
+    assert client._bucket.rate == gbif_client.REQUESTS_PER_SECOND / 4